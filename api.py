@@ -1,8 +1,21 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+import time
+import json
+import asyncio
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 import uvicorn
-from search_products import search_products  # importa sua função já pronta
-from typing import List, Optional, Dict, Any
+from search_products import BATCH_MAX_K, BATCH_MAX_QUERIES, query_embedder, search_products_batch
+from search_products_async import search_products_async, close_async_pool, async_pool_stats
+from search_stream import STREAM_MAX_DEPTH, search_stream
+from db_pool import pool_stats
+from embedding_cache import query_embedding_cache
+from vector_index import vector_index
+from response_cache import search_response_cache
+from catalog import catalog_watcher
+from code_index import code_index
+import metrics
+from typing import List, Literal, Optional, Dict, Any
 import os
 import requests
 from dotenv import load_dotenv
@@ -21,14 +34,108 @@ app = FastAPI()
 _ENV_PATH = Path(__file__).parent / ".env"
 load_dotenv(dotenv_path=_ENV_PATH, override=False)
 
+@app.middleware("http")
+async def _timing_middleware(request: Request, call_next):
+    """Mede a requisição e devolve as etapas medidas no header Server-Timing."""
+    timings = metrics.begin_request()
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    total = time.perf_counter() - t0
+    route = request.scope.get("route")
+    metrics.HTTP_SECONDS.observe(getattr(route, "path", "unmatched"), total)
+    response.headers["Server-Timing"] = metrics.server_timing_header([*timings, ("total", total)])
+    return response
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Métricas no formato de exposição do Prometheus (por worker)."""
+    # pool síncrono só se já existir: o scrape não abre conexões (no caminho async ele fica sem uso)
+    pool = pool_stats()
+    extra = metrics.gauge_lines("search_pool_connections", "Conexões do pool síncrono",
+                                {k: v for k, v in pool.items()
+                                 if k in ("size", "idle", "in_use", "waits", "timeouts")},
+                                label="state") if pool["started"] else []
+    extra += metrics.gauge_lines("embedding_cache_events", "Cache de embeddings de consulta",
+                                 query_embedding_cache.stats(), label="event")
+    extra += metrics.gauge_lines("response_cache_events", "Cache de respostas de /search",
+                                 search_response_cache.stats(), label="event")
+    return PlainTextResponse(metrics.render(extra), media_type="text/plain; version=0.0.4")
+
+FusionName = Literal["maxnorm", "rrf", "zscore"]  # fusion.FUSION_STRATEGIES
+
 class Query(BaseModel):
     query: str
+    fusion: Optional[FusionName] = None  # padrão: SEARCH_FUSION
 
 @app.post("/search")
-def search(q: Query):
-    result = search_products(q.query, k=8)
+async def search(q: Query):
+    # async de ponta a ponta: não ocupa thread do threadpool enquanto espera OpenAI/Postgres
+    # respostas repetidas saem do cache até a próxima ingestão (versão do catálogo)
+    key = search_response_cache.make_key(q.query, catalog_watcher.current(), k=8, fusion=q.fusion)
+    result = await search_response_cache.get_or_compute(
+        key, lambda: search_products_async(q.query, k=8, fusion=q.fusion))
     return result
 
+# nova versão do catálogo: descarta respostas antigas de uma vez
+catalog_watcher.on_change(lambda old, new: search_response_cache.clear())
+
+@app.on_event("startup")
+async def _preload():
+    # versão do catálogo, SKU/EAN e snapshot vetorial em memória antes da primeira requisição
+    # (não bloqueia o event loop)
+    await asyncio.to_thread(catalog_watcher.start)
+    await asyncio.to_thread(code_index.ensure_loaded)
+    await asyncio.to_thread(vector_index.start)
+
+@app.on_event("shutdown")
+async def _close_pools():
+    await close_async_pool()
+
+class BatchQuery(BaseModel):
+    queries: List[str] = Field(..., max_length=BATCH_MAX_QUERIES)
+    k: int = Field(8, ge=1, le=BATCH_MAX_K)
+    fusion: Optional[FusionName] = None
+
+@app.post("/search/batch")
+def search_batch(q: BatchQuery):
+    """Busca várias consultas de uma vez; resultados na ordem de `queries`."""
+    return {"results": search_products_batch(q.queries, k=q.k, fusion=q.fusion)}
+
+StreamFusionName = Literal["maxnorm", "rrf"]  # fusion.STREAMING_STRATEGIES
+
+class StreamQuery(BaseModel):
+    query: str
+    k: int = Field(100, ge=1, le=STREAM_MAX_DEPTH)
+    offset: int = Field(0, ge=0)  # `next_offset` da página anterior
+    fusion: Optional[StreamFusionName] = None
+
+@app.post("/search/stream")
+async def search_stream_ndjson(q: StreamQuery):
+    """Ranking longo em NDJSON: meta, um resultado por linha assim que definitivo, end.
+
+    Abertura dos cursores e primeiro lote antes do status (erros viram HTTP);
+    o restante é lido sob demanda enquanto o cliente consome (ver search_stream)."""
+    try:
+        lines = await asyncio.to_thread(search_stream, q.query, k=q.k, offset=q.offset, fusion=q.fusion)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    body = (json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+    return StreamingResponse(body, media_type="application/x-ndjson")
+
+@app.get("/search/stats")
+def search_stats():
+    """Estatísticas dos pools de conexões e dos caches deste worker."""
+    return {
+        "pool": pool_stats(),
+        "async_pool": async_pool_stats(),
+        "embedding_cache": query_embedding_cache.stats(),
+        "embedding_batcher": query_embedder.stats(),
+        "vector_index": vector_index.stats(),
+        "response_cache": search_response_cache.stats(),
+        "code_index": code_index.stats(),
+        "catalog_version": catalog_watcher.current(),
+    }
+
 class PaintEstimateRequest(BaseModel):
     """Schema de entrada para o cálculo de tinta.
 
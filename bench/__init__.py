@@ -0,0 +1,8 @@
+"""Benchmark offline da busca (Postgres/pgvector local + embeddings falsos).
+
+  python -m bench.seed --reset [--scale 100000]   # esquema rag + dados
+  python -m bench.make_queries                     # bench/queries.jsonl (gabarito)
+  python -m bench.run --concurrency 8              # latência por etapa, QPS, recall@k
+
+Aponte DB_* para um banco descartável: `bench.seed --reset` apaga o schema rag.
+"""
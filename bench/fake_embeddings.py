@@ -0,0 +1,22 @@
+# bench/fake_embeddings.py
+"""Embeddings determinísticos locais no lugar da API da OpenAI.
+
+Usa o provedor `hash` de `embeddings` (feature hashing de palavras e
+trigramas de caracteres sobre o texto normalizado): textos que compartilham
+palavras ficam próximos no cosseno, então o canal vetorial continua tendo
+sinal, sem rede e sem custo. O mesmo texto gera sempre o mesmo vetor.
+
+`install()` torna esse o provedor do processo (busca síncrona, assíncrona e
+agrupador de consultas), opcionalmente com uma latência artificial para
+simular a ida à API.
+"""
+from __future__ import annotations
+
+from embeddings import EMB_DIM, HashProvider, hash_embedding, set_provider
+
+__all__ = ["EMB_DIM", "hash_embedding", "install"]
+
+
+def install(latency_ms: float = 0.0):
+    """Substitui o provedor de embeddings pelo determinístico, com a dimensão EMB_DIM."""
+    set_provider(HashProvider(dim=EMB_DIM, latency_ms=latency_ms))
@@ -0,0 +1,81 @@
+# bench/make_queries.py
+"""Gera o conjunto de consultas com gabarito (JSONL) a partir do CSV.
+
+Cada linha: {"query": ..., "kind": ..., "relevant": [sku, ...]}. Tipos:
+
+  sku      código do produto como aparece no CSV (ex.: "10.039")
+  ean      código de barras
+  name     nome completo, em minúsculas
+  partial  as 2-3 palavras mais longas do nome
+  typo     nome com uma letra removida de uma das palavras
+
+Os produtos do CSV também estão na base escalada (`bench.seed --scale`),
+então o mesmo gabarito serve para qualquer tamanho.
+
+Uso:
+  python -m bench.make_queries [--csv resumido_200.csv] [--sample 100] [--out bench/queries.jsonl]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+from bench.seed import DEFAULT_CSV, read_products
+
+DEFAULT_OUT = Path(__file__).parent / "queries.jsonl"
+QUERY_SEED = 7
+
+
+def queries_for(r: Dict[str, str], rng: random.Random) -> Iterator[dict]:
+    sku = (r.get("codigo_produto") or "").replace(".", "").strip()
+    name = (r.get("descricao") or "").strip()
+    if not sku or not name:
+        return
+    relevant = [sku]
+    yield {"query": r["codigo_produto"].strip(), "kind": "sku", "relevant": relevant}
+    ean = (r.get("codigo_barras") or "").strip()
+    if ean:
+        yield {"query": ean, "kind": "ean", "relevant": relevant}
+    yield {"query": name.lower(), "kind": "name", "relevant": relevant}
+
+    words = [w for w in name.split() if w.isalpha()]
+    longest = sorted(words, key=len, reverse=True)[:3]
+    if len(longest) >= 2:
+        # mantém a ordem original das palavras escolhidas
+        yield {"query": " ".join(w for w in words if w in longest).lower(), "kind": "partial", "relevant": relevant}
+
+    tokens = name.split()
+    candidates = [i for i, w in enumerate(tokens) if w.isalpha() and len(w) >= 5]
+    if candidates:
+        i = rng.choice(candidates)
+        w = tokens[i]
+        j = rng.randrange(1, len(w) - 1)
+        typo = tokens[:i] + [w[:j] + w[j + 1:]] + tokens[i + 1:]
+        yield {"query": " ".join(typo).lower(), "kind": "typo", "relevant": relevant}
+
+
+def make_queries(csv_path: Path, sample: int = 0, seed: int = QUERY_SEED) -> List[dict]:
+    rng = random.Random(seed)
+    rows = read_products(csv_path)
+    if sample and sample < len(rows):
+        rows = rng.sample(rows, sample)
+    out: List[dict] = []
+    for r in rows:
+        out.extend(queries_for(r, rng))
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--csv", type=Path, default=DEFAULT_CSV)
+    ap.add_argument("--sample", type=int, default=100, help="produtos sorteados (0 = todos)")
+    ap.add_argument("--out", type=Path, default=DEFAULT_OUT)
+    args = ap.parse_args()
+    qs = make_queries(args.csv, sample=args.sample)
+    with open(args.out, "w", encoding="utf-8") as f:
+        for q in qs:
+            f.write(json.dumps(q, ensure_ascii=False) + "\n")
+    print(f"{len(qs)} consultas em {args.out}")
@@ -0,0 +1,251 @@
+# bench/run.py
+"""Reproduz o conjunto de consultas contra a base do benchmark e mede.
+
+Relata, por etapa (as mesmas do header Server-Timing: embed, vec, ft, trgm,
+kw, fusion, code_index, ...), p50/p95/p99 em ms; QPS com concorrência fixa;
+recall@k (geral e por tipo de consulta) contra o gabarito de
+`bench.make_queries`; e a distribuição de `method` das respostas.
+
+Embeddings vêm de `bench.fake_embeddings` (--embed-latency-ms simula a ida à
+API). Com --baseline, compara com um relatório anterior (--out) e sai com
+código 1 se p95 total, QPS ou recall piorarem além da tolerância.
+
+Uso:
+  python -m bench.run --concurrency 8 --rounds 3 --out bench_output.json
+  python -m bench.run --path async --mode server --baseline bench_output.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from bench import fake_embeddings
+import metrics
+from embedding_cache import query_embedding_cache
+from vector_index import vector_index
+
+DEFAULT_QUERIES = Path(__file__).parent / "queries.jsonl"
+PERCENTILES = (50, 95, 99)
+RECALL_TOLERANCE = 0.01  # queda absoluta de recall aceita contra o baseline
+
+
+@dataclass
+class Sample:
+    kind: str
+    total: float
+    stages: Dict[str, float] = field(default_factory=dict)
+    method: Optional[str] = None
+    recall: Optional[float] = None
+    error: Optional[str] = None
+
+
+def load_queries(path: Path) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def recall_at_k(results: List[dict], relevant: List[str], k: int) -> float:
+    if not relevant:
+        return 1.0
+    top = {r["sku"] for r in results[:k]}
+    return len(top & set(relevant)) / len(relevant)
+
+
+def _sample(q: dict, out, timings, total: float, k: int, error: Optional[str]) -> Sample:
+    stages: Dict[str, float] = defaultdict(float)
+    for stage, seconds in timings:
+        stages[stage] += seconds  # etapas repetidas somadas, como no Server-Timing
+    s = Sample(kind=q.get("kind", "?"), total=total, stages=dict(stages), error=error)
+    if out is not None:
+        s.method = out.get("method")
+        s.recall = recall_at_k(out.get("results", []), q.get("relevant", []), k)
+    return s
+
+
+# ---------- replay ----------
+def replay_sync(queries: List[dict], k: int, concurrency: int, **search_kwargs) -> List[Sample]:
+    from search_products import search_products
+
+    def one(q: dict) -> Sample:
+        timings = metrics.begin_request()
+        t0 = time.perf_counter()
+        out, error = None, None
+        try:
+            out = search_products(q["query"], k=k, **search_kwargs)
+        except Exception as e:
+            error = repr(e)
+        return _sample(q, out, timings, time.perf_counter() - t0, k, error)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        return list(ex.map(one, queries))
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    # um único loop para aquecimento e todas as passadas: o pool do asyncpg fica preso ao loop
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+    return _loop
+
+
+def close_async():
+    from search_products_async import close_async_pool
+
+    if _loop is not None:
+        _loop.run_until_complete(close_async_pool())
+        _loop.close()
+
+
+def replay_async(queries: List[dict], k: int, concurrency: int, **search_kwargs) -> List[Sample]:
+    from search_products_async import search_products_async
+
+    async def main() -> List[Sample]:
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(q: dict) -> Sample:
+            async with sem:
+                timings = metrics.begin_request()  # contexto próprio de cada task
+                t0 = time.perf_counter()
+                out, error = None, None
+                try:
+                    out = await search_products_async(q["query"], k=k, **search_kwargs)
+                except Exception as e:
+                    error = repr(e)
+                return _sample(q, out, timings, time.perf_counter() - t0, k, error)
+
+        return await asyncio.gather(*(one(q) for q in queries))
+
+    return _event_loop().run_until_complete(main())
+
+
+# ---------- relatório ----------
+def _pct(values: List[float]) -> Dict[str, float]:
+    arr = np.asarray(values) * 1000.0
+    out = {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(arr, PERCENTILES))}
+    out.update({"mean": round(float(arr.mean()), 2), "n": int(arr.size)})
+    return out
+
+
+def summarize(samples: List[Sample], elapsed: float, config: dict) -> dict:
+    ok = [s for s in samples if s.error is None]
+    stages: Dict[str, List[float]] = defaultdict(list)
+    for s in ok:
+        for stage, seconds in s.stages.items():
+            stages[stage].append(seconds)
+    by_kind: Dict[str, List[float]] = defaultdict(list)
+    for s in ok:
+        by_kind[s.kind].append(s.recall)
+    recalls = [s.recall for s in ok]
+    return {
+        "config": config,
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "error_sample": [s.error for s in samples if s.error][:5],
+        "elapsed_s": round(elapsed, 3),
+        "qps": round(len(samples) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": {"total": _pct([s.total for s in ok]) if ok else {},
+                       **{stage: _pct(v) for stage, v in sorted(stages.items())}},
+        f"recall_at_{config['k']}": round(float(np.mean(recalls)), 4) if recalls else 0.0,
+        "recall_by_kind": {kind: round(float(np.mean(v)), 4) for kind, v in sorted(by_kind.items())},
+        "methods": dict(Counter(s.method for s in ok)),
+    }
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> List[str]:
+    """Regressões de `report` contra `baseline` (lista vazia = ok)."""
+    problems = []
+    p95, base_p95 = report["latency_ms"]["total"].get("p95"), baseline["latency_ms"]["total"].get("p95")
+    if p95 is not None and base_p95 and p95 > base_p95 * (1 + max_regression):
+        problems.append(f"p95 total {p95:.1f} ms > baseline {base_p95:.1f} ms (+{max_regression:.0%})")
+    if baseline.get("qps") and report["qps"] < baseline["qps"] * (1 - max_regression):
+        problems.append(f"QPS {report['qps']:.1f} < baseline {baseline['qps']:.1f} (-{max_regression:.0%})")
+    for kind, base in baseline.get("recall_by_kind", {}).items():
+        cur = report["recall_by_kind"].get(kind, 0.0)
+        if cur < base - RECALL_TOLERANCE:
+            problems.append(f"recall[{kind}] {cur:.4f} < baseline {base:.4f}")
+    if report["errors"] > baseline.get("errors", 0):
+        problems.append(f"erros {report['errors']} > baseline {baseline.get('errors', 0)}")
+    return problems
+
+
+def print_report(report: dict):
+    k = report["config"]["k"]
+    print(f"{report['requests']} requisições em {report['elapsed_s']:.2f}s | "
+          f"{report['qps']:.1f} QPS (concorrência {report['config']['concurrency']}) | erros {report['errors']}")
+    print(f"{'etapa':<22}{'n':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'média':>10}")
+    for stage, p in report["latency_ms"].items():
+        if p:
+            print(f"{stage:<22}{p['n']:>7}{p['p50']:>10.2f}{p['p95']:>10.2f}{p['p99']:>10.2f}{p['mean']:>10.2f}")
+    print(f"recall@{k}: {report[f'recall_at_{k}']:.4f} | " +
+          ", ".join(f"{kind}={v:.4f}" for kind, v in report["recall_by_kind"].items()))
+    print("métodos: " + ", ".join(f"{m}={n}" for m, n in sorted(report["methods"].items(), key=str)))
+
+
+def main(args) -> int:
+    fake_embeddings.install(latency_ms=args.embed_latency_ms)
+    queries = load_queries(args.queries)
+    search_kwargs = {"mode": args.mode, "fusion": args.fusion}
+    replay = replay_sync if args.path == "sync" else replay_async
+    vector_index.start()  # como no startup da API: snapshot carregado antes de medir
+
+    samples: List[Sample] = []
+    elapsed = 0.0
+    try:
+        if args.warmup:
+            replay(queries[:args.warmup], args.k, args.concurrency, **search_kwargs)
+        for _ in range(args.rounds):
+            if args.cold:
+                query_embedding_cache.clear(disk=False)  # o SQLite (EMB_CACHE_PATH) pode ser o de produção
+            t0 = time.perf_counter()
+            samples.extend(replay(queries, args.k, args.concurrency, **search_kwargs))
+            elapsed += time.perf_counter() - t0
+    finally:
+        if args.path == "async":
+            close_async()
+
+    config = {"queries": str(args.queries), "k": args.k, "concurrency": args.concurrency, "rounds": args.rounds,
+              "path": args.path, "mode": args.mode, "fusion": args.fusion, "cold": args.cold,
+              "embed_latency_ms": args.embed_latency_ms, "emb_dim": fake_embeddings.EMB_DIM}
+    report = summarize(samples, elapsed, config)
+    print_report(report)
+    if args.out:
+        args.out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Relatório: {args.out}")
+    if args.baseline:
+        problems = compare(report, json.loads(args.baseline.read_text(encoding="utf-8")), args.max_regression)
+        for p in problems:
+            print(f"REGRESSÃO: {p}")
+        if problems:
+            return 1
+        print("Sem regressões contra o baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--queries", type=Path, default=DEFAULT_QUERIES)
+    ap.add_argument("--k", type=int, default=8)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--rounds", type=int, default=1, help="passadas pelo conjunto de consultas")
+    ap.add_argument("--warmup", type=int, default=20, help="consultas executadas antes de medir")
+    ap.add_argument("--path", choices=["sync", "async"], default="sync")
+    ap.add_argument("--mode", choices=["client", "server"], default=None)
+    ap.add_argument("--fusion", default=None, help="estratégia de fusão (fusion.FUSION_STRATEGIES)")
+    ap.add_argument("--cold", action="store_true", help="limpa o cache de embeddings em memória a cada passada")
+    ap.add_argument("--embed-latency-ms", type=float, default=0.0, help="latência artificial por chamada")
+    ap.add_argument("--out", type=Path, default=None, help="grava o relatório JSON")
+    ap.add_argument("--baseline", type=Path, default=None, help="relatório anterior para comparar")
+    ap.add_argument("--max-regression", type=float, default=0.10, help="piora relativa aceita (p95, QPS)")
+    raise SystemExit(main(ap.parse_args()))
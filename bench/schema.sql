@@ -0,0 +1,84 @@
+-- bench/schema.sql
+-- Esquema rag mínimo para o benchmark local: tabelas e funções que existem
+-- no banco de produção antes de migrations/ (products, product_chunks,
+-- find_by_code, search_vec, search_ft), em uma versão aproximada. As
+-- migrações do repositório são aplicadas por cima por `bench.seed`.
+-- {{EMB_DIM}} é substituído pela dimensão configurada (EMB_DIM).
+
+CREATE EXTENSION IF NOT EXISTS vector;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+CREATE SCHEMA IF NOT EXISTS rag;
+
+CREATE TABLE rag.products (
+    id bigserial PRIMARY KEY,
+    sku text NOT NULL UNIQUE,
+    name text NOT NULL,
+    description text,
+    codigo_barras text,
+    tipo text,
+    um text,
+    qtde_cx text,
+    estoque numeric,
+    raw jsonb,
+    tsv tsvector GENERATED ALWAYS AS (
+        to_tsvector('portuguese', coalesce(name, '') || ' ' || coalesce(description, ''))
+    ) STORED
+);
+
+CREATE TABLE rag.product_chunks (
+    product_id bigint NOT NULL REFERENCES rag.products (id) ON DELETE CASCADE,
+    chunk_no int NOT NULL,
+    content text NOT NULL,
+    embedding vector({{EMB_DIM}}) NOT NULL,
+    PRIMARY KEY (product_id, chunk_no)
+);
+
+-- índices criados depois da carga (bench.seed), bem mais rápido que durante
+-- products_tsv_idx, products_name_trgm_idx, products_codigo_barras_idx, product_chunks_embedding_idx
+
+CREATE OR REPLACE FUNCTION rag.find_by_code(q text, k int DEFAULT 5)
+RETURNS TABLE (product_id bigint, sku text, name text, codigo_barras text, reason text)
+LANGUAGE sql STABLE AS $$
+    SELECT p.id, p.sku, p.name, p.codigo_barras, 'sku'
+    FROM rag.products p
+    WHERE p.sku = replace(btrim(q), '.', '')
+    UNION ALL
+    SELECT p.id, p.sku, p.name, p.codigo_barras, 'codigo_barras'
+    FROM rag.products p
+    WHERE regexp_replace(q, '\D', '', 'g') <> ''
+      AND p.codigo_barras = regexp_replace(q, '\D', '', 'g')
+      AND p.sku <> replace(btrim(q), '.', '')
+    LIMIT k;
+$$;
+
+-- melhor chunk por produto; busca k * 4 chunks no índice para deduplicar
+CREATE OR REPLACE FUNCTION rag.search_vec(qvec vector, k int DEFAULT 50)
+RETURNS TABLE (product_id bigint, sku text, name text, codigo_barras text, dist float8)
+LANGUAGE sql STABLE AS $$
+    SELECT p.id, p.sku, p.name, p.codigo_barras, c.dist
+    FROM (
+        SELECT DISTINCT ON (n.product_id) n.product_id, n.dist
+        FROM (
+            SELECT ch.product_id, (ch.embedding <=> qvec)::float8 AS dist
+            FROM rag.product_chunks ch
+            ORDER BY ch.embedding <=> qvec
+            LIMIT k * 4
+        ) n
+        ORDER BY n.product_id, n.dist
+    ) c
+    JOIN rag.products p ON p.id = c.product_id
+    ORDER BY c.dist
+    LIMIT k;
+$$;
+
+CREATE OR REPLACE FUNCTION rag.search_ft(query text, k int DEFAULT 30)
+RETURNS TABLE (product_id bigint, sku text, name text, codigo_barras text, score_ft float8)
+LANGUAGE sql STABLE AS $$
+    SELECT p.id, p.sku, p.name, p.codigo_barras, ts_rank(p.tsv, q)::float8
+    FROM rag.products p, websearch_to_tsquery('portuguese', query) q
+    WHERE p.tsv @@ q
+    ORDER BY 5 DESC
+    LIMIT k;
+$$;
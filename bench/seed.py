@@ -0,0 +1,201 @@
+# bench/seed.py
+"""Popula um Postgres+pgvector local com o schema rag para o benchmark.
+
+Carrega `resumido_200.csv` e, opcionalmente, produtos sintéticos derivados
+dele (nomes com palavras trocadas entre produtos do mesmo tipo + variante),
+até o total pedido em --scale. Embeddings vêm de `bench.fake_embeddings`,
+um chunk por produto (o texto de `ingest_csv.build_product_text` raramente
+passa de 800 tokens). Depois da carga: colunas normalizadas, índices,
+ANALYZE e incremento da versão do catálogo.
+
+Uso:
+  python -m bench.seed --reset                      # só os 200 produtos reais
+  python -m bench.seed --reset --scale 100000       # 200 reais + sintéticos até 100k
+  EMB_DIM=256 python -m bench.seed --reset --scale 1000000
+
+Com 1M de produtos, 1536 dims ocupam ~6 GB só de vetores; para medir escala,
+use um EMB_DIM menor (o mesmo valor precisa estar no ambiente do bench.run).
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import json
+import random
+import time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+from bench.fake_embeddings import EMB_DIM, hash_embedding
+from db_pool import DB_HOST, DB_NAME, connect_db
+from catalog import bump_catalog_version
+import migrate
+
+SCHEMA_PATH = Path(__file__).parent / "schema.sql"
+DEFAULT_CSV = Path(__file__).parent.parent / "resumido_200.csv"
+
+SYNTH_SEED = 42
+VARIANTS = ["P", "M", "G", "GG", "10MM", "12MM", "1/2\"", "3/4\"", "PRETO", "BRANCO", "CINZA",
+            "INOX", "KIT 2", "KIT 3", "110V", "220V", "BIVOLT", "1L", "3,6L", "18L"]
+
+PRODUCT_COLS = ["id", "sku", "name", "description", "codigo_barras", "tipo", "um", "qtde_cx", "estoque", "raw"]
+CHUNK_COLS = ["product_id", "chunk_no", "content", "embedding"]
+
+POST_LOAD_SQL = [
+    "UPDATE rag.products SET name_norm = rag.normalize_text(name), description_norm = rag.normalize_text(description);",
+    "CREATE INDEX IF NOT EXISTS products_tsv_idx ON rag.products USING gin (tsv);",
+    "CREATE INDEX IF NOT EXISTS products_name_trgm_idx ON rag.products USING gin (name gin_trgm_ops);",
+    "CREATE INDEX IF NOT EXISTS products_codigo_barras_idx ON rag.products (codigo_barras);",
+    "CREATE INDEX IF NOT EXISTS product_chunks_embedding_idx ON rag.product_chunks "
+    "USING hnsw (embedding vector_cosine_ops);",
+    "SELECT setval(pg_get_serial_sequence('rag.products', 'id'), (SELECT max(id) FROM rag.products));",
+    "ANALYZE rag.products;",
+    "ANALYZE rag.product_chunks;",
+]
+
+
+def read_products(csv_path: Path) -> List[Dict[str, str]]:
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f, delimiter=";"))
+
+
+def _decimal_br(s: str):
+    s = (s or "").strip().replace(".", "").replace(",", ".")
+    try:
+        return Decimal(s) if s else None
+    except InvalidOperation:
+        return None
+
+
+def product_text(name: str, tipo: str, desc: str, sku: str, ean: str) -> str:
+    # mesmo formato de ingest_csv.build_product_text
+    base = " | ".join(p for p in [name, tipo, desc] if p)
+    return (base + f"\nSKU: {sku}" + (f" | EAN: {ean}" if ean else "")).strip()
+
+
+def real_rows(rows: List[Dict[str, str]]) -> Iterator[dict]:
+    for r in rows:
+        sku = (r.get("codigo_produto") or "").replace(".", "").strip()
+        if not sku:
+            continue
+        raw = {k: (v or "").strip() for k, v in r.items() if k not in ("preco", "preco_promocional")}
+        yield {
+            "sku": sku, "name": (r.get("descricao") or "").strip(),
+            "description": (r.get("descricao_tecnica") or "").strip(),
+            "codigo_barras": (r.get("codigo_barras") or "").strip(), "tipo": (r.get("tipo") or "").strip(),
+            "um": (r.get("um") or "").strip(), "qtde_cx": (r.get("qtde_cx") or "").strip(),
+            "estoque": _decimal_br(r.get("estoque")), "raw": raw,
+        }
+
+
+def synthetic_rows(base: List[dict], n: int, seed: int = SYNTH_SEED) -> Iterator[dict]:
+    """`n` produtos derivados de `base`; SKUs de 9 dígitos e EANs com prefixo 2 (uso interno GS1)."""
+    rng = random.Random(seed)
+    vocab: Dict[str, List[str]] = {}
+    for b in base:
+        vocab.setdefault(b["tipo"], []).extend(b["name"].split())
+    for i in range(n):
+        b = base[rng.randrange(len(base))]
+        toks = b["name"].split() or ["PRODUTO"]
+        words = vocab.get(b["tipo"]) or toks
+        for _ in range(rng.randint(1, 2)):
+            toks[rng.randrange(len(toks))] = rng.choice(words)
+        sku = f"9{i:08d}"
+        yield {
+            "sku": sku, "name": " ".join(toks + [rng.choice(VARIANTS)]),
+            "description": b["description"][:400], "codigo_barras": f"2{i:012d}", "tipo": b["tipo"],
+            "um": b["um"], "qtde_cx": b["qtde_cx"], "estoque": Decimal(rng.randint(0, 500)),
+            "raw": {"synthetic": True, "base_sku": b["sku"]},
+        }
+
+
+def _csv_buffer(records: List[list]) -> io.StringIO:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    for rec in records:
+        w.writerow(["\\N" if v is None else v for v in rec])
+    buf.seek(0)
+    return buf
+
+
+def copy_batch(cur, batch: List[dict], first_id: int):
+    products, chunks = [], []
+    for i, p in enumerate(batch):
+        pid = first_id + i
+        products.append([pid, p["sku"], p["name"], p["description"], p["codigo_barras"], p["tipo"], p["um"],
+                         p["qtde_cx"], p["estoque"], json.dumps(p["raw"], ensure_ascii=False)])
+        text = product_text(p["name"], p["tipo"], p["description"], p["sku"], p["codigo_barras"])
+        emb = "[" + ",".join(f"{x:.7f}" for x in hash_embedding(text, EMB_DIM)) + "]"
+        chunks.append([pid, 1, text, emb])
+    opts = "WITH (FORMAT csv, NULL '\\N')"
+    cur.copy_expert(f"COPY rag.products ({', '.join(PRODUCT_COLS)}) FROM STDIN {opts}", _csv_buffer(products))
+    cur.copy_expert(f"COPY rag.product_chunks ({', '.join(CHUNK_COLS)}) FROM STDIN {opts}", _csv_buffer(chunks))
+
+
+def reset_schema(con):
+    with con.cursor() as cur:
+        cur.execute("DROP SCHEMA IF EXISTS rag CASCADE;")
+        cur.execute(SCHEMA_PATH.read_text(encoding="utf-8").replace("{{EMB_DIM}}", str(EMB_DIM)))
+    con.commit()
+
+
+def main(csv_path: Path, scale: int = 0, reset: bool = False, batch_size: int = 5000) -> int:
+    print(f"Banco: {DB_NAME}@{DB_HOST} | EMB_DIM={EMB_DIM}")
+    with connect_db() as con:
+        with con.cursor() as cur:
+            cur.execute("SELECT to_regclass('rag.products') IS NOT NULL;")
+            exists = cur.fetchone()[0]
+        if reset or not exists:
+            reset_schema(con)
+        migrate.main()
+
+        with con.cursor() as cur:
+            cur.execute("SELECT count(*) FROM rag.products;")
+            if cur.fetchone()[0]:
+                raise SystemExit("rag.products já tem dados; use --reset para recriar o schema rag")
+
+        # SKU repetido no CSV: vale a última linha, como no upsert da ingestão
+        base = list({p["sku"]: p for p in real_rows(read_products(csv_path))}.values())
+        total = max(scale, len(base))
+        t0 = time.perf_counter()
+
+        def all_rows():
+            yield from base
+            yield from synthetic_rows(base, total - len(base))
+
+        loaded = 0
+        batch: List[dict] = []
+        with con.cursor() as cur:
+            for p in all_rows():
+                batch.append(p)
+                if len(batch) >= batch_size:
+                    copy_batch(cur, batch, loaded + 1)
+                    loaded += len(batch)
+                    batch = []
+                    print(f"  {loaded}/{total} produtos ({loaded / (time.perf_counter() - t0):.0f}/s)")
+            if batch:
+                copy_batch(cur, batch, loaded + 1)
+                loaded += len(batch)
+        con.commit()
+        print(f"Carga: {loaded} produtos em {time.perf_counter() - t0:.1f}s")
+
+        t1 = time.perf_counter()
+        with con.cursor() as cur:
+            for sql in POST_LOAD_SQL:
+                cur.execute(sql)
+            bump_catalog_version(cur)
+        con.commit()
+        print(f"Normalização, índices e ANALYZE em {time.perf_counter() - t1:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--csv", type=Path, default=DEFAULT_CSV)
+    ap.add_argument("--scale", type=int, default=0, help="total de produtos (reais + sintéticos)")
+    ap.add_argument("--reset", action="store_true", help="apaga e recria o schema rag antes da carga")
+    ap.add_argument("--batch", type=int, default=5000, help="produtos por COPY")
+    args = ap.parse_args()
+    raise SystemExit(main(args.csv, scale=args.scale, reset=args.reset, batch_size=args.batch))
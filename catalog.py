@@ -0,0 +1,113 @@
+# catalog.py
+"""Versão do catálogo (rag.catalog_version) vista pelos processos de busca.
+
+Uma thread daemon consulta a versão a cada CATALOG_VERSION_POLL segundos e
+avisa os interessados (snapshots, caches) quando ela muda. `current()` só
+devolve o último valor lido, sem ir ao banco no caminho da requisição; a
+primeira leitura fica com `start()` (na API, via asyncio.to_thread no startup)
+ou com a própria thread.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+
+from dotenv import load_dotenv
+
+from db_pool import get_pool
+
+load_dotenv()
+CATALOG_VERSION_POLL = float(os.getenv("CATALOG_VERSION_POLL", "10"))  # s
+
+GET_VERSION_SQL = "SELECT version FROM rag.catalog_version WHERE id;"
+BUMP_VERSION_SQL = "SELECT rag.bump_catalog_version();"
+
+
+def fetch_catalog_version(cur) -> int:
+    """Lê a versão atual; 0 se a migração 003 ainda não foi aplicada."""
+    try:
+        cur.execute(GET_VERSION_SQL)
+        row = cur.fetchone()
+    except Exception:
+        if not cur.connection.autocommit:
+            cur.connection.rollback()
+        return 0
+    if row is None:
+        return 0
+    return int(row["version"] if isinstance(row, dict) else row[0])
+
+
+def bump_catalog_version(cur) -> int:
+    """Incrementa a versão na transação do chamador (visível só após o commit)."""
+    cur.execute(BUMP_VERSION_SQL)
+    return int(cur.fetchone()[0])
+
+
+class CatalogWatcher:
+    """Acompanha rag.catalog_version e chama os listeners a cada mudança."""
+
+    def __init__(self, poll: float = CATALOG_VERSION_POLL):
+        self.poll = poll
+        self._version: Optional[int] = None
+        self._listeners: List[Callable[[int, int], None]] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _fetch(self) -> int:
+        with get_pool().connection() as con, con.cursor() as cur:
+            return fetch_catalog_version(cur)
+
+    def refresh(self) -> int:
+        """Lê a versão agora e notifica os listeners se mudou."""
+        new = self._fetch()
+        with self._lock:
+            old, self._version = self._version, new
+            listeners = list(self._listeners) if old is not None and old != new else []
+        for fn in listeners:
+            try:
+                fn(old, new)
+            except Exception:
+                pass
+        return new
+
+    def _run(self):
+        while True:
+            if self._version is not None:
+                time.sleep(self.poll)
+            try:
+                self.refresh()
+            except Exception:
+                time.sleep(self.poll)  # banco indisponível: tenta no próximo ciclo
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="catalog-watcher", daemon=True)
+            self._thread.start()
+
+    def start(self) -> int:
+        """Lê a versão agora (bloqueante) e inicia a thread; 0 se o banco falhar."""
+        try:
+            if self._version is None:
+                self.refresh()
+        except Exception:
+            pass
+        self._ensure_started()
+        return self._version or 0
+
+    def current(self) -> int:
+        """Última versão lida pela thread (0 enquanto nenhuma leitura deu certo); não vai ao banco."""
+        self._ensure_started()
+        return self._version or 0
+
+    def on_change(self, fn: Callable[[int, int], None]):
+        """Registra fn(versão_antiga, versão_nova)."""
+        with self._lock:
+            self._listeners.append(fn)
+        self._ensure_started()
+
+
+catalog_watcher = CatalogWatcher()
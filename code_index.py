@@ -0,0 +1,173 @@
+# code_index.py
+"""Índice em memória de SKU/EAN -> produto para consultas determinísticas.
+
+Boa parte das buscas são SKUs ou códigos de barras colados. Com este índice,
+consultas com "cara de código" (ver `looks_like_code`) são respondidas da
+memória, sem abrir conexão e sem chamar a API de embeddings. O SKU é
+normalizado como em `ingest_csv.main` (sem pontos: "353.3" -> "3533"). O
+índice é carregado na inicialização e recarregado quando a versão do
+catálogo muda. Uma carga do ingest_csv muda a versão a cada commit
+periódico; essas mudanças seguidas viram uma recarga só, quando a versão
+fica RELOAD_QUIET segundos parada (ou no máximo RELOAD_MAX_DELAY depois
+da primeira).
+"""
+from __future__ import annotations
+
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from db_pool import get_pool
+
+# dígitos com separadores usuais de SKU (ponto/hífen); ex.: "10.039", "7899807213866"
+_CODE_RE = re.compile(r"[0-9][0-9.\-]*")
+MIN_CODE_DIGITS = 2
+RETRY_AFTER = 30.0  # s entre tentativas de carga se o banco falhar
+RELOAD_QUIET = 30.0  # s sem nova versão antes de recarregar
+RELOAD_MAX_DELAY = 300.0  # s: teto de espera com a versão mudando sem parar
+
+LOAD_SQL = "SELECT sku, name, codigo_barras FROM rag.products;"
+
+Product = Tuple[str, str, str]  # (sku, name, codigo_barras)
+
+
+def normalize_sku(s: str) -> str:
+    return (s or "").strip().replace(".", "")
+
+
+def normalize_ean(s: str) -> str:
+    return re.sub(r"\D", "", s or "")
+
+
+def looks_like_code(q: str) -> bool:
+    """True para consultas que são só um SKU/EAN (sem palavras)."""
+    s = (q or "").strip()
+    return bool(_CODE_RE.fullmatch(s)) and sum(ch.isdigit() for ch in s) >= MIN_CODE_DIGITS
+
+
+class CodeIndex:
+    def __init__(self):
+        self._by_sku: Dict[str, List[Product]] = {}
+        self._by_ean: Dict[str, List[Product]] = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._listening = False
+        self._failed_at: Optional[float] = None
+        self._reload_lock = threading.Lock()
+        self._changed_at = 0.0
+        self._pending_since: Optional[float] = None  # recarga agendada desde (monotonic)
+        self.loaded_at: Optional[float] = None
+        self.load_seconds = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    def refresh(self):
+        """(Re)carrega o índice inteiro e troca os dicionários de uma vez."""
+        t0 = time.perf_counter()
+        by_sku: Dict[str, List[Product]] = {}
+        by_ean: Dict[str, List[Product]] = {}
+        with get_pool().connection() as con, con.cursor() as cur:
+            cur.execute(LOAD_SQL)
+            while True:
+                rows = cur.fetchmany(5000)
+                if not rows:
+                    break
+                for sku, name, codigo_barras in rows:
+                    p = (sku, name, codigo_barras)
+                    k = normalize_sku(sku)
+                    if k:
+                        by_sku.setdefault(k, []).append(p)
+                    e = normalize_ean(codigo_barras)
+                    if e:
+                        by_ean.setdefault(e, []).append(p)
+        with self._lock:
+            self._by_sku, self._by_ean = by_sku, by_ean
+            self.loaded_at = time.time()
+            self.load_seconds = time.perf_counter() - t0
+
+    def _on_catalog_change(self, old: int, new: int):
+        # roda na thread do CatalogWatcher: só agenda; uma thread por recarga pendente
+        now = time.monotonic()
+        with self._reload_lock:
+            self._changed_at = now
+            if self._pending_since is not None:
+                return
+            self._pending_since = now
+        threading.Thread(target=self._reload_when_quiet, name="code-index-reload", daemon=True).start()
+
+    def _reload_when_quiet(self):
+        while True:
+            with self._reload_lock:
+                due = min(self._changed_at + RELOAD_QUIET, self._pending_since + RELOAD_MAX_DELAY)
+                wait = due - time.monotonic()
+                if wait <= 0:
+                    self._pending_since = None  # mudança daqui em diante agenda outra recarga
+                    break
+            time.sleep(wait)
+        try:
+            self.refresh()
+        except Exception:
+            pass  # banco indisponível: mantém o índice atual até a próxima mudança
+
+    def ensure_loaded(self) -> bool:
+        """Carrega na primeira chamada e assina mudanças de catálogo. False se o banco falhar."""
+        if not self._listening:
+            from catalog import catalog_watcher
+
+            self._listening = True
+            catalog_watcher.on_change(self._on_catalog_change)
+        if self.loaded:
+            return True
+        with self._load_lock:
+            if self.loaded:
+                return True
+            if self._failed_at is not None and time.monotonic() - self._failed_at < RETRY_AFTER:
+                return False
+            try:
+                self.refresh()
+            except Exception:
+                self._failed_at = time.monotonic()
+                return False
+        return True
+
+    def lookup(self, q: str) -> List[Dict[str, object]]:
+        """Produtos cujo SKU ou EAN casa com a consulta (sem duplicatas)."""
+        by_sku, by_ean = self._by_sku, self._by_ean
+        hits: Dict[str, Dict[str, object]] = {}
+        for sku, name, codigo_barras in by_sku.get(normalize_sku(q), []):
+            hits.setdefault(sku, {"sku": sku, "codigo_barras": codigo_barras, "name": name, "reason": "sku"})
+        for sku, name, codigo_barras in by_ean.get(normalize_ean(q), []):
+            hits.setdefault(sku, {"sku": sku, "codigo_barras": codigo_barras, "name": name,
+                                  "reason": "codigo_barras"})
+        return list(hits.values())
+
+    def stats(self) -> Dict[str, object]:
+        return {"loaded": self.loaded, "skus": len(self._by_sku), "eans": len(self._by_ean),
+                "load_seconds": round(self.load_seconds, 3)}
+
+
+code_index = CodeIndex()
+
+
+def answer_from_memory(q: str) -> Optional[dict]:
+    """Resposta determinística para consultas em formato de código, ou None.
+
+    None quando a consulta não parece código ou o índice não está disponível
+    (o chamador segue para rag.find_by_code). Código sem correspondência devolve
+    {"results": []} com method "code_not_found" para o chamador decidir."""
+    if not looks_like_code(q) or not code_index.ensure_loaded():
+        return None
+    hits = code_index.lookup(q)
+    if len(hits) == 1:
+        return {"method": "deterministic", "confidence": 1.0, "results": [dict(hits[0], score=1.0)]}
+    if hits:
+        # código ambíguo (ex.: EAN repetido): devolve todos os candidatos, sem fusão
+        return {
+            "method": "deterministic_candidates",
+            "confidence": round(1.0 / len(hits), 4),
+            "results": [dict(h, score=1.0) for h in hits],
+        }
+    return {"method": "code_not_found", "confidence": 0.0, "results": []}
@@ -0,0 +1,304 @@
+# db_pool.py
+"""Pool de conexões Postgres usado pela busca.
+
+Evita o `psycopg2.connect` por requisição: cada processo (worker do uvicorn)
+mantém um pool próprio, dimensionado por DB_POOL_MIN/DB_POOL_MAX, com
+verificação de saúde de conexões ociosas, tempo máximo de vida por conexão e
+statements preparados (PREPARE) registrados na abertura de cada conexão.
+
+Uso:
+    with get_pool().connection() as con, con.cursor() as cur:
+        execute_prepared(cur, "sp_find_by_code", (q, 5))
+"""
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+import psycopg2
+import psycopg2.extensions
+from dotenv import load_dotenv
+
+load_dotenv()
+DB_HOST = os.getenv("DB_HOST")
+DB_PORT = int(os.getenv("DB_PORT", "5432"))
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+DB_NAME = os.getenv("DB_NAME")
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "20"))  # por worker (a busca usa até 4 em paralelo)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))  # s aguardando conexão livre
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))  # s
+DB_POOL_HEALTHCHECK_IDLE = float(os.getenv("DB_POOL_HEALTHCHECK_IDLE", "30"))  # s ociosa antes do SELECT 1
+
+# Nome -> (tipos dos parâmetros, SQL no estilo psycopg2 com %s)
+Statements = Dict[str, Tuple[str, str]]
+
+
+def connect_db():
+    """Conexão avulsa (DB_* com fallback para DATABASE_URL), p/ scripts e ingestão."""
+    if all([DB_HOST, DB_USER, DB_PASSWORD, DB_NAME]):
+        return psycopg2.connect(
+            host=DB_HOST,
+            port=DB_PORT,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            dbname=DB_NAME,
+        )
+
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        raise RuntimeError(
+            "Defina DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME no .env ou forneça DATABASE_URL."
+        )
+    return psycopg2.connect(database_url)
+
+
+class PoolTimeout(RuntimeError):
+    """Nenhuma conexão ficou livre dentro de DB_POOL_TIMEOUT."""
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """Conexão psycopg2 com os metadados que o pool precisa."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.prepared: set[str] = set()
+        self.prepare_failed: set[str] = set()
+        self.statements: Statements = {}
+
+
+def to_prepare_sql(sql: str) -> str:
+    """Converte placeholders psycopg2 (%s, %%) para o formato do PREPARE ($1, %)."""
+    counter = iter(range(1, 1000))
+    out = re.sub(r"%s|%%", lambda m: f"${next(counter)}" if m.group(0) == "%s" else "%", sql)
+    return out.strip().rstrip(";")
+
+
+def _prepare(cur, name: str) -> bool:
+    con = cur.connection
+    types, sql = con.statements[name]
+    try:
+        cur.execute(f"PREPARE {name}({types}) AS {to_prepare_sql(sql)};")
+        con.prepared.add(name)
+        return True
+    except psycopg2.Error:
+        # ex.: função/extensão ausente; execute_prepared usa o SQL original
+        con.prepare_failed.add(name)
+        return False
+
+
+def execute_prepared(cur, name: str, params: Sequence[Any], timeout_ms: Optional[int] = None):
+    """Executa o statement `name`: via EXECUTE se preparado nesta conexão,
+    senão com o SQL original (ex.: extensão ausente no momento do PREPARE).
+
+    Statements registrados depois da abertura da conexão são preparados no
+    primeiro uso. Com `timeout_ms`, o statement_timeout vai no mesmo envio
+    (SET LOCAL + statement formam uma transação implícita): uma ida ao banco,
+    sem SET/RESET em volta e sem afetar o próximo uso da conexão."""
+    con = cur.connection
+    prepared = getattr(con, "prepared", None)
+    if prepared is not None and name not in prepared and name not in con.prepare_failed:
+        _prepare(cur, name)
+    if prepared is not None and name in prepared:
+        placeholders = ", ".join(["%s"] * len(params))
+        sql = f"EXECUTE {name}({placeholders});"
+    else:
+        sql = con.statements[name][1]
+    if timeout_ms is not None:
+        sql = f"SET LOCAL statement_timeout = {int(timeout_ms)}; {sql}"
+    cur.execute(sql, tuple(params))
+
+
+class ConnectionPool:
+    """Pool thread-safe de conexões em modo autocommit.
+
+    - Conexões com mais de `max_lifetime` segundos são recicladas ao serem pegas.
+    - Conexões ociosas há mais de `healthcheck_idle` segundos passam por `SELECT 1`.
+    - Conexões devolvidas fechadas/quebradas são descartadas.
+    """
+
+    def __init__(self, minconn: int, maxconn: int, *, timeout: float = DB_POOL_TIMEOUT,
+                 max_lifetime: float = DB_POOL_MAX_LIFETIME,
+                 healthcheck_idle: float = DB_POOL_HEALTHCHECK_IDLE,
+                 statements: Optional[Statements] = None, **dsn):
+        if maxconn < 1 or minconn > maxconn:
+            raise ValueError("Use 0 <= minconn <= maxconn e maxconn >= 1")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.healthcheck_idle = healthcheck_idle
+        self.statements: Statements = dict(statements or {})
+        self.pid = os.getpid()
+        self._dsn = dsn
+        self._idle: deque[PooledConnection] = deque()
+        self._size = 0  # conexões abertas (ociosas + em uso)
+        self._cond = threading.Condition()
+        self._stats = {
+            "borrowed": 0, "created": 0, "closed": 0, "recycled_lifetime": 0,
+            "failed_healthchecks": 0, "discarded_broken": 0, "waits": 0,
+            "timeouts": 0, "wait_seconds_total": 0.0,
+        }
+        for _ in range(minconn):
+            self._idle.append(self._open())
+            self._size += 1
+
+    # ---------- ciclo de vida ----------
+    def _open(self) -> PooledConnection:
+        con = psycopg2.connect(connection_factory=PooledConnection, **self._dsn)
+        con.autocommit = True
+        con.statements = self.statements
+        with con.cursor() as cur:
+            for name in list(self.statements):
+                _prepare(cur, name)
+        self._stats["created"] += 1
+        return con
+
+    def _close(self, con: PooledConnection):
+        try:
+            con.close()
+        except Exception:
+            pass
+        self._stats["closed"] += 1
+
+    def _healthy(self, con: PooledConnection) -> bool:
+        if con.closed:
+            return False
+        if time.monotonic() - con.created_at > self.max_lifetime:
+            self._stats["recycled_lifetime"] += 1
+            return False
+        if time.monotonic() - con.last_used > self.healthcheck_idle:
+            try:
+                with con.cursor() as cur:
+                    cur.execute("SELECT 1;")
+            except psycopg2.Error:
+                self._stats["failed_healthchecks"] += 1
+                return False
+        return True
+
+    # ---------- empréstimo ----------
+    def getconn(self) -> PooledConnection:
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            waited_from = None
+            while not self._idle and self._size >= self.maxconn:
+                if waited_from is None:
+                    waited_from = time.monotonic()
+                    self._stats["waits"] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"Pool esgotado ({self.maxconn} conexões em uso)")
+                self._cond.wait(remaining)
+            if waited_from is not None:
+                self._stats["wait_seconds_total"] += time.monotonic() - waited_from
+            con = self._idle.popleft() if self._idle else None
+            self._size += 1 if con is None else 0
+            self._stats["borrowed"] += 1
+
+        # health check / abertura fora do lock
+        try:
+            if con is not None and not self._healthy(con):
+                self._close(con)
+                con = None
+            if con is None:
+                con = self._open()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        return con
+
+    def putconn(self, con: PooledConnection, discard: bool = False):
+        if not discard and con.closed:
+            discard = True
+        elif not discard and con.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                con.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard:
+            self._stats["discarded_broken"] += 1
+            self._close(con)
+        else:
+            con.last_used = time.monotonic()
+        with self._cond:
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append(con)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[PooledConnection]:
+        con = self.getconn()
+        try:
+            yield con
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.putconn(con, discard=True)
+            raise
+        except BaseException:
+            self.putconn(con)
+            raise
+        else:
+            self.putconn(con)
+
+    def closeall(self):
+        with self._cond:
+            while self._idle:
+                self._close(self._idle.popleft())
+                self._size -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            idle = len(self._idle)
+            out = dict(self._stats)
+            out.update({
+                "pid": self.pid, "min": self.minconn, "max": self.maxconn,
+                "size": self._size, "idle": idle, "in_use": self._size - idle,
+                "prepared_statements": sorted(self.statements),
+            })
+        out["wait_seconds_total"] = round(out["wait_seconds_total"], 4)
+        return out
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(statements: Optional[Statements] = None) -> ConnectionPool:
+    """Retorna o pool do processo atual, criando-o na primeira chamada.
+
+    Recria o pool após fork (cada worker do uvicorn tem o seu)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            assert all([DB_HOST, DB_USER, DB_PASSWORD, DB_NAME]), (
+                "Configure DB_HOST, DB_PORT, DB_USER, DB_PASSWORD e DB_NAME no .env"
+            )
+            _pool = ConnectionPool(
+                DB_POOL_MIN, DB_POOL_MAX, statements=statements,
+                host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASSWORD, dbname=DB_NAME,
+            )
+        elif statements:
+            # conexões já abertas preparam os novos statements no primeiro uso
+            _pool.statements.update(statements)
+        return _pool
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Estatísticas do pool deste processo, sem criá-lo (não abre conexões nem exige o .env)."""
+    pool = _pool
+    if pool is None or pool.pid != os.getpid():
+        return {"started": False}
+    return {"started": True, **pool.stats()}
@@ -0,0 +1,149 @@
+# embedding_batcher.py
+"""Agrupa chamadas concorrentes de embedding em uma única requisição à API.
+
+Com muitas buscas simultâneas, cada `embed_query` viraria uma requisição de
+uma entrada só. O `EmbeddingBatcher` junta os textos que chegam dentro de uma
+janela curta (EMB_COALESCE_WINDOW_MS, contada a partir do primeiro) ou até
+EMB_COALESCE_MAX itens / EMB_COALESCE_MAX_TOKENS tokens (estimados), faz uma
+chamada com a lista (textos repetidos uma vez só) e entrega a cada chamador o
+seu vetor via `concurrent.futures.Future`. O texto que estouraria o limite de
+tokens abre o lote seguinte.
+Até EMB_COALESCE_INFLIGHT lotes ficam em voo ao mesmo tempo; enquanto um
+espera a API, o próximo já está sendo montado.
+
+Do lado assíncrono, use `asyncio.wrap_future(batcher.submit(texto))`.
+Com EMB_COALESCE_WINDOW_MS=0 o agrupamento é desligado (chamada direta).
+"""
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from metrics import record_rows
+
+load_dotenv()
+EMB_COALESCE_WINDOW_MS = float(os.getenv("EMB_COALESCE_WINDOW_MS", "3"))
+EMB_COALESCE_MAX = int(os.getenv("EMB_COALESCE_MAX", "64"))  # itens por lote
+EMB_COALESCE_INFLIGHT = int(os.getenv("EMB_COALESCE_INFLIGHT", "4"))  # lotes simultâneos
+EMB_COALESCE_MAX_TOKENS = int(os.getenv("EMB_COALESCE_MAX_TOKENS", "8000"))  # tokens estimados por lote
+
+EmbedMany = Callable[[List[str]], List[List[float]]]
+
+
+def approx_tokens(text: str) -> int:
+    # sem tiktoken no caminho da busca: ~3 bytes UTF-8 por token (superestima para português)
+    return len(text.encode("utf-8")) // 3 + 1
+
+
+class EmbeddingBatcher:
+    def __init__(self, embed_many: EmbedMany, window_ms: float = EMB_COALESCE_WINDOW_MS,
+                 max_items: int = EMB_COALESCE_MAX, max_inflight: int = EMB_COALESCE_INFLIGHT,
+                 max_tokens: int = EMB_COALESCE_MAX_TOKENS):
+        self.embed_many = embed_many
+        self.window = window_ms / 1000.0
+        self.max_items = max(1, max_items)
+        self.max_tokens = max(1, max_tokens)
+        self.max_inflight = max(1, max_inflight)
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats = {"requests": 0, "batches": 0, "texts": 0, "max_batch": 0, "errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def _ensure_started(self):
+        # thread e executor criados no primeiro uso e recriados após fork (workers do uvicorn)
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._executor = ThreadPoolExecutor(max_workers=self.max_inflight, thread_name_prefix="emb-batch")
+            threading.Thread(target=self._collect, name="emb-coalescer", daemon=True).start()
+            self._pid = os.getpid()
+
+    def submit(self, text: str) -> Future:
+        """Future com o embedding de `text`."""
+        with self._lock:
+            self._stats["requests"] += 1
+        if not self.enabled:
+            fut: Future = Future()
+            fut.set_running_or_notify_cancel()
+            self._run([(text, fut)])
+            return fut
+        self._ensure_started()
+        fut = Future()
+        self._queue.put((text, fut))
+        return fut
+
+    def _collect(self):
+        q = self._queue
+        carry = None  # item que estouraria o limite de tokens: abre o próximo lote
+        while True:
+            first, carry = (carry if carry is not None else q.get()), None
+            batch, tokens = [first], approx_tokens(first[0])
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_items:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = q.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                n = approx_tokens(item[0])
+                if tokens + n > self.max_tokens:
+                    carry = item
+                    break
+                batch.append(item)
+                tokens += n
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: List[Tuple[str, Future]]):
+        # descarta futures canceladas (requisição abandonada) antes de chamar a API
+        self._run([(t, f) for t, f in batch if f.set_running_or_notify_cancel()])
+
+    def _run(self, batch: List[Tuple[str, Future]]):
+        waiters: Dict[str, List[Future]] = {}
+        for text, fut in batch:
+            waiters.setdefault(text, []).append(fut)
+        if not waiters:
+            return
+        texts = list(waiters)
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["texts"] += len(texts)
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(texts))
+        record_rows("embed_batch", len(texts))
+        try:
+            vecs = self.embed_many(texts)
+            if len(vecs) != len(texts):
+                raise RuntimeError(f"{len(vecs)} embeddings para {len(texts)} textos")
+        except BaseException as e:
+            with self._lock:
+                self._stats["errors"] += 1
+            for futs in waiters.values():
+                for f in futs:
+                    f.set_exception(e)
+            return
+        for text, vec in zip(texts, vecs):
+            for f in waiters[text]:
+                f.set_result(vec)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            out: Dict[str, object] = dict(self._stats)
+        out.update({"enabled": self.enabled, "window_ms": self.window * 1000.0, "max_items": self.max_items,
+                    "max_tokens": self.max_tokens, "pending": self._queue.qsize()})
+        out["avg_batch"] = round(out["texts"] / out["batches"], 2) if out["batches"] else 0.0
+        return out
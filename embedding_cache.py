@@ -0,0 +1,178 @@
+"""Cache de embeddings de consulta (LRU + TTL, persistência opcional em disco).
+
+A chave é (modelo, dimensão, consulta normalizada), de modo que "Cimento",
+"cimento " e "CIMENTO" reaproveitam o mesmo vetor. Os vetores ficam em memória
+como float32 (array('f')) para limitar o consumo; com EMB_CACHE_PATH definido,
+cada entrada também é gravada em SQLite e sobrevive a reinícios.
+
+As camadas têm travas separadas e métodos próprios (`get_memory`/`put_memory`,
+`get_disk`/`put_disk`): o caminho assíncrono consulta a memória no event loop
+e leva só o SQLite para uma thread.
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from text_norm import normalize_query
+
+load_dotenv()
+EMB_CACHE_SIZE = int(os.getenv("EMB_CACHE_SIZE", "10000"))  # entradas em memória
+EMB_CACHE_TTL = float(os.getenv("EMB_CACHE_TTL", str(7 * 24 * 3600)))  # s
+EMB_CACHE_PATH = os.getenv("EMB_CACHE_PATH") or None  # ex.: .cache/embeddings.sqlite3
+
+
+class EmbeddingCache:
+    """LRU thread-safe com expiração por TTL e contadores de acerto/erro."""
+
+    def __init__(self, maxsize: int = EMB_CACHE_SIZE, ttl: float = EMB_CACHE_TTL,
+                 path: Optional[str] = EMB_CACHE_PATH):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self._data: "OrderedDict[str, Tuple[float, array]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()  # SQLite: não segura a camada em memória
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                " key TEXT PRIMARY KEY, vec BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(q: str, model: str, dim: int) -> str:
+        return f"{model}:{dim}:{normalize_query(q)}"
+
+    # ---------- memória ----------
+    def _get_mem(self, key: str, now: float) -> Optional[array]:
+        hit = self._data.get(key)
+        if hit is None:
+            return None
+        created_at, vec = hit
+        if now - created_at > self.ttl:
+            del self._data[key]
+            self._stats["expired"] += 1
+            return None
+        self._data.move_to_end(key)
+        return vec
+
+    def _put_mem(self, key: str, vec: array, created_at: float):
+        self._data[key] = (created_at, vec)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    # ---------- disco (chamar com _db_lock) ----------
+    def _get_disk(self, key: str, now: float) -> Optional[Tuple[float, array]]:
+        row = self._db.execute(
+            "SELECT vec, created_at FROM query_embeddings WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > self.ttl:
+            self._db.execute("DELETE FROM query_embeddings WHERE key = ?", (key,))
+            self._db.commit()
+            with self._lock:
+                self._stats["expired"] += 1
+            return None
+        vec = array("f")
+        vec.frombytes(row[0])
+        return row[1], vec
+
+    def _put_disk(self, key: str, vec: array, created_at: float):
+        self._db.execute(
+            "INSERT OR REPLACE INTO query_embeddings (key, vec, created_at) VALUES (?, ?, ?)",
+            (key, vec.tobytes(), created_at),
+        )
+        self._db.commit()
+
+    # ---------- API ----------
+    @property
+    def persistent(self) -> bool:
+        return self._db is not None
+
+    def get_memory(self, key: str) -> Optional[List[float]]:
+        """Só a camada em memória (sem I/O); sem disco, a falta já conta como miss."""
+        with self._lock:
+            vec = self._get_mem(key, time.time())
+            if vec is not None:
+                self._stats["hits"] += 1
+                return vec.tolist()
+            if self._db is None:
+                self._stats["misses"] += 1
+            return None
+
+    def get_disk(self, key: str) -> Optional[List[float]]:
+        """Camada em disco, depois de uma falta em `get_memory`; o achado volta para a memória."""
+        if self._db is None:
+            return None
+        with self._db_lock:
+            found = self._get_disk(key, time.time())
+        with self._lock:
+            if found is None:
+                self._stats["misses"] += 1
+                return None
+            self._put_mem(key, found[1], found[0])
+            self._stats["disk_hits"] += 1
+        return found[1].tolist()
+
+    def put_memory(self, key: str, vec: List[float]):
+        with self._lock:
+            self._put_mem(key, array("f", vec), time.time())
+
+    def put_disk(self, key: str, vec: List[float]):
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._put_disk(key, array("f", vec), time.time())
+
+    def get(self, key: str) -> Optional[List[float]]:
+        vec = self.get_memory(key)
+        if vec is None:
+            vec = self.get_disk(key)
+        return vec
+
+    def put(self, key: str, vec: List[float]):
+        self.put_memory(key, vec)
+        self.put_disk(key, vec)
+
+    def get_or_compute(self, key: str, compute: Callable[[], List[float]]) -> List[float]:
+        vec = self.get(key)
+        if vec is None:
+            vec = compute()
+            self.put(key, vec)
+        return vec
+
+    def clear(self, disk: bool = True):
+        """Esvazia a memória e, com `disk`, também o SQLite persistente."""
+        with self._lock:
+            self._data.clear()
+        if disk and self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM query_embeddings")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            out: Dict[str, object] = dict(self._stats)
+            out.update({"size": len(self._data), "maxsize": self.maxsize,
+                        "ttl_seconds": self.ttl, "persistent": self._db is not None})
+        lookups = out["hits"] + out["disk_hits"] + out["misses"]
+        out["hit_ratio"] = round((out["hits"] + out["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return out
+
+
+query_embedding_cache = EmbeddingCache()
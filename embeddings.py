@@ -0,0 +1,191 @@
+# embeddings.py
+"""Provedores de embedding compartilhados pela busca e pela ingestão.
+
+Configuração por ambiente:
+
+  EMB_PROVIDER  openai (padrão) | local | hash
+  EMB_MODEL     modelo do provedor (padrão depende do provedor, ver DEFAULTS)
+  EMB_DIM       dimensão esperada; cada lote é conferido contra ela
+
+- openai: API de embeddings (OPENAI_API_KEY), cliente síncrono e assíncrono.
+- local: modelo ONNX em CPU via `fastembed` (opcional), sem rede. EMB_THREADS
+  limita as threads do ONNX Runtime e EMB_LOCAL_BATCH o lote por inferência;
+  o agrupamento dinâmico das consultas concorrentes fica no
+  `embedding_batcher`, como no provedor remoto.
+- hash: feature hashing determinístico (palavras + trigramas), para testes e
+  benchmark offline.
+
+Os vetores de rag.product_chunks, o snapshot de `vector_index` e o cache de
+embeddings dependem do modelo: ao trocar de provedor/modelo, re-embede o
+catálogo (ingest_csv) com a mesma configuração.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from text_norm import normalize_query
+
+try:  # opcional: EMB_PROVIDER=local
+    from fastembed import TextEmbedding
+except ImportError:  # pragma: no cover
+    TextEmbedding = None
+
+load_dotenv()
+DEFAULTS = {
+    "openai": ("text-embedding-3-small", 1536),
+    "local": ("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2", 384),
+    "hash": ("hash-v1", 1536),
+}
+EMB_PROVIDER = os.getenv("EMB_PROVIDER", "openai")
+EMB_MODEL = os.getenv("EMB_MODEL", DEFAULTS.get(EMB_PROVIDER, DEFAULTS["openai"])[0])
+EMB_DIM = int(os.getenv("EMB_DIM", str(DEFAULTS.get(EMB_PROVIDER, DEFAULTS["openai"])[1])))
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+EMB_THREADS = int(os.getenv("EMB_THREADS", "0")) or None  # None: padrão do ONNX Runtime
+EMB_LOCAL_BATCH = int(os.getenv("EMB_LOCAL_BATCH", "64"))
+
+
+class EmbeddingProvider:
+    """Interface: `embed(textos)` -> vetores, na mesma ordem."""
+
+    name = "base"
+
+    def __init__(self, model: str, dim: int):
+        self.model = model
+        self.dim = dim
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        out = self._embed(texts)
+        for v in out:
+            if len(v) != self.dim:
+                raise RuntimeError(f"Embedding dim {len(v)} != {self.dim}")
+        return out
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        # provedores em processo: inferência fora do event loop
+        return await asyncio.to_thread(self.embed, texts)
+
+
+class OpenAIProvider(EmbeddingProvider):
+    name = "openai"
+
+    def __init__(self, model: str, dim: int, api_key: Optional[str] = OPENAI_API_KEY):
+        assert api_key, "Configure OPENAI_API_KEY no .env"
+        from openai import AsyncOpenAI, OpenAI
+
+        super().__init__(model, dim)
+        self.client = OpenAI(api_key=api_key)
+        self.aclient = AsyncOpenAI(api_key=api_key)
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        resp = self.client.embeddings.create(model=self.model, input=texts)
+        return [d.embedding for d in resp.data]
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        resp = await self.aclient.embeddings.create(model=self.model, input=texts)
+        out = [d.embedding for d in resp.data]
+        for v in out:
+            if len(v) != self.dim:
+                raise RuntimeError(f"Embedding dim {len(v)} != {self.dim}")
+        return out
+
+
+class LocalProvider(EmbeddingProvider):
+    """Modelo de sentence embedding em ONNX, na CPU (fastembed)."""
+
+    name = "local"
+
+    def __init__(self, model: str, dim: int, threads: Optional[int] = EMB_THREADS,
+                 batch_size: int = EMB_LOCAL_BATCH):
+        if TextEmbedding is None:
+            raise RuntimeError("EMB_PROVIDER=local requer o pacote fastembed")
+        super().__init__(model, dim)
+        self.batch_size = batch_size
+        self._model = TextEmbedding(model_name=model, threads=threads)
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        return [v.tolist() for v in self._model.embed(texts, batch_size=self.batch_size)]
+
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def hash_embedding(text: str, dim: int) -> List[float]:
+    """Vetor L2-normalizado por feature hashing de palavras (peso 2) e trigramas (peso 1).
+
+    Determinístico entre processos (blake2b, não o `hash()` do Python)."""
+    idx, val = [], []
+    for w in _WORD_RE.findall(normalize_query(text)):
+        padded = f"#{w}#"
+        for feat, weight in [(w, 2.0)] + [(padded[i:i + 3], 1.0) for i in range(len(padded) - 2)]:
+            h = int.from_bytes(hashlib.blake2b(feat.encode("utf-8"), digest_size=8).digest(), "little")
+            idx.append(h % dim)
+            val.append(weight if (h >> 63) & 1 else -weight)
+    v = np.zeros(dim, dtype=np.float64)
+    if idx:
+        np.add.at(v, idx, val)
+    norm = float(np.linalg.norm(v))
+    if norm == 0.0:
+        v[0] = 1.0  # texto vazio: vetor fixo, ainda válido para o cosseno
+    else:
+        v /= norm
+    return v.tolist()
+
+
+class HashProvider(EmbeddingProvider):
+    """Embeddings determinísticos sem modelo; `latency_ms` simula a ida a uma API."""
+
+    name = "hash"
+
+    def __init__(self, model: str = DEFAULTS["hash"][0], dim: int = EMB_DIM, latency_ms: float = 0.0):
+        super().__init__(model, dim)
+        self.latency_s = latency_ms / 1000.0
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return [hash_embedding(t, self.dim) for t in texts]
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return [hash_embedding(t, self.dim) for t in texts]
+
+
+PROVIDERS = {"openai": OpenAIProvider, "local": LocalProvider, "hash": HashProvider}
+
+_provider: Optional[EmbeddingProvider] = None
+_provider_lock = threading.Lock()
+
+
+def get_provider() -> EmbeddingProvider:
+    """Provedor do processo, criado na primeira chamada a partir do ambiente."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            if EMB_PROVIDER not in PROVIDERS:
+                raise ValueError(f"EMB_PROVIDER deve ser um de {sorted(PROVIDERS)}")
+            _provider = PROVIDERS[EMB_PROVIDER](EMB_MODEL, EMB_DIM)
+        return _provider
+
+
+def set_provider(provider: EmbeddingProvider):
+    """Troca o provedor do processo (testes, benchmark)."""
+    global _provider
+    with _provider_lock:
+        _provider = provider
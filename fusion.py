@@ -0,0 +1,297 @@
+# fusion.py
+"""Fusão dos canais da busca híbrida (vetorial, full-text, trigram, palavra-chave).
+
+Os candidatos viram colunas NumPy (uma linha por SKU, uma coluna por canal),
+sem dicionários por item nem laços por campo. Estratégias (`FUSION_STRATEGIES`):
+
+  maxnorm  pontuação dividida pelo máximo do canal (padrão; mesma saída da
+           fusão original e de rag.search_hybrid)
+  rrf      reciprocal rank fusion: 1 / (FUSION_RRF_K + posição no canal),
+           escalado para 1.0 no primeiro lugar (empates de pontuação ficam
+           na ordem em que o canal os devolveu)
+  zscore   z-score dentro do canal passado por uma logística (0..1)
+
+Em todas, o peso de um canal sem resultados é zerado e os demais são
+re-normalizados para somar 1. SKU repetido num canal: vale a primeira
+(melhor) posição, a única regra que a fusão em streaming consegue seguir.
+
+`IncrementalFusion` faz a mesma soma ponderada com os canais lidos aos
+poucos (busca em streaming): só maxnorm e rrf, cujas notas dependem apenas
+do topo e da posição no canal (`STREAMING_STRATEGIES`).
+"""
+from __future__ import annotations
+
+import os
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+SEARCH_FUSION = os.getenv("SEARCH_FUSION", "maxnorm")
+FUSION_RRF_K = float(os.getenv("FUSION_RRF_K", "60"))
+
+CHANNELS = ("vec", "ft", "trgm", "kw")
+
+
+def _vec_score(r) -> float:
+    return max(0.0, 1.0 - float(r["dist"]))  # cosine -> similaridade
+
+
+# extrator de pontuação por canal (mesma ordem de CHANNELS)
+_SCORE_FNS: List[Callable[[dict], float]] = [
+    _vec_score,
+    lambda r: float(r["score_ft"]),
+    lambda r: float(r["score_trgm"] or 0.0),
+    lambda r: float(r.get("score_kw", 0.0)),
+]
+
+
+def _round4(a: np.ndarray) -> List[float]:
+    # round() do Python (arredondamento correto), não np.round: a saída tem de
+    # bater com a fusão original, inclusive na ordenação por score arredondado
+    return [round(x, 4) for x in a.tolist()]
+
+
+def _maxnorm(scores: np.ndarray, present: np.ndarray, ranks: np.ndarray) -> np.ndarray:
+    mx = scores.max(axis=0, initial=0.0)
+    return np.divide(scores, mx, out=np.zeros_like(scores), where=mx > 0)
+
+
+def _rrf(scores: np.ndarray, present: np.ndarray, ranks: np.ndarray) -> np.ndarray:
+    # posição da linha no próprio canal (base 1), como em IncrementalFusion
+    return np.divide(FUSION_RRF_K + 1.0, FUSION_RRF_K + ranks, out=np.zeros_like(scores), where=present)
+
+
+def _zscore(scores: np.ndarray, present: np.ndarray, ranks: np.ndarray) -> np.ndarray:
+    out = np.zeros_like(scores)
+    for c in range(scores.shape[1]):
+        rows = np.flatnonzero(present[:, c])
+        if rows.size == 0:
+            continue
+        s = scores[rows, c]
+        std = s.std()
+        # canal com um único valor: sem dispersão, todos contam como o melhor
+        out[rows, c] = 1.0 / (1.0 + np.exp(-(s - s.mean()) / std)) if std > 0 else 1.0
+    return out
+
+
+# normalize(pontuações, presença, posição no canal) -> notas 0..1, uma coluna por canal
+FUSION_STRATEGIES: Dict[str, Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray]] = {
+    "maxnorm": _maxnorm,
+    "rrf": _rrf,
+    "zscore": _zscore,
+}
+
+
+def fuse(vec_rows, ft_rows, trgm_rows, kw_rows, k: int,
+         alpha: float, beta: float, gamma: float, delta: float,
+         require_kw_when_available: bool, fusion: str = None):
+    """Fusão ponderada dos canais com a estratégia `fusion` (padrão SEARCH_FUSION).
+
+    Retorna {"confidence", "weights", "results"} (results já cortado em k)."""
+    normalize = FUSION_STRATEGIES.get(fusion or SEARCH_FUSION)
+    if normalize is None:
+        raise ValueError(f"fusion deve ser um de {sorted(FUSION_STRATEGIES)}")
+
+    # candidatos na ordem de primeira aparição (vec, ft, trgm, kw)
+    index: Dict[str, int] = {}
+    info: List[tuple] = []
+    cols = []
+    for c, rows in enumerate((vec_rows, ft_rows, trgm_rows, kw_rows)):
+        pos, vals, ranks, seen = [], [], [], set()
+        for rank, r in enumerate(rows, start=1):
+            sku = r["sku"]
+            i = index.get(sku)
+            if i is None:
+                i = index[sku] = len(info)
+                info.append((sku, r["name"], r["codigo_barras"]))
+            if i in seen:
+                continue  # SKU repetido no canal: vale a primeira (melhor) posição
+            seen.add(i)
+            pos.append(i)
+            vals.append(_SCORE_FNS[c](r))
+            ranks.append(rank)
+        cols.append((pos, vals, ranks))
+
+    n = len(info)
+    scores = np.zeros((n, len(CHANNELS)))
+    present = np.zeros((n, len(CHANNELS)), dtype=bool)
+    rank_of = np.zeros((n, len(CHANNELS)))
+    for c, (pos, vals, ranks) in enumerate(cols):
+        if pos:
+            scores[pos, c] = vals
+            present[pos, c] = True
+            rank_of[pos, c] = ranks
+
+    # re-normaliza pesos se algum canal não trouxe nada (inclui canais descartados)
+    w = np.array([alpha, beta, gamma, delta], dtype=float)
+    w[scores.max(axis=0, initial=0.0) <= 0] = 0.0
+    total = w.sum()
+    if total > 0:
+        w /= total
+
+    norm = normalize(scores, present, rank_of)
+    # soma explícita na ordem dos canais (sem BLAS/FMA): bit a bit igual à versão escalar
+    score = _round4(norm[:, 0] * w[0] + norm[:, 1] * w[1] + norm[:, 2] * w[2] + norm[:, 3] * w[3])
+    kw = _round4(norm[:, 3])
+
+    # ordem estável por score arredondado (empates mantêm a ordem de aparição)
+    order = np.argsort(-np.asarray(score), kind="stable")
+    # Se houver quaisquer itens com match por palavra‑chave, prioriza apenas esses no top
+    if require_kw_when_available:
+        with_kw = order[(np.asarray(kw) > 0.0)[order]]
+        if with_kw.size:
+            order = with_kw
+    top = order[:k].tolist()
+
+    results = []
+    for i in top:
+        sku, name, codigo_barras = info[i]
+        vn, fn, tn, _ = _round4(norm[i])
+        results.append({
+            "sku": sku, "name": name, "codigo_barras": codigo_barras,
+            "score": score[i], "vec": vn, "ft": fn, "trgm": tn, "kw": kw[i],
+        })
+    confidence = results[0]["score"] if results else 0.0
+    return {
+        "confidence": round(confidence, 4),
+        "weights": {ch: round(float(x), 2) for ch, x in zip(CHANNELS, w)},
+        "results": results,
+    }
+
+
+# ---------- fusão incremental (streaming) ----------
+def _maxnorm_at(score: float, rank: int, top: float) -> float:
+    return score / top if top > 0 else 0.0
+
+
+def _rrf_at(score: float, rank: int, top: float) -> float:
+    return (FUSION_RRF_K + 1.0) / (FUSION_RRF_K + rank)
+
+
+# nota de uma linha a partir da pontuação, da posição (base 1) e do topo do canal
+STREAMING_STRATEGIES: Dict[str, Callable[[float, int, float], float]] = {
+    "maxnorm": _maxnorm_at,
+    "rrf": _rrf_at,
+}
+
+
+class _Candidate:
+    __slots__ = ("sku", "name", "codigo_barras", "norms")
+
+    def __init__(self, sku: str, name: str, codigo_barras: str):
+        self.sku = sku
+        self.name = name
+        self.codigo_barras = codigo_barras
+        self.norms: Dict[str, float] = {}
+
+
+class IncrementalFusion:
+    """Fusão ponderada com canais lidos em lotes, em ordem decrescente de pontuação.
+
+    Algoritmo de limiar sem acesso aleatório (NRA, Fagin): a nota de um SKU
+    ainda não visto num canal é no máximo a da última linha lida dele. Um
+    candidato sai em `ready()` quando sua nota é exata (visto em todos os
+    canais ainda abertos) e nenhum outro candidato, nem um SKU ainda não
+    visto, pode superá-la. A ordem é a de `fuse()`, exceto entre empates.
+
+    Pesos e topo de cada canal vêm do primeiro lote (`first`), que precisa
+    estar completo para todos os canais antes de criar o objeto.
+    """
+
+    def __init__(self, first: Dict[str, List[dict]], exhausted: Iterable[str],
+                 alpha: float, beta: float, gamma: float, delta: float,
+                 require_kw_when_available: bool, fusion: str = None):
+        name = fusion or SEARCH_FUSION
+        self.norm_at = STREAMING_STRATEGIES.get(name)
+        if self.norm_at is None:
+            raise ValueError(f"fusion em streaming deve ser um de {sorted(STREAMING_STRATEGIES)}")
+        self.top = {c: (_SCORE_FNS[i](first[c][0]) if first.get(c) else 0.0) for i, c in enumerate(CHANNELS)}
+        w = np.array([alpha, beta, gamma, delta], dtype=float)
+        w[[self.top[c] <= 0 for c in CHANNELS]] = 0.0
+        total = w.sum()
+        if total > 0:
+            w /= total
+        self.weights = {c: float(x) for c, x in zip(CHANNELS, w)}
+        self.kw_required = require_kw_when_available and self.top["kw"] > 0
+        self.rank = {c: 0 for c in CHANNELS}
+        self.bound = {c: 0.0 if c not in first else 1.0 for c in CHANNELS}
+        self.open = {c for c in CHANNELS if c in first}
+        self.pending: Dict[str, _Candidate] = {}
+        self.emitted: set = set()
+        for c in CHANNELS:
+            if c in first:
+                self.add(c, first[c], c in exhausted)
+
+    def add(self, channel: str, rows: List[dict], exhausted: bool):
+        """Incorpora o próximo lote de `channel`; `exhausted` quando o canal acabou."""
+        score_fn = _SCORE_FNS[CHANNELS.index(channel)]
+        top = self.top[channel]
+        for r in rows:
+            self.rank[channel] += 1
+            norm = self.norm_at(score_fn(r), self.rank[channel], top)
+            self.bound[channel] = norm
+            sku = r["sku"]
+            if sku in self.emitted:
+                continue
+            cand = self.pending.get(sku)
+            if cand is None:
+                cand = self.pending[sku] = _Candidate(sku, r["name"], r["codigo_barras"])
+            cand.norms.setdefault(channel, norm)  # SKU repetido no canal: vale a primeira posição, como em fuse()
+        if exhausted:
+            self.open.discard(channel)
+            self.bound[channel] = 0.0
+
+    @property
+    def done(self) -> bool:
+        return not self.open and not self.pending
+
+    def _score(self, cand: _Candidate) -> float:
+        # mesma ordem de soma de fuse() (canal a canal), para bater o arredondamento
+        s = 0.0
+        for c in CHANNELS:
+            s += cand.norms.get(c, 0.0) * self.weights[c]
+        return s
+
+    def _slack(self, cand: _Candidate) -> float:
+        return sum(self.weights[c] * self.bound[c] for c in self.open if c not in cand.norms)
+
+    def _kw_state(self, cand: _Candidate) -> Optional[bool]:
+        # True: elegível; False: ainda pode vir no canal kw; None: descartado de vez
+        if not self.kw_required:
+            return True
+        if "kw" in cand.norms:
+            return True if cand.norms["kw"] > 0 else None
+        return False if "kw" in self.open and self.bound["kw"] > 0 else None
+
+    def ready(self) -> List[dict]:
+        """Resultados já definitivos, em ordem; cada um sai uma única vez."""
+        # SKU ainda não visto: no máximo o limite de todos os canais abertos
+        kw_possible = not self.kw_required or ("kw" in self.open and self.bound["kw"] > 0)
+        best_upper = sum(self.weights[c] * self.bound[c] for c in self.open) if kw_possible else -1.0
+        exact = []
+        for sku, cand in list(self.pending.items()):
+            state = self._kw_state(cand)
+            if state is None:
+                del self.pending[sku]
+                continue
+            score, slack = self._score(cand), self._slack(cand)
+            if state and slack == 0.0:
+                exact.append((score, cand))
+            else:
+                best_upper = max(best_upper, score + slack)
+        # ordem estável por score arredondado, como em fuse()
+        exact.sort(key=lambda t: -round(t[0], 4))
+        out = []
+        for score, cand in exact:
+            if score < best_upper:
+                break
+            del self.pending[cand.sku]
+            self.emitted.add(cand.sku)
+            out.append({
+                "sku": cand.sku, "name": cand.name, "codigo_barras": cand.codigo_barras,
+                "score": round(score, 4),
+                **{c: round(cand.norms.get(c, 0.0), 4) for c in CHANNELS},
+            })
+        return out
@@ -1,23 +1,48 @@
 import os, json, math, argparse
+import codecs
 import csv
+import hashlib
+import io
+import itertools
+import multiprocessing
+import queue
+import struct
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from decimal import Decimal, InvalidOperation
-import psycopg2
-from psycopg2.extras import execute_values
-import pandas as pd
+from psycopg2.extras import execute_batch, execute_values
 from dotenv import load_dotenv
 from tqdm import tqdm
 import tiktoken
-from openai import OpenAI
+
+from db_pool import connect_db  # DB_* com fallback para DATABASE_URL
+from catalog import bump_catalog_version
+from embeddings import get_provider  # EMB_PROVIDER/EMB_MODEL/EMB_DIM: openai, local, hash
+from vector_index import VECTOR_INDEX_PATH, refresh_snapshot
 
 # ---------- Config ----------
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-EMB_MODEL = os.getenv("EMB_MODEL", "text-embedding-3-small")
-EMB_DIM = int(os.getenv("EMB_DIM", "1536"))
-BATCH_SIZE = int(os.getenv("BATCH_SIZE", "64"))
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "64"))  # chunks por chamada de embeddings
+EMB_BATCH_TOKENS = int(os.getenv("EMB_BATCH_TOKENS", "50000"))  # tokens por chamada (API: até 300k)
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))  # chamadas de embeddings em paralelo
+EMB_RETRY_MAX = int(os.getenv("EMB_RETRY_MAX", "6"))  # novas tentativas em 429/5xx
+EMB_RETRY_BASE = float(os.getenv("EMB_RETRY_BASE", "1.0"))  # s; dobra a cada tentativa
+EMB_RETRY_CAP = 60.0
+INGEST_BULK = os.getenv("INGEST_BULK", "0") not in ("0", "false", "no")  # COPY + merge (--bulk)
+BULK_ROWS = int(os.getenv("BULK_ROWS", "2000"))  # produtos por COPY no modo bulk
+INGEST_DELTA = os.getenv("INGEST_DELTA", "0") not in ("0", "false", "no")  # pula texto inalterado (--delta)
+DELTA_LOOKUP = int(os.getenv("DELTA_LOOKUP", "1000"))  # SKUs por consulta de content_hash
+DELETE_MISSING_MAX_RATIO = float(os.getenv("DELETE_MISSING_MAX_RATIO", "0.5"))  # trava do --delete-missing
+INGEST_COMMIT_EVERY = int(os.getenv("INGEST_COMMIT_EVERY", "5000"))  # produtos por commit + checkpoint
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))  # processos (shards do CSV); 1 = sem shards
+INGEST_EMB_CACHE = os.getenv("INGEST_EMB_CACHE", "1") not in ("0", "false", "no")  # rag.embedding_cache
+CSV_SNIFF_BYTES = int(os.getenv("CSV_SNIFF_BYTES", str(64 * 1024)))  # amostra para separador/encoding
 MAX_TOKENS_PER_CHUNK = 800  # seguro p/ embedding-3
 
-client = OpenAI(api_key=OPENAI_API_KEY)
 enc = tiktoken.get_encoding("cl100k_base")
 
 EXPECTED_COLS = [
@@ -32,119 +57,236 @@ CSV_PATH = "resumido_200.csv"
 LIMIT = None
 SEP = None
 ENCODING = None
-START = 5000   # início (base 0). Para próximas 5000, usar 5000
-COUNT = 1000   # quantidade a processar a partir de START
-
- # ---------- Leitura robusta de CSV ----------
-def diagnose_csv(csv_path: str, sep: str, encoding: str) -> list[tuple[int, int, int, str]]:
-     """Analisa o CSV com csv.reader e retorna linhas problemáticas.
-     Cada item: (line_no, cols_encontradas, cols_esperadas, trecho_da_linha)
-     """
-     problems: list[tuple[int, int, int, str]] = []
-     try:
-         with open(csv_path, "r", encoding=encoding, errors="replace") as f:
-             raw_lines = f.readlines()
-         reader = csv.reader(raw_lines, delimiter=sep, quotechar='"', doublequote=True)
-         try:
-             header = next(reader)
-         except StopIteration:
-             return [(1, 0, 0, "<arquivo vazio>")]
-         expected = len(header)
-         line_no = 2  # após cabeçalho
-         for row in reader:
-             if len(row) != expected:
-                 snippet = raw_lines[line_no - 1].rstrip()[:160]
-                 problems.append((line_no, len(row), expected, snippet))
-             line_no += 1
-     except Exception as e:
-         problems.append((0, 0, 0, f"Falha ao diagnosticar: {e}"))
-     return problems
-
-def read_csv_safely(csv_path: str, sep_override: str | None = None, encoding_override: str | None = None,
-                    report: bool = True) -> tuple[pd.DataFrame, dict]:
-     """Tenta ler o CSV com diferentes combinações de sep/engine/encoding.
-     Se 'sep_override'/'encoding_override' forem fornecidos, tenta primeiro com eles.
-     Retorna (df, info) onde info traz 'sep', 'encoding', 'engine', 'tolerant' e 'problems'.
-     """
-     info = {"sep": None, "encoding": None, "engine": None, "tolerant": False, "problems": []}
-     attempts = [
-         {"sep": ",", "engine": None},
-         {"sep": ";", "engine": None},
-     ]
-     encodings = ["utf-8", "utf-8-sig", "cp1252"]
-
-     # Prioriza overrides, se fornecidos
-     if sep_override:
-         attempts = [{"sep": sep_override, "engine": None}] + [a for a in attempts if a["sep"] != sep_override]
-     if encoding_override:
-         encodings = [encoding_override] + [e for e in encodings if e != encoding_override]
-
-     # Tentativas com engine padrão
-     for enc_name in encodings:
-         for at in attempts:
-             try:
-                 df = pd.read_csv(
-                     csv_path,
-                     dtype=str,
-                     keep_default_na=False,
-                     sep=at["sep"],
-                     encoding=enc_name,
-                 )
-                 info.update({"sep": at["sep"], "encoding": enc_name, "engine": "c", "tolerant": False})
-                 print(f"CSV lido com sep='{at['sep']}', encoding='{enc_name}' (engine padrão)")
-                 if report:
-                     info["problems"] = diagnose_csv(csv_path, info["sep"], info["encoding"])
-                 return df, info
-             except Exception:
-                 continue
-
-     # Fallback tolerante: pula linhas ruins
-     for enc_name in encodings:
-         try:
-             df = pd.read_csv(
-                 csv_path,
-                 dtype=str,
-                 keep_default_na=False,
-                 sep=sep_override or ";",
-                 engine="python",
-                 quotechar='"',
-                 doublequote=True,
-                 on_bad_lines="skip",
-                 encoding=enc_name,
-             )
-             info.update({"sep": sep_override or ";", "encoding": enc_name, "engine": "python", "tolerant": True})
-             print(f"CSV lido no modo tolerante: sep='{info['sep']}', engine='python', encoding='{enc_name}', on_bad_lines='skip'")
-             if report:
-                 info["problems"] = diagnose_csv(csv_path, info["sep"], info["encoding"])
-             return df, info
-         except Exception:
-             continue
-
-     raise SystemExit("Não foi possível ler o CSV com as estratégias de fallback. Verifique separadores, aspas e encoding.")
-
-# ---------- Conexão DB (DB_* com fallback para DATABASE_URL) ----------
-def connect_db():
-    db_host = os.getenv("DB_HOST")
-    db_port = os.getenv("DB_PORT", "5432")
-    db_user = os.getenv("DB_USER")
-    db_pass = os.getenv("DB_PASSWORD")
-    db_name = os.getenv("DB_NAME")
-
-    if all([db_host, db_user, db_pass, db_name]):
-        return psycopg2.connect(
-            host=db_host,
-            port=int(db_port),
-            user=db_user,
-            password=db_pass,
-            dbname=db_name,
-        )
-
-    database_url = os.getenv("DATABASE_URL")
-    if not database_url:
-        raise RuntimeError(
-            "Defina DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME no .env ou forneça DATABASE_URL."
-        )
-    return psycopg2.connect(database_url)
+
+# ---------- Leitura do CSV em passada única ----------
+SEPARATORS = (";", ",", "\t", "|")
+
+def _sniff_encoding(head: bytes) -> str:
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # final=False: um caractere multibyte cortado no fim da amostra não conta como erro
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+def sniff_csv(csv_path: str, sep: str | None = None, encoding: str | None = None,
+              sample_bytes: int = CSV_SNIFF_BYTES) -> tuple[str, str]:
+    """Separador e encoding a partir dos primeiros `sample_bytes` do arquivo (overrides têm prioridade).
+
+    Separador: o que divide o cabeçalho em mais colunas (empate: ';')."""
+    with open(csv_path, "rb") as f:
+        head = f.read(sample_bytes)
+    encoding = encoding or _sniff_encoding(head)
+    if not sep:
+        lines = head.decode(encoding, errors="replace").splitlines()
+        header = lines[0] if lines else ""
+        sep = max(SEPARATORS, key=lambda s: (len(next(csv.reader([header], delimiter=s), [])), s == ";"))
+    return sep, encoding
+
+class BadLineReport:
+    """Relatório `<csv>.bad_lines.txt`, escrito à medida que as linhas problemáticas aparecem."""
+
+    def __init__(self, csv_path: str, sep: str, encoding: str, path: str | None = None):
+        self.csv_path = csv_path
+        self.path = path or f"{csv_path}.bad_lines.txt"
+        self.sep, self.encoding = sep, encoding
+        self.count = 0
+        self.sample: list[int] = []
+        self._f = None
+
+    def _open(self):
+        self._f = open(self.path, "w", encoding="utf-8")
+        self._f.write(f"CSV: {self.csv_path}\n")
+        self._f.write(f"sep='{self.sep}', encoding='{self.encoding}'\n\n")
+        self._f.write("Linhas problemáticas (linha, cols_encontradas, cols_esperadas, trecho):\n")
+
+    def add(self, line_no: int, found: int, expected: int, snippet: str):
+        if self._f is None:
+            self._open()
+        self._f.write(f"{line_no}\t{found}\t{expected}\t{snippet[:160]}\n")
+        self._f.flush()
+        self.count += 1
+        if len(self.sample) < 10:
+            self.sample.append(line_no)
+
+    def merge(self, other_path: str):
+        """Anexa as entradas de outro relatório (de um shard) e apaga o arquivo dele."""
+        if not os.path.exists(other_path):
+            return
+        with open(other_path, "r", encoding="utf-8") as f:
+            entries = f.readlines()[4:]  # pula o cabeçalho
+        for entry in entries:
+            if self._f is None:
+                self._open()
+            self._f.write(entry)
+            self.count += 1
+            if len(self.sample) < 10:
+                self.sample.append(int(entry.split("\t", 1)[0]))
+        os.remove(other_path)
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def summary(self):
+        if self.count:
+            preview = ", ".join(map(str, self.sample))
+            print(f"Linhas problemáticas detectadas: {self.count}. Amostra: {preview}. Relatório: {self.path}")
+
+class _LineSource:
+    """Linhas decodificadas dos bytes [start, end) de um arquivo aberto em binário.
+
+    `pos` é o offset do próximo byte e `lines` quantas linhas físicas vêm antes
+    dele: como o csv.reader pede exatamente as linhas de cada registro, após um
+    registro `pos` é onde ele termina (fronteira para os shards).
+
+    A decodificação é estrita: uma linha com bytes inválidos no encoding (o
+    encoding vem só do início do arquivo) é decodificada com U+FFFD e o número
+    dela entra em `replaced`, para quem lê decidir o que fazer."""
+
+    def __init__(self, f, encoding: str, start: int = 0, end: int | None = None, lines: int = 0):
+        f.seek(start)
+        self._f = f
+        self.encoding = encoding
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self.pos, self.end, self.lines = start, end, lines
+        self.replaced: list[int] = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if self.end is not None and self.pos >= self.end:
+            raise StopIteration
+        line = self._f.readline()
+        if not line:
+            raise StopIteration
+        self.pos += len(line)
+        self.lines += 1
+        try:
+            return self._decoder.decode(line)
+        except UnicodeDecodeError:
+            self._decoder.reset()
+            self.replaced.append(self.lines)
+            return line.decode(self.encoding, errors="replace")
+
+class CsvRecords:
+    """CSV lido em uma única passada, com memória constante.
+
+    O cabeçalho é lido e validado na abertura; iterar produz um dict por linha
+    (valores str, colunas de EXPECTED_COLS ausentes como ""). Linhas com número
+    de colunas diferente do cabeçalho, ou que o csv não consegue ler, vão para
+    o BadLineReport e são puladas. Registros com bytes inválidos no encoding
+    detectado (ex.: um byte cp1252 depois da amostra que parecia utf-8) também:
+    vão para o relatório como "[encoding]" em vez de serem gravados com U+FFFD.
+
+    Com `byte_range` (início, fim, linha física do início; ver split_csv_ranges)
+    só os registros dessa faixa são lidos."""
+
+    def __init__(self, csv_path: str, sep: str | None = None, encoding: str | None = None,
+                 byte_range: tuple[int, int, int] | None = None, bad_lines_path: str | None = None):
+        self.sep, self.encoding = sniff_csv(csv_path, sep, encoding)
+        self._f = open(csv_path, "rb")
+        self._lines = _LineSource(self._f, self.encoding)
+        self.header = next(self._csv_reader(), None) or []
+        missing = [c for c in ["codigo_produto", "descricao"] if c not in self.header]
+        if missing:
+            self._f.close()
+            raise SystemExit(f"CSV faltando colunas obrigatórias: {missing}")
+        self.data_start = self._lines.pos
+        if byte_range is not None:
+            start, end, first_line = byte_range
+            self._lines = _LineSource(self._f, self.encoding, start, end, first_line - 1)
+        self.columns = self.header + [c for c in EXPECTED_COLS if c not in self.header]
+        self.bad = BadLineReport(csv_path, self.sep, self.encoding, bad_lines_path)
+        self.rows = 0
+        self.done = False  # faixa (ou arquivo) lida até o fim
+
+    def _csv_reader(self):
+        return csv.reader(self._lines, delimiter=self.sep, quotechar='"', doublequote=True)
+
+    def __iter__(self):
+        expected = len(self.header)
+        defaults = dict.fromkeys(self.columns, "")
+        reader = self._csv_reader()
+        while True:
+            start = self._lines.lines + 1  # linha física onde o registro começa
+            self._lines.replaced.clear()
+            try:
+                row = next(reader)
+            except StopIteration:
+                self.done = True
+                return
+            except csv.Error as e:
+                self.bad.add(start, 0, expected, f"[csv] {e}")
+                continue
+            if not row:
+                continue  # linha em branco
+            if len(row) != expected:
+                self.bad.add(start, len(row), expected, self.sep.join(row))
+                continue
+            if self._lines.replaced:
+                self.bad.add(start, len(row), expected, f"[encoding {self.encoding}] {self.sep.join(row)}")
+                continue
+            self.rows += 1
+            yield {**defaults, **dict(zip(self.header, row))}
+
+    def close(self):
+        self._f.close()
+        self.bad.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def split_csv_ranges(csv_path: str, shards: int, sep: str,
+                     encoding: str) -> tuple[list[tuple[int, int, int]], list[set[str]]]:
+    """Divide os dados do CSV em até `shards` faixas de bytes de tamanho parecido.
+
+    Cada faixa começa e termina em fim de registro: como em count_csv_rows, o
+    arquivo é percorrido com csv.reader, então quebras de linha dentro de campos
+    entre aspas não viram fronteira. Retorna as faixas (início, fim, linha física
+    do início) e, para cada uma, os SKUs que reaparecem numa faixa posterior:
+    cada SKU é gravado só pelo shard da sua última ocorrência (vale a última
+    linha do arquivo, como sem shards, e dois shards nunca disputam o mesmo
+    produto)."""
+    size = os.path.getsize(csv_path)
+    with open(csv_path, "rb") as f:
+        lines = _LineSource(f, encoding)
+        reader = csv.reader(lines, delimiter=sep, quotechar='"', doublequote=True)
+        header = next(reader, None) or []
+        sku_col = header.index("codigo_produto") if "codigo_produto" in header else None
+        start = lines.pos
+        step = (size - start) / max(1, shards)
+        bounds = [(start, lines.lines + 1)]
+        later: list[set[str]] = [set()]
+        last_shard: dict[str, int] = {}
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                break
+            except csv.Error:
+                row = None  # a linha ruim é relatada pelo shard; aqui só importa a fronteira
+            shard = len(bounds) - 1
+            if row and sku_col is not None and len(row) == len(header):
+                sku = normalize_sku(row[sku_col])
+                if sku:
+                    prev = last_shard.get(sku)
+                    if prev is not None and prev != shard:
+                        later[prev].add(sku)
+                    last_shard[sku] = shard
+            if len(bounds) < shards and start + step * len(bounds) <= lines.pos < size:
+                bounds.append((lines.pos, lines.lines + 1))
+                later.append(set())
+    ends = [b for b, _ in bounds[1:]] + [size]
+    keep = [i for i, ((b, _), e) in enumerate(zip(bounds, ends)) if b < e]
+    return [(bounds[i][0], ends[i], bounds[i][1]) for i in keep], [later[i] for i in keep]
 
 # ---------- Utils ----------
 def parse_decimal_br(x: str | float | int | None) -> Decimal | None:
@@ -165,13 +307,21 @@ def norm_str(x):
         return ""
     return str(x).strip()
 
-def chunk_by_tokens(text: str, max_tokens: int = MAX_TOKENS_PER_CHUNK):
+def normalize_sku(x) -> str:
+    # Normaliza SKU removendo pontos (ex.: "353.3" -> "3533")
+    return norm_str(x).replace(".", "").strip()
+
+def split_by_tokens(text: str, max_tokens: int = MAX_TOKENS_PER_CHUNK) -> list[tuple[str, int]]:
+    """Como chunk_by_tokens, com a contagem de tokens de cada chunk."""
     toks = enc.encode(text)
     chunks = []
     for i in range(0, len(toks), max_tokens):
-        sub = enc.decode(toks[i:i+max_tokens])
-        chunks.append(sub)
-    return chunks or [""]
+        sub = toks[i:i+max_tokens]
+        chunks.append((enc.decode(sub), len(sub)))
+    return chunks or [("", 0)]
+
+def chunk_by_tokens(text: str, max_tokens: int = MAX_TOKENS_PER_CHUNK):
+    return [c for c, _ in split_by_tokens(text, max_tokens)]
 
 def build_product_text(row):
     # Texto que será embedado: nome + tipo + descrição técnica
@@ -186,39 +336,257 @@ def build_product_text(row):
     meta = f"\nSKU: {sku}" + (f" | EAN: {ean}" if ean else "")
     return (base + meta).strip()
 
+def content_hash(text: str) -> str:
+    """Hash do texto embedado + modelo/dimensão: muda se qualquer um mudar (rag.products.content_hash)."""
+    p = get_provider()
+    return hashlib.sha256(f"{p.model}\n{p.dim}\n{text}".encode("utf-8")).hexdigest()
+
 def to_pgvector(vec):
     # pgvector literal: [v1,v2,...]
     return "[" + ",".join(f"{float(x):.7f}" for x in vec) + "]"
 
 def get_embeddings(texts: list[str]) -> list[list[float]]:
-    # chama em lote
-    resp = client.embeddings.create(model=EMB_MODEL, input=texts)
-    embs = [d.embedding for d in resp.data]
-    # sanity check
-    for e in embs:
-        if len(e) != EMB_DIM:
-            raise RuntimeError(f"Embedding dim {len(e)} != {EMB_DIM}")
-    return embs
+    # chama em lote; o provedor confere a dimensão (EMB_DIM)
+    return get_provider().embed(texts)
+
+def embed_chunks(texts: list[str]) -> list[list[float]]:
+    # Quebra em sublotes por BATCH_SIZE (só um produto maior que o lote chega aqui com mais)
+    embeddings = []
+    for i in range(0, len(texts), BATCH_SIZE):
+        embeddings.extend(get_embeddings(texts[i:i+BATCH_SIZE]))
+    return embeddings
+
+def _retry_delay(e: Exception, attempt: int) -> float | None:
+    """Espera antes da próxima tentativa, ou None se o erro não é transitório."""
+    status = getattr(e, "status_code", None)
+    transient = (status == 429 or (status is not None and status >= 500)
+                 or type(e).__name__ in ("RateLimitError", "APIConnectionError", "APITimeoutError"))
+    if not transient:
+        return None
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        hinted = float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        hinted = 0.0
+    # backoff exponencial com jitter, respeitando o Retry-After da API
+    backoff = min(EMB_RETRY_CAP, EMB_RETRY_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+    return max(hinted, backoff)
+
+class RateLimitGate:
+    """Pausa compartilhada pelos workers: um 429 segura todas as chamadas, não só a que falhou."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+
+    def wait(self):
+        while True:
+            with self._lock:
+                delay = self._resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def hold(self, seconds: float):
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+def embed_with_retry(texts: list[str], gate: RateLimitGate) -> list[list[float]]:
+    for attempt in range(EMB_RETRY_MAX + 1):
+        gate.wait()
+        try:
+            return embed_chunks(texts)
+        except Exception as e:
+            delay = _retry_delay(e, attempt)
+            if delay is None or attempt == EMB_RETRY_MAX:
+                raise
+            gate.hold(delay)
+            tqdm.write(f"Embeddings: {type(e).__name__}; nova tentativa em {delay:.1f}s")
+
+class ChunkEmbeddingCache:
+    """Cache de embeddings de chunks em rag.embedding_cache, chave = content_hash(texto).
+
+    Cada worker usa a própria conexão (autocommit): vetores gravados valem
+    mesmo que a carga seja desfeita, pois a chave já identifica modelo e texto."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._cons = []
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def _cursor(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = connect_db()
+            con.autocommit = True
+            self._local.con = con
+            with self._lock:
+                self._cons.append(con)
+        return con.cursor()
+
+    def get(self, keys: list[str]) -> dict[str, list[float]]:
+        if not keys:
+            return {}
+        with self._cursor() as cur:
+            cur.execute("SELECT key, embedding::text FROM rag.embedding_cache WHERE key = ANY(%s);", (keys,))
+            found = {k: json.loads(v) for k, v in cur.fetchall()}
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, keys: list[str], embeddings: list[list[float]]):
+        if not keys:
+            return
+        model = get_provider().model
+        # chaves em ordem: workers/shards gravando as mesmas chaves não se travam (deadlock)
+        rows = sorted((k, model, to_pgvector(e)) for k, e in zip(keys, embeddings))
+        with self._cursor() as cur:
+            execute_values(
+                cur,
+                "INSERT INTO rag.embedding_cache (key, model, embedding) VALUES %s ON CONFLICT (key) DO NOTHING",
+                rows,
+                template="(%s, %s, %s::vector)",
+                page_size=BATCH_SIZE,
+            )
+
+    def close(self):
+        with self._lock:
+            for con in self._cons:
+                con.close()
+            self._cons.clear()
+
+def embed_cached(texts: list[str], gate: RateLimitGate, cache: ChunkEmbeddingCache | None = None) -> list[list[float]]:
+    """Embeddings na ordem de `texts`; textos iguais (no lote ou já no cache) não vão à API."""
+    if not texts:
+        return []
+    keys = [content_hash(t) for t in texts]
+    unique = dict(zip(keys, texts))
+    known = cache.get(list(unique)) if cache is not None else {}
+    todo = [k for k in unique if k not in known]
+    if todo:
+        fresh = embed_with_retry([unique[k] for k in todo], gate)
+        if cache is not None:
+            cache.put(todo, fresh)
+        known.update(zip(todo, fresh))
+    return [known[k] for k in keys]
+
+# ---------- Lotes entre produtos ----------
+@dataclass
+class PendingProduct:
+    """Linha do CSV pronta para gravar: parâmetros do upsert + chunks a embedar.
+
+    `unchanged` (modo delta): mesmo content_hash já gravado; só as colunas
+    escalares são atualizadas e não há chunks."""
+    row: dict
+    text: str
+    chunks: list[str] = field(default_factory=list)
+    tokens: int = 0
+    unchanged: bool = False
+    seq: int = 0  # posição do registro no CSV (base 1): offset do checkpoint
+
+def prepare_product(r, columns) -> PendingProduct | None:
+    sku = normalize_sku(r["codigo_produto"])
+    if not sku:
+        return None  # ignora linhas sem código
+
+    # preço e preço promocional não são mais ingeridos; saem também do dump bruto
+    raw_filtered = {k: norm_str(r.get(k)) for k in columns if k not in ("preco", "preco_promocional")}
+    text = build_product_text(r)
+    row_dict = {
+        "sku": sku,
+        "name": norm_str(r["descricao"]),
+        "description": norm_str(r["descricao_tecnica"]),
+        "codigo_barras": norm_str(r["codigo_barras"]),
+        "tipo": norm_str(r["tipo"]),
+        "um": norm_str(r["um"]),
+        "qtde_cx": norm_str(r["qtde_cx"]),
+        "estoque": parse_decimal_br(r["estoque"]),
+        "raw": json.dumps(raw_filtered, ensure_ascii=False),
+        "content_hash": content_hash(text),
+    }
+    return PendingProduct(row_dict, text)
+
+def mark_unchanged(products, con, window: int = DELTA_LOOKUP):
+    """Modo delta: marca `unchanged` nos produtos cujo content_hash já está gravado.
+
+    Consulta os hashes em janelas de `window` SKUs numa conexão própria (só leitura)."""
+    buf = []
+
+    def lookup():
+        with con.cursor() as cur:
+            cur.execute("SELECT sku, content_hash FROM rag.products WHERE sku = ANY(%s);",
+                        ([p.row["sku"] for p in buf],))
+            stored = dict(cur.fetchall())
+        for p in buf:
+            p.unchanged = stored.get(p.row["sku"]) == p.row["content_hash"]
+        return buf
+
+    for p in products:
+        buf.append(p)
+        if len(buf) >= window:
+            yield from lookup()
+            buf = []
+    if buf:
+        yield from lookup()
+
+def chunk_products(products):
+    """Chunking (tiktoken) só dos produtos que vão ser embedados."""
+    for p in products:
+        if not p.unchanged:
+            split = split_by_tokens(p.text, MAX_TOKENS_PER_CHUNK)
+            p.chunks = [c for c, _ in split]
+            p.tokens = sum(n for _, n in split)
+        yield p
+
+def batch_products(products, max_items: int = BATCH_SIZE, max_tokens: int = EMB_BATCH_TOKENS):
+    """Agrupa produtos em lotes de até `max_items` chunks e `max_tokens` tokens.
+
+    Os chunks de um produto ficam sempre no mesmo lote; um produto que sozinho
+    passa dos limites forma um lote próprio. Produto inalterado (delta) conta
+    como um item, para o lote não crescer sem limite."""
+    batch, items, tokens = [], 0, 0
+    for p in products:
+        n = len(p.chunks) or 1
+        if batch and (items + n > max_items or tokens + p.tokens > max_tokens):
+            yield batch
+            batch, items, tokens = [], 0, 0
+        batch.append(p)
+        items += n
+        tokens += p.tokens
+    if batch:
+        yield batch
 
 # ---------- DB ----------
 UPSERT_PRODUCT_SQL = """
 INSERT INTO rag.products
-(sku, name, description, codigo_barras, tipo, um, qtde_cx, estoque, raw)
+(sku, name, description, name_norm, description_norm, codigo_barras, tipo, um, qtde_cx, estoque, raw, content_hash)
 VALUES
-(%(sku)s, %(name)s, %(description)s, %(codigo_barras)s, %(tipo)s, %(um)s, %(qtde_cx)s, %(estoque)s, %(raw)s)
+(%(sku)s, %(name)s, %(description)s, rag.normalize_text(%(name)s), rag.normalize_text(%(description)s),
+ %(codigo_barras)s, %(tipo)s, %(um)s, %(qtde_cx)s, %(estoque)s, %(raw)s, %(content_hash)s)
 ON CONFLICT (sku) DO UPDATE SET
   name = EXCLUDED.name,
   description = EXCLUDED.description,
+  name_norm = EXCLUDED.name_norm,
+  description_norm = EXCLUDED.description_norm,
   codigo_barras = EXCLUDED.codigo_barras,
   tipo = EXCLUDED.tipo,
   um = EXCLUDED.um,
   qtde_cx = EXCLUDED.qtde_cx,
   estoque = EXCLUDED.estoque,
-  raw = EXCLUDED.raw
+  raw = EXCLUDED.raw,
+  content_hash = EXCLUDED.content_hash
 RETURNING id;
 """
 
-DELETE_CHUNKS_SQL = "DELETE FROM rag.product_chunks WHERE product_id = %s;"
+# modo delta: texto inalterado, só as colunas fora de build_product_text
+UPDATE_SCALARS_SQL = """
+UPDATE rag.products SET um = %(um)s, qtde_cx = %(qtde_cx)s, estoque = %(estoque)s, raw = %(raw)s
+WHERE sku = %(sku)s;
+"""
+
+DELETE_CHUNKS_SQL = "DELETE FROM rag.product_chunks WHERE product_id = ANY(%s);"
 
 INSERT_CHUNKS_SQL_TEMPLATE = """
 INSERT INTO rag.product_chunks (product_id, chunk_no, content, embedding)
@@ -229,135 +597,602 @@ def upsert_product(cur, row_dict) -> int:
     cur.execute(UPSERT_PRODUCT_SQL, row_dict)
     return cur.fetchone()[0]
 
-def insert_chunks(cur, product_id: int, chunk_texts: list[str]):
-    # Apaga chunks antigos para este produto (idempotência)
-    cur.execute(DELETE_CHUNKS_SQL, (product_id,))
-
-    # Embeddings em lote
-    # Quebra em sublotes por BATCH_SIZE
-    embeddings = []
-    for i in range(0, len(chunk_texts), BATCH_SIZE):
-        batch = chunk_texts[i:i+BATCH_SIZE]
-        embeddings.extend(get_embeddings(batch))
+def insert_chunks(cur, product_ids: list[int], chunk_texts: list[list[str]], embeddings: list[list[float]]):
+    """Substitui os chunks dos produtos: `chunk_texts[i]` pertence a `product_ids[i]`
+    e `embeddings` segue a ordem dos chunks achatados."""
+    # Apaga chunks antigos destes produtos (idempotência)
+    cur.execute(DELETE_CHUNKS_SQL, (product_ids,))
 
     # Monta registros e insere com execute_values
     records = []
-    for idx, (ct, emb) in enumerate(zip(chunk_texts, embeddings), start=1):
-        records.append((
-            product_id,
-            idx,
-            ct,
-            to_pgvector(emb)  # será convertido via ::vector no template
-        ))
+    vectors = iter(embeddings)
+    for product_id, texts in zip(product_ids, chunk_texts):
+        for idx, ct in enumerate(texts, start=1):
+            records.append((
+                product_id,
+                idx,
+                ct,
+                to_pgvector(next(vectors))  # será convertido via ::vector no template
+            ))
     execute_values(
         cur,
         INSERT_CHUNKS_SQL_TEMPLATE,
         records,
-        template="(%s,%s,%s,%s::vector)"
+        template="(%s,%s,%s,%s::vector)",
+        page_size=1000,
     )
 
-def main(csv_path: str, limit: int | None = None, sep: str | None = None, encoding: str | None = None):
-    assert OPENAI_API_KEY, "Configure OPENAI_API_KEY no .env"
-
-    # Lê CSV de forma robusta
-    df, info = read_csv_safely(csv_path, sep_override=sep, encoding_override=encoding, report=True)
-
-    # Relatório de linhas problemáticas
-    problems = info.get("problems", [])
-    bad_count = len([p for p in problems if p[0] != 0])
-    if bad_count:
-        report_path = f"{csv_path}.bad_lines.txt"
-        with open(report_path, "w", encoding="utf-8") as rf:
-            rf.write(f"CSV: {csv_path}\n")
-            rf.write(f"sep='{info['sep']}', encoding='{info['encoding']}', engine='{info['engine']}', tolerant={info['tolerant']}\n\n")
-            rf.write("Linhas problemáticas (linha, cols_encontradas, cols_esperadas, trecho):\n")
-            for ln, found, expected, snippet in problems:
-                if ln == 0:  # erro geral
-                    rf.write(f"[diagnóstico] {snippet}\n")
+def embed_batch(batch: list[PendingProduct], gate: RateLimitGate, cache: ChunkEmbeddingCache | None = None):
+    """Etapa de embeddings: (produtos a gravar, embeddings, linhas do CSV consumidas)."""
+    # SKU repetido no lote: vale a última linha, como no processamento linha a linha
+    unique = list({p.row["sku"]: p for p in batch}.values())
+    embeddings = embed_cached([c for p in unique for c in p.chunks], gate, cache)
+    return unique, embeddings, len(batch)
+
+def write_batch(cur, batch: list[PendingProduct], embeddings: list[list[float]]) -> int:
+    """Grava produtos e chunks de um lote já embedado; retorna nº de chunks."""
+    unchanged = [p.row for p in batch if p.unchanged]
+    if unchanged:
+        execute_batch(cur, UPDATE_SCALARS_SQL, unchanged, page_size=500)
+    changed = [p for p in batch if not p.unchanged]
+    if changed:
+        product_ids = [upsert_product(cur, p.row) for p in changed]
+        insert_chunks(cur, product_ids, [p.chunks for p in changed], embeddings)
+    return len(embeddings)
+
+class RowWriter:
+    """Gravação padrão: upsert por produto (RETURNING id) e chunks com execute_values."""
+
+    def __init__(self, cur):
+        self.cur = cur
+
+    def write(self, batch: list[PendingProduct], embeddings: list[list[float]]):
+        write_batch(self.cur, batch, embeddings)
+
+    def flush(self):
+        pass
+
+# ---------- Modo bulk (COPY + merge) ----------
+STAGE_TABLES_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS ingest_stage_products (
+  sku text, name text, description text, codigo_barras text, tipo text,
+  um text, qtde_cx text, estoque numeric, raw jsonb, content_hash text
+);
+CREATE TEMP TABLE IF NOT EXISTS ingest_stage_chunks (
+  sku text, chunk_no int, content text, embedding vector
+);
+"""
+
+STAGE_PRODUCT_COLS = ("sku", "name", "description", "codigo_barras", "tipo", "um", "qtde_cx", "estoque", "raw",
+                      "content_hash")
+
+COPY_STAGE_PRODUCTS_SQL = (f"COPY ingest_stage_products ({', '.join(STAGE_PRODUCT_COLS)}) "
+                           "FROM STDIN WITH (FORMAT csv, NULL '\\N')")
+COPY_STAGE_CHUNKS_SQL = "COPY ingest_stage_chunks (sku, chunk_no, content, embedding) FROM STDIN WITH (FORMAT binary)"
+
+MERGE_PRODUCTS_SQL = """
+INSERT INTO rag.products
+(sku, name, description, name_norm, description_norm, codigo_barras, tipo, um, qtde_cx, estoque, raw, content_hash)
+SELECT sku, name, description, rag.normalize_text(name), rag.normalize_text(description),
+       codigo_barras, tipo, um, qtde_cx, estoque, raw, content_hash
+FROM ingest_stage_products
+ON CONFLICT (sku) DO UPDATE SET
+  name = EXCLUDED.name,
+  description = EXCLUDED.description,
+  name_norm = EXCLUDED.name_norm,
+  description_norm = EXCLUDED.description_norm,
+  codigo_barras = EXCLUDED.codigo_barras,
+  tipo = EXCLUDED.tipo,
+  um = EXCLUDED.um,
+  qtde_cx = EXCLUDED.qtde_cx,
+  estoque = EXCLUDED.estoque,
+  raw = EXCLUDED.raw,
+  content_hash = EXCLUDED.content_hash;
+"""
+
+# só os SKUs com chunks no stage (produtos inalterados no modo delta não têm)
+REPLACE_CHUNKS_SQL = """
+DELETE FROM rag.product_chunks c
+USING (SELECT DISTINCT sku FROM ingest_stage_chunks) s JOIN rag.products p ON p.sku = s.sku
+WHERE c.product_id = p.id;
+INSERT INTO rag.product_chunks (product_id, chunk_no, content, embedding)
+SELECT p.id, s.chunk_no, s.content, s.embedding
+FROM ingest_stage_chunks s JOIN rag.products p ON p.sku = s.sku;
+"""
+
+_PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_PGCOPY_TRAILER = struct.pack("!h", -1)
+
+def _copy_text(s: str) -> bytes:
+    b = s.encode("utf-8")
+    return struct.pack("!i", len(b)) + b
+
+def binary_chunk_row(sku: str, chunk_no: int, content: str, embedding: list[float]) -> bytes:
+    """Tupla do COPY binário de ingest_stage_chunks (text, int4, text, vector).
+
+    vector no formato de envio do pgvector: dim (int16), reservado (int16), float4[]."""
+    vec = struct.pack(f"!hh{len(embedding)}f", len(embedding), 0, *embedding)
+    return b"".join((struct.pack("!h", 4), _copy_text(sku), struct.pack("!ii", 4, chunk_no),
+                     _copy_text(content), struct.pack("!i", len(vec)), vec))
+
+class CopyWriter:
+    """Modo bulk: acumula até `max_rows` produtos e grava com COPY em tabelas
+    temporárias + um merge em rag.products e uma troca de chunks por conjunto.
+
+    Produtos vão em COPY csv (jsonb/numeric como texto); chunks em COPY binário
+    (sem formatar vetores como texto). Os embeddings viram bytes já no
+    `write()`, para o acúmulo não guardar listas de floats."""
+
+    def __init__(self, cur, max_rows: int = BULK_ROWS):
+        self.cur = cur
+        self.max_rows = max(1, max_rows)
+        cur.execute(STAGE_TABLES_SQL)
+        self._reset()
+
+    def _reset(self):
+        self.skus: set[str] = set()
+        self._products = io.StringIO()
+        self._products_csv = csv.writer(self._products)
+        self._chunks = io.BytesIO()
+        self._chunks.write(_PGCOPY_HEADER)
+
+    def write(self, batch: list[PendingProduct], embeddings: list[list[float]]):
+        vectors = iter(embeddings)
+        for p in batch:
+            row = p.row
+            # SKU já pendente: grava o acumulado antes (a última linha vence, como no modo padrão)
+            if row["sku"] in self.skus:
+                self.flush()
+            self.skus.add(row["sku"])
+            self._products_csv.writerow(["\\N" if row[c] is None else row[c] for c in STAGE_PRODUCT_COLS])
+            for idx, ct in enumerate(p.chunks, start=1):
+                self._chunks.write(binary_chunk_row(row["sku"], idx, ct, next(vectors)))
+        if len(self.skus) >= self.max_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.skus:
+            return
+        cur = self.cur
+        self._products.seek(0)
+        cur.copy_expert(COPY_STAGE_PRODUCTS_SQL, self._products)
+        self._chunks.write(_PGCOPY_TRAILER)
+        self._chunks.seek(0)
+        cur.copy_expert(COPY_STAGE_CHUNKS_SQL, self._chunks)
+        cur.execute("ANALYZE ingest_stage_products; ANALYZE ingest_stage_chunks;")  # planos do merge/join
+        cur.execute(MERGE_PRODUCTS_SQL)
+        cur.execute(REPLACE_CHUNKS_SQL)
+        cur.execute("TRUNCATE ingest_stage_products, ingest_stage_chunks;")
+        self._reset()
+
+def delete_missing_products(cur, feed_skus: set[str], max_ratio: float = DELETE_MISSING_MAX_RATIO) -> int:
+    """Remove produtos (e seus chunks) cujo SKU não veio no arquivo; retorna quantos.
+
+    Não remove nada se a remoção passar de `max_ratio` do catálogo (arquivo
+    truncado ou de outra origem)."""
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS ingest_feed_skus (sku text PRIMARY KEY);"
+                "TRUNCATE ingest_feed_skus;")
+    buf = io.StringIO()
+    csv.writer(buf).writerows([s] for s in feed_skus)
+    buf.seek(0)
+    cur.copy_expert("COPY ingest_feed_skus (sku) FROM STDIN WITH (FORMAT csv)", buf)
+    cur.execute("ANALYZE ingest_feed_skus;")
+    cur.execute("""
+        SELECT count(*), count(*) FILTER (WHERE f.sku IS NULL)
+        FROM rag.products p LEFT JOIN ingest_feed_skus f ON f.sku = p.sku;
+    """)
+    total, missing = cur.fetchone()
+    if missing and missing > max_ratio * total:
+        print(f"--delete-missing: {missing} de {total} produtos fora do arquivo (> {max_ratio:.0%}); nada removido")
+        return 0
+    cur.execute("""
+        DELETE FROM rag.product_chunks c USING rag.products p
+        WHERE c.product_id = p.id AND NOT EXISTS (SELECT 1 FROM ingest_feed_skus f WHERE f.sku = p.sku);
+    """)
+    cur.execute("""
+        DELETE FROM rag.products p
+        WHERE NOT EXISTS (SELECT 1 FROM ingest_feed_skus f WHERE f.sku = p.sku);
+    """)
+    return cur.rowcount
+
+# ---------- Checkpoint (retomada) ----------
+def file_identity(csv_path: str, sample_bytes: int = CSV_SNIFF_BYTES) -> tuple[str, int]:
+    """(chave, tamanho) do arquivo: sha256 do tamanho + início + fim, sem ler o arquivo inteiro."""
+    size = os.path.getsize(csv_path)
+    h = hashlib.sha256(str(size).encode())
+    with open(csv_path, "rb") as f:
+        h.update(f.read(sample_bytes))
+        f.seek(max(0, size - sample_bytes))
+        h.update(f.read(sample_bytes))
+    return h.hexdigest(), size
+
+@dataclass
+class Checkpoint:
+    """Progresso confirmado de uma carga (rag.ingest_checkpoints)."""
+    key: str
+    file_name: str
+    file_size: int
+    records: int = 0
+    products: int = 0
+    chunks: int = 0
+    unchanged: int = 0
+    done: bool = False
+
+    @classmethod
+    def load(cls, cur, csv_path: str, restart: bool = False, shard: str = "") -> "Checkpoint":
+        """Checkpoint do arquivo (ou do shard, ex. "2/4") para retomar; zerado se não houver,
+        se a carga terminou ou com `restart`."""
+        key, size = file_identity(csv_path)
+        name = os.path.basename(csv_path)
+        cp = cls(f"{key}:{shard}", f"{name} [{shard}]", size) if shard else cls(key, name, size)
+        if restart:
+            return cp
+        cur.execute("SELECT records, products, chunks, unchanged, done FROM rag.ingest_checkpoints "
+                    "WHERE file_key = %s;", (cp.key,))
+        row = cur.fetchone()
+        if row is None or row[4]:
+            return cp
+        cp.records, cp.products, cp.chunks, cp.unchanged = row[:4]
+        return cp
+
+    def save(self, cur, fresh: bool = False):
+        """Grava o progresso (na transação de `cur`); `fresh` marca o início de uma nova carga."""
+        cur.execute("""
+            INSERT INTO rag.ingest_checkpoints (file_key, file_name, file_size, records, products, chunks, unchanged, done)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (file_key) DO UPDATE SET
+              file_name = EXCLUDED.file_name,
+              records = EXCLUDED.records,
+              products = EXCLUDED.products,
+              chunks = EXCLUDED.chunks,
+              unchanged = EXCLUDED.unchanged,
+              done = EXCLUDED.done,
+              started_at = CASE WHEN %s THEN now() ELSE rag.ingest_checkpoints.started_at END,
+              updated_at = now();
+        """, (self.key, self.file_name, self.file_size, self.records, self.products, self.chunks,
+              self.unchanged, self.done, fresh))
+
+# ---------- Pipeline ----------
+_DONE = object()
+
+def run_pipeline(writer, products, concurrency: int = INGEST_CONCURRENCY, progress=None,
+                 cache: ChunkEmbeddingCache | None = None, on_write=None) -> tuple[int, int]:
+    """leitura/chunking (thread) -> fila limitada -> embeddings em paralelo -> gravação em ordem.
+
+    A gravação roda nesta thread, na ordem do CSV, enquanto até `concurrency`
+    chamadas de embeddings seguem em voo. Fila e janela de lotes pendentes têm
+    tamanho 2 * concurrency: com a API ou o banco lentos, a leitura espera em vez
+    de acumular o arquivo em memória. `on_write(lote, chunks, linhas)` roda após
+    cada lote gravado (commits periódicos). Retorna (linhas gravadas, chunks)."""
+    concurrency = max(1, concurrency)
+    window = 2 * concurrency
+    gate = RateLimitGate()
+    batches: queue.Queue = queue.Queue(maxsize=window)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def read():
+        try:
+            for batch in batch_products(products):
+                put(batch)
+                if stop.is_set():
+                    return
+            put(_DONE)
+        except BaseException as e:  # erro de leitura/chunking sobe na thread de gravação
+            put(e)
+
+    threading.Thread(target=read, name="ingest-reader", daemon=True).start()
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ingest-embed")
+    inflight = deque()
+    rows = chunks = 0
+    try:
+        done = False
+        while not done or inflight:
+            # completa a janela sem travar a gravação de um lote já pronto
+            while not done and len(inflight) < window:
+                try:
+                    item = batches.get(block=not inflight)
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    done = True
+                elif isinstance(item, BaseException):
+                    raise item
                 else:
-                    rf.write(f"{ln}\t{found}\t{expected}\t{snippet}\n")
-        # Mostra um resumo curto no console
-        preview = ", ".join(str(p[0]) for p in problems[:10] if p[0] != 0)
-        print(f"Linhas problemáticas detectadas: {bad_count}. Amostra: {preview or 'n/d'}. Relatório: {report_path}")
+                    inflight.append(pool.submit(embed_batch, item, gate, cache))
+            if inflight:
+                batch, embeddings, n = inflight.popleft().result()
+                writer.write(batch, embeddings)
+                chunks += len(embeddings)
+                rows += n
+                if on_write is not None:
+                    on_write(batch, len(embeddings), n)
+                if progress is not None:
+                    progress.update(n)
+        writer.flush()
+    finally:
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+    return rows, chunks
+
+@dataclass
+class IngestStats:
+    """Resultado de uma carga (ou de um shard); somado entre shards com `merge`."""
+    rows: int = 0          # registros válidos lidos do CSV
+    products: int = 0      # totais do checkpoint (incluem o que veio antes da retomada)
+    chunks: int = 0
+    unchanged: int = 0
+    duplicates: int = 0    # linhas com SKU repetido no lote (mescladas num só upsert), nesta execução
+    cache_hits: int = 0
+    cache_misses: int = 0
+    resumed: bool = False
+    done: bool = True
+    skus: set[str] = field(default_factory=set)
+
+    def merge(self, other: "IngestStats"):
+        for name in ("rows", "products", "chunks", "unchanged", "duplicates", "cache_hits", "cache_misses"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.resumed |= other.resumed
+        self.done &= other.done
+        self.skus |= other.skus
+
+def ingest_source(source: CsvRecords, csv_path: str, shard: str = "", limit: int | None = None,
+                  concurrency: int = INGEST_CONCURRENCY, bulk: bool = INGEST_BULK, delta: bool = INGEST_DELTA,
+                  emb_cache: bool = INGEST_EMB_CACHE, commit_every: int = INGEST_COMMIT_EVERY,
+                  restart: bool = False, keep_skus: bool = False, progress=None,
+                  skip_skus: set[str] = frozenset()) -> IngestStats:
+    """Grava os registros de `source` com commits + checkpoint a cada `commit_every` produtos.
+
+    Retoma do checkpoint de `csv_path`/`shard` se a carga anterior não terminou.
+    Com `keep_skus`, devolve os SKUs lidos (para o --delete-missing). SKUs em
+    `skip_skus` ficam para outro shard (ver split_csv_ranges)."""
+    stats = IngestStats()
+    since_commit = 0
 
-    missing = [c for c in ["codigo_produto","descricao"] if c not in df.columns]
-    if missing:
-        raise SystemExit(f"CSV faltando colunas obrigatórias: {missing}")
+    def prepared(records):
+        for seq, r in records:
+            p = prepare_product(r, source.columns)
+            if p is not None and p.row["sku"] not in skip_skus:
+                p.seq = seq
+                if keep_skus:
+                    stats.skus.add(p.row["sku"])
+                yield p
 
-    # Garante todas as colunas esperadas (se não existir, cria vazia)
-    for c in EXPECTED_COLS:
-        if c not in df.columns:
-            df[c] = ""
+    # delta: hashes consultados em conexão própria, fora da transação de gravação
+    lookup_con = connect_db() if delta else None
+    cache = ChunkEmbeddingCache() if emb_cache else None
+    try:
+        if lookup_con is not None:
+            lookup_con.autocommit = True
+        with connect_db() as con:
+            con.autocommit = False
+            with con.cursor() as cur:
+                # retoma do último checkpoint confirmado deste arquivo (se a carga anterior não terminou)
+                cp = Checkpoint.load(cur, csv_path, restart=restart, shard=shard)
+                resumed_from = cp.records
+                if resumed_from:
+                    print(f"{cp.file_name}: retomando do registro {resumed_from} "
+                          f"(checkpoint: {cp.products} produtos, {cp.chunks} chunks)")
+                cp.save(cur, fresh=not resumed_from)
+                con.commit()
+
+                records = enumerate(itertools.islice(source, resumed_from, None), start=resumed_from + 1)
+                if limit is not None and limit > 0:
+                    records = itertools.islice(records, limit)
+
+                writer = CopyWriter(cur) if bulk else RowWriter(cur)
+
+                def on_write(batch, n_chunks, n):
+                    # commit a cada `commit_every` produtos, com o checkpoint na mesma transação;
+                    # `batch` já vem sem SKUs repetidos (embed_batch): conta upserts, não linhas
+                    nonlocal since_commit
+                    cp.records = max(cp.records, max(p.seq for p in batch))
+                    cp.products += len(batch)
+                    cp.chunks += n_chunks
+                    cp.unchanged += sum(p.unchanged for p in batch)
+                    stats.duplicates += n - len(batch)
+                    since_commit += len(batch)
+                    if since_commit >= commit_every:
+                        writer.flush()
+                        cp.save(cur)
+                        bump_catalog_version(cur)
+                        con.commit()
+                        since_commit = 0
+
+                # chunks de vários produtos por chamada de embeddings (BATCH_SIZE / EMB_BATCH_TOKENS),
+                # até `concurrency` chamadas em paralelo com a gravação
+                products = prepared(records)
+                if lookup_con is not None:
+                    products = mark_unchanged(products, lookup_con)
+                products = chunk_products(products)
+                run_pipeline(writer, products, concurrency, progress=progress, cache=cache, on_write=on_write)
+
+                cp.done = source.done
+                if cp.done:
+                    cp.records = source.rows  # inclui os registros pulados na retomada
+                cp.save(cur)
+                # avisa os processos de busca (snapshots/caches) junto com o commit
+                bump_catalog_version(cur)
+            con.commit()
+    finally:
+        source.close()
+        if lookup_con is not None:
+            lookup_con.close()
+        if cache is not None:
+            cache.close()
+
+    stats.rows, stats.products, stats.chunks, stats.unchanged = source.rows, cp.products, cp.chunks, cp.unchanged
+    if cache is not None:
+        stats.cache_hits, stats.cache_misses = cache.hits, cache.misses
+    stats.resumed, stats.done = bool(resumed_from), cp.done
+    return stats
+
+# ---------- Shards (multiprocesso) ----------
+_progress_queue = None
+
+def _init_shard_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
 
-    if limit is not None and limit > 0:
-        df = df.head(limit)
+class _QueueProgress:
+    """Progresso de um shard, somado pela barra do processo principal."""
 
-    # Aplica slice START/COUNT para processar um lote específico
-    if COUNT is not None and COUNT > 0:
-        start_idx = START or 0
-        end_idx = start_idx + COUNT
-        df = df.iloc[start_idx:end_idx]
+    def update(self, n: int):
+        _progress_queue.put(n)
 
-    total = len(df)
-    print(f"Linhas no CSV: {total}")
+def _ingest_shard(csv_path: str, sep: str, encoding: str, byte_range: tuple[int, int, int], shard: str,
+                  bad_lines_path: str, skip_skus: set[str], options: dict) -> IngestStats:
+    source = CsvRecords(csv_path, sep=sep, encoding=encoding, byte_range=byte_range,
+                        bad_lines_path=bad_lines_path)
+    return ingest_source(source, csv_path, shard=shard, progress=_QueueProgress(), skip_skus=skip_skus,
+                         **options)
 
+def ingest_sharded(csv_path: str, sep: str, encoding: str, workers: int, options: dict,
+                   bad: BadLineReport) -> IngestStats:
+    """Um processo por faixa do CSV (split_csv_ranges), cada um com suas conexões e
+    `concurrency / workers` chamadas de embeddings; progresso e relatórios somados aqui."""
+    ranges, later = split_csv_ranges(csv_path, workers, sep, encoding)
+    n = len(ranges)
+    options = {**options, "concurrency": max(1, options["concurrency"] // n)}
+    print(f"{n} shards, {options['concurrency']} chamada(s) de embeddings em paralelo por shard")
+    ctx = multiprocessing.get_context("spawn")
+    progress_queue = ctx.Queue()
+    stats = IngestStats()
+    parts = [f"{csv_path}.bad_lines.{i + 1}.txt" for i in range(n)]
+    with tqdm(desc="Processando", unit=" linhas") as bar, \
+            ProcessPoolExecutor(max_workers=n, mp_context=ctx, initializer=_init_shard_worker,
+                                initargs=(progress_queue,)) as pool:
+        futures = [pool.submit(_ingest_shard, csv_path, sep, encoding, r, f"{i + 1}/{n}", parts[i], later[i],
+                               options)
+                   for i, r in enumerate(ranges)]
+        pending = set(futures)
+        while pending:
+            try:
+                bar.update(progress_queue.get(timeout=0.5))
+            except queue.Empty:
+                pending = {f for f in pending if not f.done()}
+        while not progress_queue.empty():
+            bar.update(progress_queue.get())
+        errors = []
+        for fut in futures:
+            try:
+                stats.merge(fut.result())
+            except Exception as e:
+                errors.append(e)
+    for part in parts:  # em ordem de shard = em ordem de linha
+        bad.merge(part)
+    if errors:
+        raise errors[0]
+    return stats
+
+def finalize_ingest(stats: IngestStats, bad_count: int, delete_missing: bool,
+                    export_index: bool = bool(VECTOR_INDEX_PATH)) -> int:
+    """Pós-carga: --delete-missing (se a carga foi completa), ANALYZE e novo snapshot
+    vetorial (os commits da carga deixaram o anterior atrás do catálogo). Retorna os removidos."""
+    deleted = 0
     with connect_db() as con:
         con.autocommit = False
         with con.cursor() as cur:
-            upserted = 0
-            chunks_ins = 0
-
-            for _, r in tqdm(df.iterrows(), total=total, desc="Processando"):
-                sku = norm_str(r["codigo_produto"])
-                # Normaliza SKU removendo pontos (ex.: "353.3" -> "3533")
-                if sku:
-                    sku = sku.replace(".", "").strip()
-                if not sku:
-                    continue  # ignora linhas sem código
-
-                name = norm_str(r["descricao"])
-                desc = norm_str(r["descricao_tecnica"])
-                # preço não é mais ingerido
-                codigo_barras = norm_str(r["codigo_barras"])
-                tipo = norm_str(r["tipo"])
-                um = norm_str(r["um"])
-                qtde_cx = norm_str(r["qtde_cx"])
-                estoque = parse_decimal_br(r["estoque"])
-                # preço promocional não é mais ingerido
-
-                # remove campos de preço do dump bruto
-                raw_filtered = {k: norm_str(r.get(k)) for k in df.columns if k not in ("preco", "preco_promocional")}
-
-                row_dict = {
-                    "sku": sku,
-                    "name": name,
-                    "description": desc,
-                    "codigo_barras": codigo_barras,
-                    "tipo": tipo,
-                    "um": um,
-                    "qtde_cx": qtde_cx,
-                    "estoque": estoque,
-                    "raw": json.dumps(raw_filtered, ensure_ascii=False),
-                }
-
-                product_id = upsert_product(cur, row_dict)
-                upserted += 1
-
-                # chunking
-                text = build_product_text(r)
-                chunks = chunk_by_tokens(text, MAX_TOKENS_PER_CHUNK)
-                insert_chunks(cur, product_id, chunks)
-                chunks_ins += len(chunks)
-
+            if delete_missing:
+                if stats.resumed:
+                    print("--delete-missing ignorado: carga retomada (use --restart para uma carga completa)")
+                elif not stats.done:
+                    print("--delete-missing ignorado: o arquivo não foi lido até o fim")
+                elif bad_count:
+                    print("--delete-missing ignorado: o CSV tem linhas problemáticas (produtos podem ter ficado de fora)")
+                else:
+                    deleted = delete_missing_products(cur, stats.skus)
+                    if deleted:
+                        bump_catalog_version(cur)
+            con.commit()
             # otimiza planos de busca
             cur.execute("ANALYZE rag.products;")
             cur.execute("ANALYZE rag.product_chunks;")
         con.commit()
 
-    print(f"Upserts em products: {upserted}")
-    print(f"Chunks inseridos: {chunks_ins}")
+    if export_index and VECTOR_INDEX_PATH:
+        try:
+            meta = refresh_snapshot(VECTOR_INDEX_PATH)
+            print(f"Snapshot vetorial exportado: {meta['count']} chunks (versão {meta['catalog_version']})")
+        except Exception as e:  # dados já confirmados: a busca usa rag.search_vec até um novo export
+            print(f"Falha ao exportar o snapshot vetorial ({e}); rode: python vector_index.py export")
+    return deleted
+
+def main(csv_path: str, limit: int | None = None, sep: str | None = None, encoding: str | None = None,
+         concurrency: int = INGEST_CONCURRENCY, bulk: bool = INGEST_BULK, delta: bool = INGEST_DELTA,
+         delete_missing: bool = False, emb_cache: bool = INGEST_EMB_CACHE,
+         commit_every: int = INGEST_COMMIT_EVERY, restart: bool = False, workers: int = INGEST_WORKERS,
+         export_index: bool = bool(VECTOR_INDEX_PATH)):
+    get_provider()  # valida a configuração de embeddings (ex.: OPENAI_API_KEY)
+    if delete_missing and limit is not None and limit > 0:
+        raise SystemExit("--delete-missing exige o arquivo inteiro (sem --limit)")
+    if workers > 1 and limit is not None and limit > 0:
+        raise SystemExit("--limit não combina com --workers > 1")
+
+    options = {"concurrency": concurrency, "bulk": bulk, "delta": delta, "emb_cache": emb_cache,
+               "commit_every": commit_every, "restart": restart, "keep_skus": delete_missing}
+    # Leitura em streaming: o arquivo é lido uma vez, linha a linha, pela thread do pipeline
+    source = CsvRecords(csv_path, sep=sep, encoding=encoding)
+    print(f"CSV: sep='{source.sep}', encoding='{source.encoding}' (leitura em streaming)")
+    bad = source.bad
+    if workers > 1:
+        source.close()
+        stats = ingest_sharded(csv_path, source.sep, source.encoding, workers, options, bad)
+        bad.close()
+    else:
+        with tqdm(desc="Processando", unit=" linhas") as bar:
+            stats = ingest_source(source, csv_path, limit=limit, progress=bar, **options)
+    bad.summary()
+    deleted = finalize_ingest(stats, bad.count, delete_missing, export_index)
+
+    print(f"Linhas válidas lidas do CSV: {stats.rows}")
+    print(f"Upserts em products: {stats.products}")
+    if stats.duplicates:
+        print(f"Linhas com SKU repetido (mescladas no lote): {stats.duplicates}")
+    if delta:
+        print(f"Inalterados (só colunas escalares): {stats.unchanged}")
+    print(f"Chunks inseridos: {stats.chunks}")
+    if emb_cache:
+        print(f"Cache de embeddings: {stats.cache_hits} reaproveitados, {stats.cache_misses} novos")
+    if delete_missing:
+        print(f"Removidos (fora do arquivo): {deleted}")
+    if not stats.done:
+        print("Carga parcial; rode de novo para continuar (--restart recomeça)")
 
 if __name__ == "__main__":
-    # Execução por constantes internas (sem CLI)
-    # Para usar CLI no futuro, reative o bloco argparse acima.
-    main(CSV_PATH, limit=LIMIT, sep=SEP, encoding=ENCODING)
+    # Padrões nas constantes internas acima; as flags sobrescrevem
+    ap = argparse.ArgumentParser()
+    ap.add_argument("csv_path", nargs="?", default=CSV_PATH)
+    ap.add_argument("--limit", type=int, default=LIMIT)
+    ap.add_argument("--sep", default=SEP)
+    ap.add_argument("--encoding", default=ENCODING)
+    ap.add_argument("--concurrency", type=int, default=INGEST_CONCURRENCY,
+                    help="chamadas de embeddings em paralelo (INGEST_CONCURRENCY)")
+    ap.add_argument("--bulk", action=argparse.BooleanOptionalAction, default=INGEST_BULK,
+                    help="grava com COPY em tabelas temporárias + merge (INGEST_BULK)")
+    ap.add_argument("--delta", action=argparse.BooleanOptionalAction, default=INGEST_DELTA,
+                    help="só re-embeda produtos cujo texto mudou (content_hash; INGEST_DELTA)")
+    ap.add_argument("--delete-missing", action="store_true",
+                    help="remove produtos cujo SKU não está no arquivo (exige o arquivo inteiro)")
+    ap.add_argument("--emb-cache", action=argparse.BooleanOptionalAction, default=INGEST_EMB_CACHE,
+                    help="reaproveita embeddings de chunks já vistos (rag.embedding_cache; INGEST_EMB_CACHE)")
+    ap.add_argument("--commit-every", type=int, default=INGEST_COMMIT_EVERY,
+                    help="produtos por commit + checkpoint (INGEST_COMMIT_EVERY)")
+    ap.add_argument("--restart", action="store_true",
+                    help="ignora o checkpoint deste arquivo e recomeça do início")
+    ap.add_argument("--workers", type=int, default=INGEST_WORKERS,
+                    help="processos em paralelo, um por faixa do CSV (INGEST_WORKERS)")
+    ap.add_argument("--export-index", action=argparse.BooleanOptionalAction, default=bool(VECTOR_INDEX_PATH),
+                    help="re-exporta o snapshot vetorial ao final (padrão: se VECTOR_INDEX_PATH estiver definido)")
+    args = ap.parse_args()
+    main(args.csv_path, limit=args.limit, sep=args.sep, encoding=args.encoding, concurrency=args.concurrency,
+         bulk=args.bulk, delta=args.delta, delete_missing=args.delete_missing,
+         emb_cache=args.emb_cache, commit_every=args.commit_every, restart=args.restart,
+         workers=args.workers, export_index=args.export_index)
@@ -0,0 +1,139 @@
+# metrics.py
+"""Instrumentação leve do caminho quente (sem dependências externas).
+
+- Histogramas no formato de exposição do Prometheus (`render()` -> /metrics).
+- `timed(stage)`: mede uma etapa (context manager ou decorator), alimenta o
+  histograma `stage_duration_seconds{stage=...}` e a lista de tempos da
+  requisição corrente, usada no header `Server-Timing`.
+- `record_rows(stage, n)`: linhas devolvidas por etapa.
+
+A lista de tempos por requisição vive em um ContextVar; código que despacha
+trabalho para outras threads deve usar `contextvars.copy_context().run`.
+"""
+from __future__ import annotations
+
+import bisect
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+_NOT_TOKEN = re.compile(r"[^!#$%&'*+\-.^_`|~0-9A-Za-z]")  # token do RFC 7230 (nome no Server-Timing)
+
+
+def escape_label(value: object) -> str:
+    """Valor de rótulo no formato de exposição: barra invertida, aspas e quebra de linha escapadas."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+class Histogram:
+    """Histograma cumulativo com um rótulo (`stage`, `path`...)."""
+
+    def __init__(self, name: str, help_text: str, label: str, buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series: Dict[str, List[float]] = {}  # valor do rótulo -> [contagens..., soma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(label_value)
+            if s is None:
+                s = self._series[label_value] = [0.0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def snapshot(self) -> Dict[str, Tuple[List[float], float, float]]:
+        with self._lock:
+            return {k: (list(v[:-2]), v[-2], v[-1]) for k, v in self._series.items()}
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {_escape_help(self.help_text)}"
+        yield f"# TYPE {self.name} histogram"
+        for lv, (counts, total_sum, total) in sorted(self.snapshot().items()):
+            lv = escape_label(lv)
+            acc = 0.0
+            for le, c in zip(self.buckets, counts):
+                acc += c
+                yield f'{self.name}_bucket{{{self.label}="{lv}",le="{le:g}"}} {acc:g}'
+            yield f'{self.name}_bucket{{{self.label}="{lv}",le="+Inf"}} {total:g}'
+            yield f'{self.name}_sum{{{self.label}="{lv}"}} {total_sum:.6f}'
+            yield f'{self.name}_count{{{self.label}="{lv}"}} {total:g}'
+
+
+STAGE_SECONDS = Histogram("stage_duration_seconds", "Duração por etapa (busca, VTEX, tinta)", "stage",
+                          LATENCY_BUCKETS)
+STAGE_ROWS = Histogram("stage_rows", "Linhas devolvidas por etapa", "stage", ROW_BUCKETS)
+HTTP_SECONDS = Histogram("http_request_duration_seconds", "Duração das requisições HTTP", "path",
+                         LATENCY_BUCKETS)
+HISTOGRAMS = [STAGE_SECONDS, STAGE_ROWS, HTTP_SECONDS]
+
+# (etapa, segundos) da requisição corrente; None fora de uma requisição
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def begin_request() -> List[Tuple[str, float]]:
+    timings: List[Tuple[str, float]] = []
+    _request_timings.set(timings)
+    return timings
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(stage, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timed(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - t0)
+
+
+def record_rows(stage: str, n: int):
+    STAGE_ROWS.observe(stage, float(n))
+
+
+def server_timing_header(timings: Iterable[Tuple[str, float]]) -> str:
+    """Ex.: 'find_by_code;dur=1.2, embed;dur=85.0'. Etapas repetidas são somadas;
+    caracteres fora de um token HTTP viram '_'."""
+    totals: Dict[str, float] = {}
+    for stage, seconds in timings:
+        stage = _NOT_TOKEN.sub("_", stage) or "_"
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+def gauge_lines(name: str, help_text: str, values: Dict[str, float], label: str = "name") -> List[str]:
+    lines = [f"# HELP {name} {_escape_help(help_text)}", f"# TYPE {name} gauge"]
+    for lv, v in sorted(values.items()):
+        if isinstance(v, bool) or not isinstance(v, (int, float)):
+            continue
+        lines.append(f'{name}{{{label}="{escape_label(lv)}"}} {float(v):g}')
+    return lines
+
+
+def render(extra_lines: Iterable[str] = ()) -> str:
+    lines: List[str] = []
+    for h in HISTOGRAMS:
+        lines.extend(h.render())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
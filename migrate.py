@@ -0,0 +1,64 @@
+# migrate.py
+"""Aplica os scripts SQL de `migrations/` em ordem, uma única vez cada.
+
+Uso:
+  python migrate.py            # aplica pendentes
+  python migrate.py --list     # mostra aplicadas/pendentes
+
+As versões aplicadas ficam em rag.schema_migrations.
+"""
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+from db_pool import connect_db
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+
+CREATE_TABLE_SQL = """
+CREATE SCHEMA IF NOT EXISTS rag;
+CREATE TABLE IF NOT EXISTS rag.schema_migrations (
+    version text PRIMARY KEY,
+    applied_at timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+
+def pending_migrations(applied: set[str]) -> list[Path]:
+    return [p for p in sorted(MIGRATIONS_DIR.glob("*.sql")) if p.stem not in applied]
+
+
+def main(list_only: bool = False) -> int:
+    with connect_db() as con:
+        with con.cursor() as cur:
+            cur.execute(CREATE_TABLE_SQL)
+            cur.execute("SELECT version FROM rag.schema_migrations;")
+            applied = {r[0] for r in cur.fetchall()}
+        con.commit()
+
+        pending = pending_migrations(applied)
+        if list_only:
+            for v in sorted(applied):
+                print(f"[aplicada] {v}")
+            for p in pending:
+                print(f"[pendente] {p.stem}")
+            return 0
+
+        for path in pending:
+            # cada script em sua própria transação
+            with con.cursor() as cur:
+                cur.execute(path.read_text(encoding="utf-8"))
+                cur.execute("INSERT INTO rag.schema_migrations (version) VALUES (%s);", (path.stem,))
+            con.commit()
+            print(f"Aplicada: {path.stem}")
+        if not pending:
+            print("Nenhuma migração pendente.")
+    return 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--list", action="store_true", help="lista migrações aplicadas/pendentes")
+    args = ap.parse_args()
+    raise SystemExit(main(list_only=args.list))
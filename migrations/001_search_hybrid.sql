@@ -0,0 +1,139 @@
+-- 001_search_hybrid.sql
+-- Busca híbrida em uma única ida ao banco: geração de candidatos dos quatro
+-- canais (vetorial, full-text, trigram, palavra-chave), normalização pelo
+-- máximo de cada canal, re-normalização dos pesos para canais vazios, fusão
+-- ponderada e o filtro require_kw_when_available. Espelha
+-- search_products.fuse(); usado por search_products(mode="server").
+
+CREATE EXTENSION IF NOT EXISTS vector;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+CREATE OR REPLACE FUNCTION rag.search_hybrid(
+    query text,
+    qvec vector,
+    k int DEFAULT 8,
+    alpha float8 DEFAULT 0.50,
+    beta float8 DEFAULT 0.30,
+    gamma float8 DEFAULT 0.10,
+    delta float8 DEFAULT 0.10,
+    k_vec int DEFAULT 50,
+    k_ft int DEFAULT 30,
+    k_trgm int DEFAULT 15,
+    k_kw int DEFAULT 50,
+    require_kw_when_available boolean DEFAULT true
+)
+RETURNS TABLE (
+    product_id bigint, sku text, name text, codigo_barras text,
+    score float8, vec float8, ft float8, trgm float8, kw float8,
+    w_vec float8, w_ft float8, w_trgm float8, w_kw float8
+)
+LANGUAGE sql STABLE AS $$
+WITH
+vec_c AS (
+    SELECT v.product_id::bigint AS product_id, v.sku::text AS sku, v.name::text AS name,
+           v.codigo_barras::text AS codigo_barras, greatest(0.0, 1.0 - v.dist)::float8 AS s, v.ordinality AS ord
+    FROM rag.search_vec(qvec, k_vec) WITH ORDINALITY AS v
+),
+ft_c AS (
+    SELECT f.product_id::bigint, f.sku::text, f.name::text, f.codigo_barras::text,
+           f.score_ft::float8 AS s, f.ordinality AS ord
+    FROM rag.search_ft(query, k_ft) WITH ORDINALITY AS f
+),
+trgm_c AS (
+    SELECT t.*, row_number() OVER (ORDER BY t.s DESC) AS ord
+    FROM (
+        SELECT p.id::bigint AS product_id, p.sku::text AS sku, p.name::text AS name,
+               p.codigo_barras::text AS codigo_barras, similarity(p.name, query)::float8 AS s
+        FROM rag.products p
+        WHERE p.name % query
+        ORDER BY s DESC
+        LIMIT k_trgm
+    ) t
+),
+kw_pats AS (
+    -- um padrão %token% por palavra; consulta vazia vira um único padrão
+    SELECT coalesce(
+        nullif(ARRAY(SELECT '%' || t || '%' FROM regexp_split_to_table(btrim(coalesce(query, '')), '\s+') AS t
+                     WHERE t <> ''), '{}'),
+        ARRAY['%' || coalesce(query, '') || '%']
+    ) AS pats
+),
+kw_c AS (
+    SELECT t.*, row_number() OVER (ORDER BY t.s DESC, t.name ASC) AS ord
+    FROM (
+        SELECT p.id::bigint AS product_id, p.sku::text AS sku, p.name::text AS name,
+               p.codigo_barras::text AS codigo_barras,
+               ((CASE WHEN unaccent(p.name) ILIKE unaccent('%' || query || '%') THEN 2 ELSE 0 END) +
+                (CASE WHEN unaccent(p.description) ILIKE unaccent('%' || query || '%') THEN 1 ELSE 0 END))::float8 AS s
+        FROM rag.products p, kw_pats
+        WHERE p.name ILIKE ANY(kw_pats.pats) OR p.description ILIKE ANY(kw_pats.pats)
+        ORDER BY s DESC, p.name ASC
+        LIMIT k_kw
+    ) t
+),
+cand AS (
+    SELECT 1 AS ch, product_id, sku, name, codigo_barras, s, ord FROM vec_c
+    UNION ALL SELECT 2, product_id, sku, name, codigo_barras, s, ord FROM ft_c
+    UNION ALL SELECT 3, product_id, sku, name, codigo_barras, s, ord FROM trgm_c
+    UNION ALL SELECT 4, product_id, sku, name, codigo_barras, s, ord FROM kw_c
+),
+agg AS (
+    -- por SKU: metadados da primeira aparição; score do canal = última linha do canal
+    SELECT c.sku,
+           (array_agg(c.product_id ORDER BY c.ch, c.ord))[1] AS product_id,
+           (array_agg(c.name ORDER BY c.ch, c.ord))[1] AS name,
+           (array_agg(c.codigo_barras ORDER BY c.ch, c.ord))[1] AS codigo_barras,
+           min(c.ch * 1000000 + c.ord) AS first_seen,
+           (array_agg(c.s ORDER BY c.ord DESC) FILTER (WHERE c.ch = 1))[1] AS s_vec,
+           (array_agg(c.s ORDER BY c.ord DESC) FILTER (WHERE c.ch = 2))[1] AS s_ft,
+           (array_agg(c.s ORDER BY c.ord DESC) FILTER (WHERE c.ch = 3))[1] AS s_trgm,
+           (array_agg(coalesce(c.s, 0.0) ORDER BY c.ord DESC) FILTER (WHERE c.ch = 4))[1] AS s_kw
+    FROM cand c
+    GROUP BY c.sku
+),
+mx AS (
+    SELECT greatest(coalesce(max(s_vec), 0), 0) AS m_vec,
+           greatest(coalesce(max(s_ft), 0), 0) AS m_ft,
+           greatest(coalesce(max(coalesce(s_trgm, 0)), 0), 0) AS m_trgm,
+           greatest(coalesce(max(s_kw), 0), 0) AS m_kw
+    FROM agg
+),
+w AS (
+    -- re-normaliza pesos se algum canal não trouxe nada
+    SELECT mx.*,
+           CASE WHEN m_vec > 0 THEN alpha ELSE 0 END AS wv,
+           CASE WHEN m_ft > 0 THEN beta ELSE 0 END AS wf,
+           CASE WHEN m_trgm > 0 THEN gamma ELSE 0 END AS wt,
+           CASE WHEN m_kw > 0 THEN delta ELSE 0 END AS wk
+    FROM mx
+),
+wn AS (
+    SELECT w.*,
+           CASE WHEN wv + wf + wt + wk > 0 THEN wv + wf + wt + wk ELSE 1 END AS tot
+    FROM w
+),
+scored AS (
+    SELECT a.product_id, a.sku, a.name, a.codigo_barras, a.first_seen,
+           CASE WHEN wn.m_vec > 0 THEN coalesce(a.s_vec, 0) / wn.m_vec ELSE 0 END AS vn,
+           CASE WHEN wn.m_ft > 0 THEN coalesce(a.s_ft, 0) / wn.m_ft ELSE 0 END AS fn,
+           CASE WHEN wn.m_trgm > 0 THEN coalesce(a.s_trgm, 0) / wn.m_trgm ELSE 0 END AS tn,
+           CASE WHEN wn.m_kw > 0 THEN coalesce(a.s_kw, 0) / wn.m_kw ELSE 0 END AS kn,
+           wn.wv / wn.tot AS wv, wn.wf / wn.tot AS wf, wn.wt / wn.tot AS wt, wn.wk / wn.tot AS wk
+    FROM agg a CROSS JOIN wn
+),
+final AS (
+    SELECT s.*, (s.wv * s.vn + s.wf * s.fn + s.wt * s.tn + s.wk * s.kn) AS raw_score
+    FROM scored s
+)
+SELECT f.product_id, f.sku, f.name, f.codigo_barras,
+       round(f.raw_score::numeric, 4)::float8, round(f.vn::numeric, 4)::float8,
+       round(f.fn::numeric, 4)::float8, round(f.tn::numeric, 4)::float8, round(f.kn::numeric, 4)::float8,
+       f.wv, f.wf, f.wt, f.wk
+FROM final f
+WHERE NOT require_kw_when_available
+   OR f.kn > 0
+   OR NOT EXISTS (SELECT 1 FROM final x WHERE x.kn > 0)
+ORDER BY round(f.raw_score::numeric, 4) DESC, f.first_seen
+LIMIT k;
+$$;
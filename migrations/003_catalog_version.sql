@@ -0,0 +1,20 @@
+-- 003_catalog_version.sql
+-- Versão do catálogo: incrementada por ingest_csv a cada carga confirmada.
+-- Processos de busca comparam essa versão para saber quando snapshots e
+-- caches em memória ficaram desatualizados.
+
+CREATE TABLE IF NOT EXISTS rag.catalog_version (
+    id boolean PRIMARY KEY DEFAULT true CHECK (id),  -- linha única
+    version bigint NOT NULL DEFAULT 1,
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+INSERT INTO rag.catalog_version (id) VALUES (true) ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION rag.bump_catalog_version() RETURNS bigint
+LANGUAGE sql AS $$
+    UPDATE rag.catalog_version
+    SET version = version + 1, updated_at = now()
+    WHERE id
+    RETURNING version;
+$$;
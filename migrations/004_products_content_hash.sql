@@ -0,0 +1,7 @@
+-- 004_products_content_hash.sql
+-- Hash do texto embedado de cada produto (saída de build_product_text + modelo
+-- e dimensão do embedding), gravado por ingest_csv. No modo --delta, produtos
+-- com o mesmo hash só têm as colunas escalares (estoque, um, qtde_cx, raw)
+-- atualizadas, sem re-chunking nem nova chamada de embeddings.
+
+ALTER TABLE rag.products ADD COLUMN IF NOT EXISTS content_hash text;
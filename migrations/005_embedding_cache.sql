@@ -0,0 +1,14 @@
+-- 005_embedding_cache.sql
+-- Cache persistente de embeddings de chunks, endereçado por conteúdo: a chave
+-- é sha256(modelo, dimensão, texto do chunk) (ingest_csv.content_hash). Textos
+-- repetidos entre produtos (mesma descricao_tecnica em tamanhos/cores) e
+-- re-cargas completas reaproveitam o vetor em vez de chamar a API de novo.
+-- A coluna vector fica sem dimensão fixa: modelos diferentes convivem, cada
+-- um com suas chaves.
+
+CREATE TABLE IF NOT EXISTS rag.embedding_cache (
+    key text PRIMARY KEY,
+    model text NOT NULL,
+    embedding vector NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now()
+);
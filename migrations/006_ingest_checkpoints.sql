@@ -0,0 +1,19 @@
+-- 006_ingest_checkpoints.sql
+-- Progresso de cada carga do ingest_csv, identificada pelo arquivo (tamanho +
+-- hash do início e do fim). `records` é quantos registros do CSV já foram
+-- gravados e confirmados: uma carga interrompida retoma dali, sem repetir
+-- chamadas de embeddings. Atualizado na mesma transação dos dados a cada
+-- INGEST_COMMIT_EVERY produtos.
+
+CREATE TABLE IF NOT EXISTS rag.ingest_checkpoints (
+    file_key text PRIMARY KEY,
+    file_name text NOT NULL,
+    file_size bigint NOT NULL,
+    records bigint NOT NULL DEFAULT 0,    -- offset de retomada (registros do CSV)
+    products bigint NOT NULL DEFAULT 0,   -- linhas gravadas em rag.products
+    chunks bigint NOT NULL DEFAULT 0,
+    unchanged bigint NOT NULL DEFAULT 0,  -- modo delta
+    done boolean NOT NULL DEFAULT false,
+    started_at timestamptz NOT NULL DEFAULT now(),
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
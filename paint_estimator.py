@@ -8,6 +8,8 @@ from __future__ import annotations
 from typing import Dict, List, Tuple
 import math
 
+from metrics import timed
+
 
 def compute_cans(liters_needed: float, can_sizes: List[float]) -> Tuple[Dict[float, int], float, float]:
     """Calcula a decomposição de latas para atender a um volume em litros.
@@ -52,6 +54,7 @@ def compute_cans(liters_needed: float, can_sizes: List[float]) -> Tuple[Dict[flo
     return cans, total_liters, waste
 
 
+@timed("paint_estimate")
 def estimate_paint(
     *,
     total_area_m2: float,
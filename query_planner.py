@@ -0,0 +1,104 @@
+# query_planner.py
+"""Escolhe canais e profundidades da busca híbrida pelo formato da consulta.
+
+  code          só dígitos/separadores (SKU/EAN sem correspondência exata):
+                canais textuais; embedding não ajuda a achar um código e o
+                full-text (dígitos viram poucos lexemas) vai pela metade
+  single_token  uma palavra ("cimento"): palavra-chave, full-text e trigram
+                (erros de digitação); o vetorial só entra se nenhum canal
+                textual (ft/kw) achar algo. Um termo só casa com muitos
+                produtos com a mesma nota: ft e kw vão pela metade
+  short_phrase  2 a PLANNER_LONG_TOKENS-1 palavras: todos os canais, trigram
+                pela metade (similaridade com o nome inteiro cai rápido)
+  long          frase descritiva: vetorial, full-text e palavra-chave (pela
+                metade: um padrão por palavra casa com muito do catálogo); o
+                trigram não discrimina
+
+As profundidades são frações dos k_* pedidos pelo chamador (`SHAPE_DEPTHS`,
+arredondadas para cima). O plano escolhido vai para o `method` da resposta
+(ex.: "hybrid:single_token") e para `plan`.
+Com SEARCH_PLANNER=0 todas as consultas usam o plano "full" (todos os
+canais), exceto códigos sem correspondência no índice em memória.
+"""
+from __future__ import annotations
+
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from dotenv import load_dotenv
+
+from code_index import looks_like_code
+from text_norm import normalize_query
+
+load_dotenv()
+SEARCH_PLANNER = os.getenv("SEARCH_PLANNER", "1") not in ("0", "false", "no")
+PLANNER_LONG_TOKENS = int(os.getenv("PLANNER_LONG_TOKENS", "5"))
+
+TEXT_CHANNELS = ("ft", "kw")  # canais cujo resultado dispensa o fallback vetorial
+
+# fração do k_* pedido por canal, para cada formato (canal ausente = não roda)
+SHAPE_DEPTHS: Dict[str, Dict[str, float]] = {
+    "code": {"ft": 0.5, "trgm": 1.0, "kw": 1.0},
+    "single_token": {"ft": 0.5, "trgm": 1.0, "kw": 0.5},
+    "short_phrase": {"vec": 1.0, "ft": 1.0, "trgm": 0.5, "kw": 1.0},
+    "long": {"vec": 1.0, "ft": 1.0, "kw": 0.5},
+    "full": {"vec": 1.0, "ft": 1.0, "trgm": 1.0, "kw": 1.0},
+}
+# segunda rodada, só se a primeira não trouxer nada nos TEXT_CHANNELS
+SHAPE_FALLBACK: Dict[str, Dict[str, float]] = {
+    "single_token": {"vec": 1.0},
+}
+
+
+@dataclass(frozen=True)
+class QueryPlan:
+    shape: str
+    depths: Dict[str, int]
+    # rodados só se a primeira rodada não trouxer nada nos TEXT_CHANNELS
+    fallback: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def embeds(self) -> bool:
+        return "vec" in self.depths
+
+    def needs_fallback(self, rows: Dict[str, List[dict]]) -> bool:
+        return bool(self.fallback) and not any(rows.get(ch) for ch in TEXT_CHANNELS)
+
+    def method(self, base: str, fell_back: bool = False) -> str:
+        if self.shape == "full":
+            return base
+        return f"{base}:{self.shape}" + ("+vec_fallback" if fell_back else "")
+
+    def describe(self, fell_back: bool = False) -> Dict[str, object]:
+        depths = {**self.depths, **(self.fallback if fell_back else {})}
+        return {"shape": self.shape, "channels": sorted(depths), "depths": depths,
+                "embedded": self.embeds or (fell_back and "vec" in self.fallback)}
+
+
+def classify(q: str) -> str:
+    if looks_like_code(q):
+        return "code"
+    n = len(normalize_query(q).split())
+    if n <= 1:
+        return "single_token"
+    if n < PLANNER_LONG_TOKENS:
+        return "short_phrase"
+    return "long"
+
+
+def plan_for_shape(shape: str, k_vec: int, k_ft: int, k_trgm: int, k_kw: int) -> QueryPlan:
+    asked = {"vec": k_vec, "ft": k_ft, "trgm": k_trgm, "kw": k_kw}
+
+    def depths(fractions: Dict[str, float]) -> Dict[str, int]:
+        return {ch: math.ceil(asked[ch] * f) for ch, f in fractions.items()}
+
+    return QueryPlan(shape, depths(SHAPE_DEPTHS.get(shape, SHAPE_DEPTHS["full"])),
+                     fallback=depths(SHAPE_FALLBACK.get(shape, {})))
+
+
+def plan_query(q: str, k_vec: int, k_ft: int, k_trgm: int, k_kw: int,
+               enabled: bool = SEARCH_PLANNER) -> QueryPlan:
+    shape = classify(q) if enabled else "full"
+    return plan_for_shape(shape, k_vec, k_ft, k_trgm, k_kw)
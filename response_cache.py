@@ -0,0 +1,125 @@
+# response_cache.py
+"""Cache das respostas completas de busca na camada da API.
+
+A chave inclui a consulta normalizada, os parâmetros da busca (k, pesos,
+modo...) e a versão do catálogo (rag.catalog_version): uma nova ingestão
+torna todas as entradas antigas inalcançáveis, e o cache ainda é esvaziado
+quando a versão muda. LRU limitado com TTL e proteção contra stampede: para
+cada chave, apenas uma computação fica em andamento e as demais requisições
+aguardam o mesmo resultado.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from dotenv import load_dotenv
+
+from text_norm import normalize_query
+
+load_dotenv()
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "5000"))  # entradas
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "600"))  # s
+
+
+def _cacheable(resp: Any) -> bool:
+    # resposta degradada (canal descartado por timeout/erro) não é guardada
+    return not (isinstance(resp, dict) and resp.get("dropped_channels"))
+
+
+class ResponseCache:
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expired": 0, "invalidations": 0}
+
+    @staticmethod
+    def make_key(q: str, catalog_version: int, **params) -> Hashable:
+        return (normalize_query(q), tuple(sorted(params.items())), catalog_version)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            created_at, value = hit
+            if time.monotonic() - created_at > self.ttl:
+                del self._data[key]
+                self._stats["expired"] += 1
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def _count(self, event: str):
+        with self._lock:
+            self._stats[event] += 1
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Devolve do cache ou calcula uma única vez por chave (demais chamadas aguardam).
+
+        Se a requisição que está calculando é cancelada (cliente desconectou), as
+        que aguardavam não falham: tentam de novo e uma delas passa a calcular."""
+        while True:
+            value = self.get(key)
+            if value is not None:
+                self._count("hits")
+                return value
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            self._count("coalesced")
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled() or asyncio.current_task().cancelling():
+                    raise  # esta própria requisição foi cancelada
+
+        self._count("misses")
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()  # marca como recuperada se ninguém estiver aguardando
+            raise
+        else:
+            if _cacheable(value):
+                self.put(key, value)
+            fut.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out.update({"size": len(self._data), "maxsize": self.maxsize, "ttl_seconds": self.ttl,
+                        "inflight": len(self._inflight)})
+        return out
+
+
+search_response_cache = ResponseCache()
@@ -1,204 +1,422 @@
 # search_products.py
 import os
+import time
 import argparse
-import psycopg2
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
-from openai import OpenAI
 
-load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-EMB_MODEL = os.getenv("EMB_MODEL", "text-embedding-3-small")
-EMB_DIM = int(os.getenv("EMB_DIM", "1536"))
+from db_pool import DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, execute_prepared, get_pool
+from embedding_cache import query_embedding_cache
+from embedding_batcher import EmbeddingBatcher
+from embeddings import get_provider
+from vector_index import vector_index
+from code_index import answer_from_memory
+from fusion import FUSION_STRATEGIES, SEARCH_FUSION, fuse
+from query_planner import plan_for_shape, plan_query
+from metrics import timed, record_rows
 
-# Variáveis de banco separadas (em vez de DATABASE_URL)
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = int(os.getenv("DB_PORT", "5432"))
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_NAME = os.getenv("DB_NAME")
+load_dotenv()
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Statements preparados em cada conexão do pool (ver db_pool.execute_prepared)
+STATEMENTS = {
+    "sp_find_by_code": ("text, int", "SELECT * FROM rag.find_by_code(%s, %s);"),
+    "sp_search_vec": ("text, int",
+                      "SELECT product_id, sku, name, codigo_barras, dist FROM rag.search_vec(%s::vector, %s);"),
+    "sp_search_ft": ("text, int",
+                     "SELECT product_id, sku, name, codigo_barras, score_ft FROM rag.search_ft(%s, %s);"),
+    "sp_search_trgm": ("text, text, int", """
+        SELECT id AS product_id, sku, name, codigo_barras,
+               similarity(name, %s) AS score_trgm
+        FROM rag.products
+        WHERE name %% %s
+        ORDER BY score_trgm DESC
+        LIMIT %s;
+    """),
+    # migrations/002_products_normalized.sql (name_norm/description_norm + índices trigram)
+    "sp_search_kw": ("text, int",
+                     "SELECT product_id, sku, name, codigo_barras, score_kw FROM rag.search_kw(%s, %s);"),
+    # migrations/001_search_hybrid.sql
+    "sp_search_hybrid": ("text, text, int, float8, float8, float8, float8, int, int, int, int, boolean",
+                         "SELECT * FROM rag.search_hybrid(%s, %s::vector, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);"),
+}
 
 def to_pgvector(vec):
     return "[" + ",".join(f"{float(x):.7f}" for x in vec) + "]"
 
+def _embed_many(texts: list[str]) -> list[list[float]]:
+    # provedor configurado em embeddings (EMB_PROVIDER: openai, local, hash)
+    return get_provider().embed(texts)
+
+def embedding_cache_key(q: str) -> str:
+    p = get_provider()
+    return query_embedding_cache.make_key(q, p.model, p.dim)
+
+# buscas concorrentes dividem uma mesma chamada de embeddings (ver embedding_batcher)
+query_embedder = EmbeddingBatcher(_embed_many)
+
+def _embed_remote(q: str):
+    with timed("embed"):
+        return query_embedder.submit(q).result()
+
 def embed_query(q: str):
-    e = client.embeddings.create(model=EMB_MODEL, input=q)
-    v = e.data[0].embedding
-    if len(v) != EMB_DIM:
-        raise RuntimeError(f"Embedding dim {len(v)} != {EMB_DIM}")
-    return v
+    # consultas repetidas (normalizadas) não voltam à API de embeddings
+    return query_embedding_cache.get_or_compute(embedding_cache_key(q), lambda: _embed_remote(q))
+
+EMB_BATCH_MAX = int(os.getenv("EMB_BATCH_MAX", "512"))  # entradas por chamada de embeddings
+
+def embed_queries(qs: list[str]) -> list[list[float]]:
+    """Embeddings de várias consultas: cache primeiro, o restante em chamadas em lote."""
+    keys = [embedding_cache_key(q) for q in qs]
+    found = {}
+    missing = {}  # chave -> texto (deduplicado)
+    for q, key in zip(qs, keys):
+        if key in found or key in missing:
+            continue
+        v = query_embedding_cache.get(key)
+        if v is None:
+            missing[key] = q
+        else:
+            found[key] = v
+    miss_keys = list(missing)
+    for i in range(0, len(miss_keys), EMB_BATCH_MAX):
+        batch = miss_keys[i:i + EMB_BATCH_MAX]
+        with timed("embed"):
+            vecs = get_provider().embed([missing[key] for key in batch])
+        for key, v in zip(batch, vecs):
+            query_embedding_cache.put(key, v)
+            found[key] = v
+    return [found[key] for key in keys]
+
+# ---------- canais de recuperação ----------
+# Cada canal roda em uma thread própria com conexão própria do pool e tem um
+# orçamento de latência (s). Canal que estoura o orçamento (ou falha) é
+# descartado e seu peso é redistribuído pela re-normalização da fusão.
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "32"))
+CHANNEL_BUDGETS = {
+    "vec": float(os.getenv("SEARCH_BUDGET_VEC", "2.0")),  # inclui a chamada de embedding
+    "ft": float(os.getenv("SEARCH_BUDGET_FT", "0.8")),
+    "trgm": float(os.getenv("SEARCH_BUDGET_TRGM", "0.5")),
+    "kw": float(os.getenv("SEARCH_BUDGET_KW", "0.8")),
+}
+# "client": canais separados + fusão em Python; "server": rag.search_hybrid (uma query)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "client")
+SEARCH_BUDGET_HYBRID = float(os.getenv("SEARCH_BUDGET_HYBRID", "1.5"))  # só a parte SQL
+
+_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+
+def _query(stmt: str, params, timeout_s: float):
+    """Executa um statement em conexão própria do pool, limitado por statement_timeout."""
+    with get_pool(STATEMENTS).connection() as con, con.cursor(cursor_factory=RealDictCursor) as cur:
+        execute_prepared(cur, stmt, params, timeout_ms=max(1, int(timeout_s * 1000)))
+        return cur.fetchall()
+
+def _channel_vec(q: str, k: int, deadline: float):
+    v = embed_query(q)
+    # snapshot em memória (vector_index.py) quando atualizado; senão rag.search_vec
+    index = vector_index.get()
+    if index is not None:
+        with timed("vec_index"):
+            return index.search(v, k)
+    return _query("sp_search_vec", (to_pgvector(v), k), deadline - time.monotonic())
+
+def _channel_ft(q: str, k: int, deadline: float):
+    return _query("sp_search_ft", (q, k), deadline - time.monotonic())
+
+def _channel_trgm(q: str, k: int, deadline: float):
+    # trigram opcional (pg_trgm); se não existir, o canal falha e é ignorado
+    return _query("sp_search_trgm", (q, q, k), deadline - time.monotonic())
+
+def _channel_kw(q: str, k: int, deadline: float):
+    # canal extra: correspondência por palavra‑chave em name/description normalizados
+    # Ajuda muito para termos curtos como "cimento". Nome tem peso maior que descrição.
+    return _query("sp_search_kw", (q, k), deadline - time.monotonic())
+
+def _run_timed(stage: str, fn, *args):
+    with timed(stage):
+        rows = fn(*args)
+    record_rows(stage, len(rows))
+    return rows
+
+def _submit(stage: str, fn, *args):
+    # cada tarefa leva uma cópia do contexto: os tempos entram no Server-Timing da requisição
+    return _executor.submit(contextvars.copy_context().run, _run_timed, stage, fn, *args)
+
+def run_channels(q: str, depths: dict, budgets: dict = None):
+    """Dispara os canais em paralelo e espera cada um até seu prazo.
+
+    Retorna (rows_por_canal, descartados) onde descartados = {canal: "timeout"|"error"}.
+    """
+    budgets = {**CHANNEL_BUDGETS, **(budgets or {})}
+    fns = {"vec": _channel_vec, "ft": _channel_ft, "trgm": _channel_trgm, "kw": _channel_kw}
+    t0 = time.monotonic()
+    futures = {name: _submit(name, fns[name], q, depth, t0 + budgets[name])
+               for name, depth in depths.items()}
+    rows, dropped, errors = {}, {}, []
+    for name, fut in futures.items():
+        try:
+            rows[name] = fut.result(timeout=max(0.0, t0 + budgets[name] - time.monotonic()))
+        except FuturesTimeout:
+            fut.cancel()
+            rows[name] = []
+            dropped[name] = "timeout"
+        except Exception as e:
+            rows[name] = []
+            dropped[name] = "error"
+            errors.append(e)
+    # sem nenhum canal útil por erro (ex.: banco fora), propaga em vez de responder vazio
+    if errors and len(errors) == len(futures):
+        raise errors[0]
+    return rows, dropped
+
+def deterministic_response(r):
+    return {
+        "method": "deterministic",
+        "confidence": 1.0,
+        "results": [{
+            "sku": r["sku"], "codigo_barras": r["codigo_barras"],
+            "name": r["name"], "reason": r["reason"], "score": 1.0
+        }]
+    }
+
+def hybrid_rows_to_response(rows):
+    """Converte as linhas de rag.search_hybrid no mesmo formato de fuse()."""
+    results = [{
+        "sku": r["sku"], "name": r["name"], "codigo_barras": r["codigo_barras"],
+        "score": r["score"], "vec": r["vec"], "ft": r["ft"], "trgm": r["trgm"], "kw": r["kw"]
+    } for r in rows]
+    w = rows[0] if rows else {"w_vec": 0.0, "w_ft": 0.0, "w_trgm": 0.0, "w_kw": 0.0}
+    return {
+        "confidence": round(results[0]["score"], 4) if results else 0.0,
+        "weights": {"vec": round(w["w_vec"], 2), "ft": round(w["w_ft"], 2),
+                    "trgm": round(w["w_trgm"], 2), "kw": round(w["w_kw"], 2)},
+        "results": results,
+    }
 
 def search_products(q: str, k: int = 8,
                     k_vec: int = 50, k_ft: int = 30, k_trgm: int = 15, k_kw: int = 50,
                     alpha: float = 0.50, beta: float = 0.30, gamma: float = 0.10, delta: float = 0.10,
-                    require_kw_when_available: bool = True):
-    assert OPENAI_API_KEY, "Configure OPENAI_API_KEY no .env"
+                    require_kw_when_available: bool = True,
+                    budgets: dict = None, mode: str = None, fusion: str = None):
+    get_provider()  # valida a configuração de embeddings (ex.: OPENAI_API_KEY)
     assert all([DB_HOST, DB_USER, DB_PASSWORD, DB_NAME]), (
         "Configure DB_HOST, DB_PORT, DB_USER, DB_PASSWORD e DB_NAME no .env"
     )
 
-    with psycopg2.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        dbname=DB_NAME,
-    ) as con, con.cursor(cursor_factory=RealDictCursor) as cur:
-        # 1) determinístico por SKU/EAN
-        cur.execute("SELECT * FROM rag.find_by_code(%s, %s);", (q, 5))
-        det = cur.fetchall()
+    # 0) consulta com cara de SKU/EAN: resolvida no índice em memória
+    with timed("code_index"):
+        mem = answer_from_memory(q)
+    if mem is not None and mem["results"]:
+        return mem
+
+    # 1) determinístico por SKU/EAN (dispensado se o índice em memória já respondeu "não existe")
+    det = []
+    if mem is None:
+        with timed("find_by_code"), get_pool(STATEMENTS).connection() as con, \
+                con.cursor(cursor_factory=RealDictCursor) as cur:
+            execute_prepared(cur, "sp_find_by_code", (q, 5))
+            det = cur.fetchall()
+        record_rows("find_by_code", len(det))
         if len(det) == 1:
-            r = det[0]
-            return {
-                "method": "deterministic",
-                "confidence": 1.0,
-                "results": [{
-                    "sku": r["sku"], "codigo_barras": r["codigo_barras"],
-                    "name": r["name"], "reason": r["reason"], "score": 1.0
-                }]
-            }
-
-        # 2) híbrido: vetorial + full-text (+ trigram)
+            return deterministic_response(det[0])
+
+    # 2) plano: quais canais rodam e com que profundidade (query_planner)
+    plan = (plan_for_shape("code", k_vec, k_ft, k_trgm, k_kw) if mem is not None
+            else plan_query(q, k_vec, k_ft, k_trgm, k_kw))
+    base = "hybrid" if det == [] else "hybrid_with_deterministic_candidates"
+    # rag.search_hybrid só implementa maxnorm; outras estratégias fundem no cliente
+    if ((mode or SEARCH_MODE) == "server" and (fusion or SEARCH_FUSION) == "maxnorm"
+            and plan.embeds and not plan.fallback):
+        # 2') fusão no servidor: candidatos, normalização e filtro em uma única query
+        d = plan.depths
         qvec = to_pgvector(embed_query(q))
+        rows = _run_timed("hybrid_sql", _query, "sp_search_hybrid",
+                          (q, qvec, k, alpha, beta, gamma, delta,
+                           d.get("vec", 0), d.get("ft", 0), d.get("trgm", 0), d.get("kw", 0),
+                           require_kw_when_available),
+                          SEARCH_BUDGET_HYBRID)
+        return {"method": plan.method(base), "mode": "server", "plan": plan.describe(),
+                **hybrid_rows_to_response(rows)}
 
-        cur.execute("SELECT product_id, sku, name, codigo_barras, dist FROM rag.search_vec(%s::vector, %s);",
-                    (qvec, k_vec))
-        vec_rows = cur.fetchall()
+    # 3) canais do plano em paralelo; vetorial como fallback se os textuais não acharem nada
+    rows, dropped = run_channels(q, plan.depths, budgets)
+    fell_back = plan.needs_fallback(rows)
+    if fell_back:
+        more, more_dropped = run_channels(q, plan.fallback, budgets)
+        rows.update(more)
+        dropped.update(more_dropped)
 
-        cur.execute("SELECT product_id, sku, name, codigo_barras, score_ft FROM rag.search_ft(%s, %s);",
-                    (q, k_ft))
-        ft_rows = cur.fetchall()
+    # 4) fusão + normalização
+    with timed("fusion"):
+        fused = fuse(rows.get("vec", []), rows.get("ft", []), rows.get("trgm", []), rows.get("kw", []), k,
+                     alpha, beta, gamma, delta, require_kw_when_available, fusion)
+    return {
+        "method": plan.method(base, fell_back),
+        "mode": "client",
+        "plan": plan.describe(fell_back),
+        **fused,
+        "dropped_channels": dropped,
+    }
 
-        # trigram opcional (pg_trgm); se não existir, ignora
-        trgm_rows = []
-        try:
-            cur.execute("""
-                SELECT id AS product_id, sku, name, codigo_barras,
-                       similarity(name, %s) AS score_trgm
-                FROM rag.products
-                WHERE name % %s
-                ORDER BY score_trgm DESC
-                LIMIT %s;
-            """, (q, q, k_trgm))
-            trgm_rows = cur.fetchall()
-        except Exception:
-            trgm_rows = []
+# ---------- lote ----------
+# Cada canal roda uma única vez para o lote inteiro via unnest(...) + LATERAL;
+# a coluna i (posição na entrada, base 1) separa as linhas por consulta.
+BATCH_FIND_BY_CODE_SQL = """
+    SELECT q.i, f.*
+    FROM unnest(%s::text[]) WITH ORDINALITY AS q(query, i)
+    CROSS JOIN LATERAL rag.find_by_code(q.query, 5) f
+    ORDER BY q.i;
+"""
+BATCH_VEC_SQL = """
+    SELECT q.i, v.product_id, v.sku, v.name, v.codigo_barras, v.dist
+    FROM unnest(%s::int[], %s::text[]) AS q(i, qvec)
+    CROSS JOIN LATERAL rag.search_vec(q.qvec::vector, %s) WITH ORDINALITY AS v
+    ORDER BY q.i, v.ordinality;
+"""
+BATCH_FT_SQL = """
+    SELECT q.i, f.product_id, f.sku, f.name, f.codigo_barras, f.score_ft
+    FROM unnest(%s::int[], %s::text[]) AS q(i, query)
+    CROSS JOIN LATERAL rag.search_ft(q.query, %s) WITH ORDINALITY AS f
+    ORDER BY q.i, f.ordinality;
+"""
+BATCH_TRGM_SQL = """
+    SELECT q.i, t.*
+    FROM unnest(%s::int[], %s::text[]) AS q(i, query)
+    CROSS JOIN LATERAL (
+        SELECT id AS product_id, sku, name, codigo_barras,
+               similarity(name, q.query) AS score_trgm
+        FROM rag.products
+        WHERE name %% q.query
+        ORDER BY score_trgm DESC
+        LIMIT %s
+    ) t
+    ORDER BY q.i, t.score_trgm DESC;
+"""
+BATCH_KW_SQL = """
+    SELECT q.i, w.product_id, w.sku, w.name, w.codigo_barras, w.score_kw
+    FROM unnest(%s::int[], %s::text[]) AS q(i, query)
+    CROSS JOIN LATERAL rag.search_kw(q.query, %s) WITH ORDINALITY AS w
+    ORDER BY q.i, w.ordinality;
+"""
+
+def _query_all(sql: str, params):
+    with get_pool(STATEMENTS).connection() as con, con.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(sql, params)
+        return cur.fetchall()
 
-        # 2.1) canal extra: correspondência por palavra‑chave (ILIKE/unaccent) em name/description
-        # Ajuda muito para termos curtos como "cimento". Nome tem peso maior que descrição.
-        kw_rows = []
+def _group_by_i(rows, n: int):
+    out = [[] for _ in range(n)]
+    for r in rows:
+        out[r["i"] - 1].append(r)
+    return out
+
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "100"))  # consultas por /search/batch
+BATCH_MAX_K = int(os.getenv("BATCH_MAX_K", "50"))  # resultados por consulta em /search/batch
+
+def search_products_batch(queries: list[str], k: int = 8,
+                          k_vec: int = 50, k_ft: int = 30, k_trgm: int = 15, k_kw: int = 50,
+                          alpha: float = 0.50, beta: float = 0.30, gamma: float = 0.10, delta: float = 0.10,
+                          require_kw_when_available: bool = True, fusion: str = None):
+    """Versão em lote de search_products: mesma saída por consulta, na ordem da entrada.
+
+    SKU/EAN resolvidos em um único find_by_code; as demais consultas são
+    embedadas em uma chamada em lote e cada canal roda uma query para todas.
+    """
+    get_provider()  # valida a configuração de embeddings (ex.: OPENAI_API_KEY)
+    n = len(queries)
+    if n == 0:
+        return []
+
+    # 0) códigos resolvidos no índice em memória; sem correspondência não vão ao canal vetorial
+    with timed("code_index"):
+        mem = [answer_from_memory(q) for q in queries]
+    out = [m if m is not None and m["results"] else None for m in mem]
+    text_only = {i for i, m in enumerate(mem) if m is not None and not m["results"]}
+
+    # 1) determinístico por SKU/EAN, uma passada para o lote
+    lookup = [i for i in range(n) if mem[i] is None]
+    det = [[] for _ in range(n)]
+    if lookup:
+        found = _group_by_i(_run_timed("batch_find_by_code", _query_all, BATCH_FIND_BY_CODE_SQL,
+                                       ([queries[i] for i in lookup],)), len(lookup))
+        for j, i in enumerate(lookup):
+            det[i] = found[j]
+            if len(found[j]) == 1:
+                out[i] = deterministic_response(found[j][0])
+    pending = [i for i in range(n) if out[i] is None]
+    if not pending:
+        return out
+
+    # 2) plano por consulta; cada canal roda uma vez para as consultas cujo plano o inclui
+    plans = {i: (plan_for_shape("code", k_vec, k_ft, k_trgm, k_kw) if i in text_only
+                 else plan_query(queries[i], k_vec, k_ft, k_trgm, k_kw)) for i in pending}
+    rows = _batch_channels(queries, {i: p.depths for i, p in plans.items()})
+    fell_back = {i for i in pending if plans[i].needs_fallback({ch: rows[ch][i] for ch in rows})}
+    if fell_back:
+        more = _batch_channels(queries, {i: plans[i].fallback for i in fell_back})
+        for ch in rows:
+            for i in fell_back:
+                rows[ch][i] = rows[ch][i] or more[ch][i]
+
+    # 3) fusão por consulta
+    for i in pending:
+        with timed("fusion"):
+            fused = fuse(rows["vec"][i], rows["ft"][i], rows["trgm"][i], rows["kw"][i], k,
+                         alpha, beta, gamma, delta, require_kw_when_available, fusion)
+        base = "hybrid" if det[i] == [] else "hybrid_with_deterministic_candidates"
+        out[i] = {
+            "method": plans[i].method(base, i in fell_back),
+            "mode": "batch",
+            "plan": plans[i].describe(i in fell_back),
+            **fused,
+        }
+    return out
+
+def _batch_channels(queries: list[str], depths: dict) -> dict:
+    """Roda cada canal uma vez para as consultas (posição -> {canal: k}) que o incluem.
+
+    Retorna {canal: [linhas da consulta 0, 1, ...]}; vazio onde o canal não rodou."""
+    n = len(queries)
+    sel = {ch: [i for i, d in depths.items() if ch in d] for ch in ("vec", "ft", "trgm", "kw")}
+    deepest = {ch: max(depths[i][ch] for i in sel[ch]) for ch in sel if sel[ch]}
+    futures = {}
+    if sel["vec"]:
+        vec_idx = [i + 1 for i in sel["vec"]]
+        vecs = embed_queries([queries[i] for i in sel["vec"]])
+        index = vector_index.get()
+        futures["vec"] = (
+            _submit("batch_vec_index", lambda: [dict(r, i=i) for i, v in zip(vec_idx, vecs)
+                                                for r in index.search(v, deepest["vec"])])
+            if index is not None else
+            _submit("batch_vec", _query_all, BATCH_VEC_SQL,
+                    (vec_idx, [to_pgvector(v) for v in vecs], deepest["vec"])))
+    for ch, sql in (("ft", BATCH_FT_SQL), ("trgm", BATCH_TRGM_SQL), ("kw", BATCH_KW_SQL)):
+        if sel[ch]:
+            futures[ch] = _submit(f"batch_{ch}", _query_all, sql,
+                                  ([i + 1 for i in sel[ch]], [queries[i] for i in sel[ch]], deepest[ch]))
+    rows = {ch: [[] for _ in range(n)] for ch in sel}
+    for name, fut in futures.items():
         try:
-            # Monta padrões simples para múltiplas palavras (qualquer termo)
-            tokens = [t for t in (q or "").strip().split() if t]
-            if not tokens:
-                tokens = [q]
-            like_patterns = [f"%{t}%" for t in tokens]
-
-            # Constrói cláusulas OR para name/description
-            # Pontua 2 se nome casar, +1 se descrição casar
-            where_clauses = []
-            params = []
-            for pat in like_patterns:
-                where_clauses.append("(name ILIKE %s OR description ILIKE %s)")
-                params.extend([pat, pat])
-            where_sql = " OR ".join([f"({wc})" for wc in where_clauses]) or "TRUE"
-            # Primeiro tenta com unaccent (se extensão existir); se falhar, cai no ILIKE simples
-            try:
-                sql_kw = f"""
-                    SELECT id AS product_id, sku, name, codigo_barras,
-                           ((CASE WHEN unaccent(name) ILIKE unaccent(%s) THEN 2 ELSE 0 END) +
-                            (CASE WHEN unaccent(description) ILIKE unaccent(%s) THEN 1 ELSE 0 END))::float AS score_kw
-                    FROM rag.products
-                    WHERE {where_sql}
-                    ORDER BY score_kw DESC, name ASC
-                    LIMIT %s;
-                """
-                base_pat = f"%{q}%"
-                exec_params = [base_pat, base_pat, *params, k_kw]
-                cur.execute(sql_kw, exec_params)
-                kw_rows = cur.fetchall()
-            except Exception:
-                sql_kw = f"""
-                    SELECT id AS product_id, sku, name, codigo_barras,
-                           ((CASE WHEN name ILIKE %s THEN 2 ELSE 0 END) +
-                            (CASE WHEN description ILIKE %s THEN 1 ELSE 0 END))::float AS score_kw
-                    FROM rag.products
-                    WHERE {where_sql}
-                    ORDER BY score_kw DESC, name ASC
-                    LIMIT %s;
-                """
-                base_pat = f"%{q}%"
-                exec_params = [base_pat, base_pat, *params, k_kw]
-                cur.execute(sql_kw, exec_params)
-                kw_rows = cur.fetchall()
+            grouped = _group_by_i(fut.result(), n)
         except Exception:
-            kw_rows = []
-
-    # 3) fusão + normalização
-    items = {}
-    def put(rows, key, val_fn):
-        for r in rows:
-            sku = r["sku"]
-            it = items.setdefault(sku, {
-                "sku": sku, "name": r["name"], "codigo_barras": r["codigo_barras"], "scores": {}
-            })
-            it["scores"][key] = float(val_fn(r))
-
-    put(vec_rows, "vec", lambda r: max(0.0, 1.0 - float(r["dist"])))   # cosine -> similaridade
-    put(ft_rows, "ft", lambda r: float(r["score_ft"]))
-    put(trgm_rows, "trgm", lambda r: float(r["score_trgm"] or 0.0))
-    put(kw_rows, "kw", lambda r: float(r.get("score_kw", 0.0)))
-
-    max_vec = max((it["scores"].get("vec", 0.0) for it in items.values()), default=0.0)
-    max_ft = max((it["scores"].get("ft", 0.0) for it in items.values()), default=0.0)
-    max_tr = max((it["scores"].get("trgm", 0.0) for it in items.values()), default=0.0)
-    max_kw = max((it["scores"].get("kw", 0.0) for it in items.values()), default=0.0)
-
-    # re-normaliza pesos se algum canal não trouxe nada
-    w_vec, w_ft, w_tr, w_kw = alpha, beta, gamma, delta
-    total = 0.0
-    if max_vec > 0: total += w_vec
-    else: w_vec = 0.0
-    if max_ft > 0: total += w_ft
-    else: w_ft = 0.0
-    if max_tr > 0: total += w_tr
-    else: w_tr = 0.0
-    if max_kw > 0: total += w_kw
-    else: w_kw = 0.0
-    if total > 0:
-        w_vec /= total; w_ft /= total; w_tr /= total; w_kw /= total
-
-    results = []
-    for sku, it in items.items():
-        vn = (it["scores"].get("vec", 0.0) / max_vec) if max_vec > 0 else 0.0
-        fn = (it["scores"].get("ft", 0.0) / max_ft) if max_ft > 0 else 0.0
-        tn = (it["scores"].get("trgm", 0.0) / max_tr) if max_tr > 0 else 0.0
-        kn = (it["scores"].get("kw", 0.0) / max_kw) if max_kw > 0 else 0.0
-        score = w_vec * vn + w_ft * fn + w_tr * tn + w_kw * kn
-        results.append({
-            "sku": sku, "name": it["name"], "codigo_barras": it["codigo_barras"],
-            "score": round(score, 4), "vec": round(vn, 4), "ft": round(fn, 4), "trgm": round(tn, 4), "kw": round(kn, 4)
-        })
-
-    results.sort(key=lambda x: x["score"], reverse=True)
-    # 3.1) Se houver quaisquer itens com match por palavra‑chave, prioriza apenas esses no top
-    if require_kw_when_available and any(r.get("kw", 0.0) > 0.0 for r in results):
-        results = [r for r in results if r.get("kw", 0.0) > 0.0] or results
-    confidence = results[0]["score"] if results else 0.0
-    return {
-        "method": "hybrid" if det == [] else "hybrid_with_deterministic_candidates",
-        "confidence": round(confidence, 4),
-        "weights": {"vec": round(w_vec, 2), "ft": round(w_ft, 2), "trgm": round(w_tr, 2), "kw": round(w_kw, 2)},
-        "results": results[:k]
-    }
+            if name in ("vec", "ft"):
+                raise
+            continue  # trigram/palavra-chave são opcionais
+        for i in sel[name]:
+            rows[name][i] = grouped[i][:depths[i][name]]
+    return rows
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--q", required=True, help="consulta do usuário")
     ap.add_argument("--k", type=int, default=8)
+    ap.add_argument("--mode", choices=["client", "server"], default=None,
+                    help="client: fusão em Python; server: rag.search_hybrid")
+    ap.add_argument("--fusion", choices=sorted(FUSION_STRATEGIES), default=None,
+                    help="estratégia de fusão dos canais (padrão: SEARCH_FUSION)")
     args = ap.parse_args()
-    out = search_products(args.q, k=args.k)
+    vector_index.start()  # snapshot já na primeira (e única) consulta
+    out = search_products(args.q, k=args.k, mode=args.mode, fusion=args.fusion)
     import json
     print(json.dumps(out, ensure_ascii=False, indent=2))
@@ -0,0 +1,216 @@
+# search_products_async.py
+"""Versão assíncrona de `search_products` para o endpoint /search.
+
+Mesma lógica e mesma saída da versão síncrona, mas sem ocupar uma thread por
+requisição: embeddings via `aembed` do provedor (ou o agrupador de
+`embedding_batcher`) e Postgres via pool do `asyncpg` (que prepara e
+reutiliza os statements por conexão). Canais rodam com `asyncio.gather`,
+cada um limitado pelo seu orçamento de latência.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Dict, List, Optional
+
+import asyncpg
+
+from db_pool import (
+    DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME,
+    DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_HEALTHCHECK_IDLE, to_prepare_sql,
+)
+from embedding_cache import query_embedding_cache
+from vector_index import vector_index
+from code_index import answer_from_memory, code_index
+from metrics import timed, record_rows
+from fusion import SEARCH_FUSION, fuse
+from embeddings import get_provider
+from query_planner import plan_for_shape, plan_query
+from search_products import (
+    STATEMENTS, CHANNEL_BUDGETS, SEARCH_MODE, SEARCH_BUDGET_HYBRID,
+    query_embedder, embedding_cache_key, to_pgvector, deterministic_response, hybrid_rows_to_response,
+)
+
+# mesmos statements da versão síncrona, com placeholders $n
+SQL = {name: to_prepare_sql(sql) for name, (_types, sql) in STATEMENTS.items()}
+
+_pool: Optional[asyncpg.Pool] = None
+_pool_lock = asyncio.Lock()
+
+
+async def _init_connection(con: asyncpg.Connection):
+    # pgvector sem codec binário no asyncpg: trafega como texto '[v1,v2,...]'
+    try:
+        await con.set_type_codec("vector", encoder=str, decoder=str, schema="public", format="text")
+    except (ValueError, asyncpg.PostgresError):
+        pass
+
+
+async def get_async_pool() -> asyncpg.Pool:
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            assert all([DB_HOST, DB_USER, DB_PASSWORD, DB_NAME]), (
+                "Configure DB_HOST, DB_PORT, DB_USER, DB_PASSWORD e DB_NAME no .env"
+            )
+            _pool = await asyncpg.create_pool(
+                host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASSWORD, database=DB_NAME,
+                min_size=DB_POOL_MIN, max_size=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+                max_inactive_connection_lifetime=DB_POOL_HEALTHCHECK_IDLE,
+                init=_init_connection,
+            )
+        return _pool
+
+
+async def close_async_pool():
+    global _pool
+    async with _pool_lock:
+        if _pool is not None:
+            await _pool.close()
+            _pool = None
+
+
+def async_pool_stats() -> Dict[str, object]:
+    if _pool is None:
+        return {"started": False}
+    return {
+        "started": True, "min": _pool.get_min_size(), "max": _pool.get_max_size(),
+        "size": _pool.get_size(), "idle": _pool.get_idle_size(),
+        "in_use": _pool.get_size() - _pool.get_idle_size(),
+    }
+
+
+async def _embed_remote(q: str) -> List[float]:
+    with timed("embed"):
+        if query_embedder.enabled:
+            # agrupada com as buscas concorrentes (inclusive as da versão síncrona)
+            return await asyncio.wrap_future(query_embedder.submit(q))
+        return (await get_provider().aembed([q]))[0]
+
+
+async def embed_query(q: str) -> List[float]:
+    # memória no event loop; o SQLite (EMB_CACHE_PATH) em thread, para não travar o loop
+    key = embedding_cache_key(q)
+    v = query_embedding_cache.get_memory(key)
+    if v is None and query_embedding_cache.persistent:
+        v = await asyncio.to_thread(query_embedding_cache.get_disk, key)
+    if v is None:
+        v = await _embed_remote(q)
+        query_embedding_cache.put_memory(key, v)
+        if query_embedding_cache.persistent:
+            await asyncio.to_thread(query_embedding_cache.put_disk, key, v)
+    return v
+
+
+async def _query(stmt: str, *params) -> List[dict]:
+    pool = await get_async_pool()
+    async with pool.acquire() as con:
+        return [dict(r) for r in await con.fetch(SQL[stmt], *params)]
+
+
+# ---------- canais ----------
+async def _channel_vec(q: str, k: int):
+    v = await embed_query(q)
+    index = vector_index.get()
+    if index is not None:
+        # matmul do NumPy libera o GIL; roda fora do event loop
+        with timed("vec_index"):
+            return await asyncio.to_thread(index.search, v, k)
+    return await _query("sp_search_vec", to_pgvector(v), k)
+
+
+async def _channel_ft(q: str, k: int):
+    return await _query("sp_search_ft", q, k)
+
+
+async def _channel_trgm(q: str, k: int):
+    return await _query("sp_search_trgm", q, q, k)
+
+
+async def _channel_kw(q: str, k: int):
+    return await _query("sp_search_kw", q, k)
+
+
+async def _run_timed(stage: str, coro):
+    with timed(stage):
+        rows = await coro
+    record_rows(stage, len(rows))
+    return rows
+
+
+async def run_channels(q: str, depths: dict, budgets: dict = None):
+    """Equivalente assíncrono de search_products.run_channels."""
+    budgets = {**CHANNEL_BUDGETS, **(budgets or {})}
+    fns = {"vec": _channel_vec, "ft": _channel_ft, "trgm": _channel_trgm, "kw": _channel_kw}
+    names = list(depths)
+    outcomes = await asyncio.gather(
+        *(asyncio.wait_for(_run_timed(name, fns[name](q, depths[name])), budgets[name]) for name in names),
+        return_exceptions=True,
+    )
+    rows, dropped, errors = {}, {}, []
+    for name, res in zip(names, outcomes):
+        if isinstance(res, asyncio.TimeoutError):
+            rows[name], dropped[name] = [], "timeout"
+        elif isinstance(res, BaseException):
+            rows[name], dropped[name] = [], "error"
+            errors.append(res)
+        else:
+            rows[name] = res
+    if errors and len(errors) == len(names):
+        raise errors[0]
+    return rows, dropped
+
+
+async def search_products_async(q: str, k: int = 8,
+                                k_vec: int = 50, k_ft: int = 30, k_trgm: int = 15, k_kw: int = 50,
+                                alpha: float = 0.50, beta: float = 0.30, gamma: float = 0.10, delta: float = 0.10,
+                                require_kw_when_available: bool = True,
+                                budgets: dict = None, mode: str = None, fusion: str = None):
+    get_provider()  # valida a configuração de embeddings (ex.: OPENAI_API_KEY)
+
+    # 0) consulta com cara de SKU/EAN: resolvida no índice em memória
+    with timed("code_index"):
+        # a primeira carga (se o startup não pré-carregou) vai ao banco: fora do event loop
+        mem = (answer_from_memory(q) if code_index.loaded
+               else await asyncio.to_thread(answer_from_memory, q))
+    if mem is not None and mem["results"]:
+        return mem
+
+    # 1) determinístico por SKU/EAN (dispensado se o índice em memória já respondeu "não existe")
+    det = []
+    if mem is None:
+        det = await _run_timed("find_by_code", _query("sp_find_by_code", q, 5))
+        if len(det) == 1:
+            return deterministic_response(det[0])
+
+    # 2) plano: quais canais rodam e com que profundidade (query_planner)
+    plan = (plan_for_shape("code", k_vec, k_ft, k_trgm, k_kw) if mem is not None
+            else plan_query(q, k_vec, k_ft, k_trgm, k_kw))
+    base = "hybrid" if det == [] else "hybrid_with_deterministic_candidates"
+    # rag.search_hybrid só implementa maxnorm; outras estratégias fundem no cliente
+    if ((mode or SEARCH_MODE) == "server" and (fusion or SEARCH_FUSION) == "maxnorm"
+            and plan.embeds and not plan.fallback):
+        d = plan.depths
+        qvec = to_pgvector(await embed_query(q))
+        rows = await asyncio.wait_for(
+            _run_timed("hybrid_sql", _query("sp_search_hybrid", q, qvec, k, alpha, beta, gamma, delta,
+                                            d.get("vec", 0), d.get("ft", 0), d.get("trgm", 0), d.get("kw", 0),
+                                            require_kw_when_available)),
+            SEARCH_BUDGET_HYBRID,
+        )
+        return {"method": plan.method(base), "mode": "server", "plan": plan.describe(),
+                **hybrid_rows_to_response(rows)}
+
+    # 3) canais do plano concorrentes no event loop; vetorial como fallback
+    rows, dropped = await run_channels(q, plan.depths, budgets)
+    fell_back = plan.needs_fallback(rows)
+    if fell_back:
+        more, more_dropped = await run_channels(q, plan.fallback, budgets)
+        rows.update(more)
+        dropped.update(more_dropped)
+
+    # 4) fusão + normalização
+    with timed("fusion"):
+        fused = fuse(rows.get("vec", []), rows.get("ft", []), rows.get("trgm", []), rows.get("kw", []), k,
+                     alpha, beta, gamma, delta, require_kw_when_available, fusion)
+    return {"method": plan.method(base, fell_back), "mode": "client", "plan": plan.describe(fell_back),
+            **fused, "dropped_channels": dropped}
@@ -0,0 +1,267 @@
+# search_stream.py
+"""Busca híbrida em streaming (NDJSON) para listas longas de candidatos.
+
+`/search` monta a resposta inteira com k fixo. Aqui cada canal do plano
+(`query_planner`) é lido de um cursor no servidor (DECLARE ... CURSOR, um por
+canal e por conexão) em lotes de STREAM_FETCH linhas, e
+`fusion.IncrementalFusion` libera cada resultado assim que nenhum candidato
+ainda não lido pode superá-lo. A memória fica limitada aos candidatos em
+aberto e o primeiro resultado não espera pelos k seguintes.
+
+Linhas emitidas (um objeto JSON por linha):
+
+  {"type": "meta", "method", "mode": "stream", "plan", "weights", "k", "offset"}
+  {"type": "result", "rank", "sku", "name", "codigo_barras", "score", "vec", "ft", "trgm", "kw"}
+  {"type": "end", "returned", "next_offset", "dropped_channels"}
+
+`rank` é a posição global (base 1). `next_offset` vai no `offset` da próxima
+página; null quando a lista acabou. Cada canal é lido até
+min(STREAM_MAX_DEPTH, STREAM_DEPTH_FACTOR * (offset + k)) linhas.
+Só maxnorm e rrf (`fusion.STREAMING_STRATEGIES`).
+"""
+from __future__ import annotations
+
+import contextvars
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Dict, Iterator, List, Tuple
+
+from dotenv import load_dotenv
+from psycopg2.extras import RealDictCursor
+
+from db_pool import DB_HOST, DB_NAME, DB_PASSWORD, DB_USER, execute_prepared, get_pool
+from code_index import answer_from_memory
+from embeddings import get_provider
+from fusion import SEARCH_FUSION, STREAMING_STRATEGIES, IncrementalFusion
+from metrics import observe_stage, record_rows, timed
+from query_planner import plan_for_shape, plan_query
+from search_products import (
+    STATEMENTS, deterministic_response, embed_query, to_pgvector,
+)
+from vector_index import vector_index
+
+load_dotenv()
+STREAM_FETCH = int(os.getenv("STREAM_FETCH", "100"))  # linhas por FETCH em cada canal
+STREAM_MAX_DEPTH = int(os.getenv("STREAM_MAX_DEPTH", "2000"))  # teto de linhas lidas por canal
+STREAM_DEPTH_FACTOR = int(os.getenv("STREAM_DEPTH_FACTOR", "4"))  # profundidade relativa a offset + k
+STREAM_STATEMENT_TIMEOUT = float(os.getenv("STREAM_STATEMENT_TIMEOUT", "5"))  # s por comando
+STREAM_WORKERS = int(os.getenv("STREAM_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=STREAM_WORKERS, thread_name_prefix="stream")
+
+# mesmo SQL dos statements preparados: DECLARE não aceita EXECUTE
+_CHANNEL_SQL = {
+    "vec": STATEMENTS["sp_search_vec"][1],
+    "ft": STATEMENTS["sp_search_ft"][1],
+    "trgm": STATEMENTS["sp_search_trgm"][1],
+    "kw": STATEMENTS["sp_search_kw"][1],
+}
+
+
+class _ListReader:
+    """Canal já materializado (snapshot vetorial em memória), entregue em lotes."""
+
+    def __init__(self, rows: List[dict]):
+        self._rows = iter(rows)
+
+    def fetch(self, n: int) -> Tuple[List[dict], bool]:
+        rows = list(itertools.islice(self._rows, n))
+        return rows, len(rows) < n
+
+    def close(self):
+        pass
+
+
+class _CursorReader:
+    """Canal lido de um cursor no servidor, em conexão própria do pool.
+
+    A conexão sai do autocommit enquanto o cursor existe (DECLARE exige
+    transação) e volta ao pool com rollback em `close()`."""
+
+    def __init__(self, channel: str, params):
+        self.channel = channel
+        with ExitStack() as stack:
+            con = stack.enter_context(get_pool(STATEMENTS).connection())
+            con.autocommit = False
+            stack.callback(_end_transaction, con)
+            with con.cursor() as cur:
+                cur.execute("SET LOCAL statement_timeout = %s;", (max(1, int(STREAM_STATEMENT_TIMEOUT * 1000)),))
+            self._cur = con.cursor(name=f"stream_{channel}", cursor_factory=RealDictCursor)
+            stack.callback(self._cur.close)
+            self._cur.execute(_CHANNEL_SQL[channel].strip().rstrip(";"), params)
+            self._stack = stack.pop_all()
+
+    def fetch(self, n: int) -> Tuple[List[dict], bool]:
+        with timed(f"stream_{self.channel}"):
+            rows = self._cur.fetchmany(n)
+        return rows, len(rows) < n
+
+    def close(self):
+        self._stack.close()
+
+
+def _end_transaction(con):
+    if not con.closed:
+        con.rollback()
+        con.autocommit = True
+
+
+def _open_channel(channel: str, q: str, depth: int):
+    if channel == "vec":
+        v = embed_query(q)
+        index = vector_index.get()
+        if index is not None:
+            with timed("vec_index"):
+                return _ListReader(index.search(v, depth))
+        return _CursorReader("vec", (to_pgvector(v), depth))
+    if channel == "trgm":
+        return _CursorReader("trgm", (q, q, depth))
+    return _CursorReader(channel, (q, depth))
+
+
+def _open_and_fetch(channel: str, q: str, depth: int, n: int):
+    reader = _open_channel(channel, q, depth)
+    try:
+        return reader, reader.fetch(n)
+    except BaseException:
+        reader.close()
+        raise
+
+
+def _in_parallel(calls: Dict[str, tuple]) -> Dict[str, tuple]:
+    """{canal: (fn, *args)} -> {canal: ("ok", resultado) | ("error", exceção)}, um canal por thread."""
+    futures = {ch: _executor.submit(contextvars.copy_context().run, *call) for ch, call in calls.items()}
+    out = {}
+    for ch, fut in futures.items():
+        try:
+            out[ch] = ("ok", fut.result())
+        except Exception as e:
+            out[ch] = ("error", e)
+    return out
+
+
+def _fixed(resp: dict, k: int, offset: int) -> Iterator[dict]:
+    # resposta já completa (determinística): mesmo formato de linhas, paginada
+    results = resp["results"]
+    yield {"type": "meta", "method": resp["method"], "mode": "stream", "plan": None,
+           "weights": None, "k": k, "offset": offset}
+    page = results[offset:offset + k]
+    for rank, r in enumerate(page, start=offset + 1):
+        yield {"type": "result", "rank": rank, **r}
+    more = offset + k < len(results)
+    yield {"type": "end", "returned": len(page), "next_offset": offset + k if more else None,
+           "dropped_channels": {}}
+
+
+def _stream(q: str, k: int, offset: int,
+            alpha: float, beta: float, gamma: float, delta: float,
+            require_kw_when_available: bool, fusion: str) -> Iterator[dict]:
+    t0 = time.perf_counter()
+    with timed("code_index"):
+        mem = answer_from_memory(q)
+    if mem is not None and mem["results"]:
+        yield from _fixed(mem, k, offset)
+        return
+
+    det = []
+    if mem is None:
+        with timed("find_by_code"), get_pool(STATEMENTS).connection() as con, \
+                con.cursor(cursor_factory=RealDictCursor) as cur:
+            execute_prepared(cur, "sp_find_by_code", (q, 5))
+            det = cur.fetchall()
+        record_rows("find_by_code", len(det))
+        if len(det) == 1:
+            yield from _fixed(deterministic_response(det[0]), k, offset)
+            return
+
+    depth = min(STREAM_MAX_DEPTH, STREAM_DEPTH_FACTOR * (offset + k))
+    plan = (plan_for_shape("code", depth, depth, depth, depth) if mem is not None
+            else plan_query(q, depth, depth, depth, depth))
+    base = "hybrid" if det == [] else "hybrid_with_deterministic_candidates"
+
+    readers: Dict[str, object] = {}
+    try:
+        # 1) abre os canais e lê o primeiro lote de cada um (topo e pesos da fusão)
+        first: Dict[str, List[dict]] = {}
+        exhausted, dropped, errors = set(), {}, []
+
+        def open_all(depths: Dict[str, int]):
+            with timed("stream_open"):
+                opened = _in_parallel({ch: (_open_and_fetch, ch, q, d, STREAM_FETCH)
+                                       for ch, d in depths.items()})
+            for ch, (status, value) in opened.items():
+                if status == "error":
+                    dropped[ch] = "error"
+                    errors.append(value)
+                    continue
+                readers[ch], (rows, done) = value
+                first[ch] = rows
+                if done:
+                    exhausted.add(ch)
+
+        open_all(plan.depths)
+        fell_back = plan.needs_fallback(first)
+        if fell_back:
+            open_all(plan.fallback)
+        if errors and not readers:
+            raise errors[0]  # nenhum canal útil (ex.: banco fora)
+
+        merger = IncrementalFusion(first, exhausted, alpha, beta, gamma, delta,
+                                   require_kw_when_available, fusion)
+        yield {"type": "meta", "method": plan.method(base, fell_back), "mode": "stream",
+               "plan": plan.describe(fell_back),
+               "weights": {ch: round(w, 2) for ch, w in merger.weights.items()},
+               "k": k, "offset": offset}
+
+        # 2) emite o que já é definitivo; lê mais um lote dos canais abertos até completar a página
+        rank, target = 0, offset + k
+        while True:
+            ready = merger.ready()
+            page, left = ready[:target - rank], ready[target - rank:]
+            for r in page:
+                rank += 1
+                if rank == offset + 1:
+                    observe_stage("stream_first_result", time.perf_counter() - t0)
+                if rank > offset:
+                    yield {"type": "result", "rank": rank, **r}
+            if rank >= target or not merger.open:
+                break
+            fetched = _in_parallel({ch: (readers[ch].fetch, STREAM_FETCH) for ch in merger.open})
+            for ch, (status, value) in fetched.items():
+                if status == "error":
+                    # canal perdido no meio: encerrado com o que já foi lido
+                    dropped[ch] = "error"
+                    merger.add(ch, [], True)
+                else:
+                    merger.add(ch, *value)
+
+        returned = max(0, rank - offset)
+        record_rows("stream", returned)
+        more = rank >= target and (bool(left) or not merger.done)
+        yield {"type": "end", "returned": returned, "next_offset": target if more else None,
+               "dropped_channels": dropped}
+    finally:
+        for reader in readers.values():
+            reader.close()
+
+
+def search_stream(q: str, k: int = 100, offset: int = 0,
+                  alpha: float = 0.50, beta: float = 0.30, gamma: float = 0.10, delta: float = 0.10,
+                  require_kw_when_available: bool = True, fusion: str = None) -> Iterator[dict]:
+    """Iterador de linhas (dicts) da busca em streaming; ver o docstring do módulo.
+
+    A primeira linha ("meta") é produzida já na chamada: erros de configuração,
+    de banco ou de estratégia de fusão aparecem aqui, antes de o chamador
+    começar a responder. Os cursores são fechados ao fim da iteração ou quando
+    o iterador é descartado."""
+    if (fusion or SEARCH_FUSION) not in STREAMING_STRATEGIES:
+        raise ValueError(f"fusion em streaming deve ser um de {sorted(STREAMING_STRATEGIES)}")
+    get_provider()  # valida a configuração de embeddings (ex.: OPENAI_API_KEY)
+    assert all([DB_HOST, DB_USER, DB_PASSWORD, DB_NAME]), (
+        "Configure DB_HOST, DB_PORT, DB_USER, DB_PASSWORD e DB_NAME no .env"
+    )
+    lines = _stream(q, k, offset, alpha, beta, gamma, delta, require_kw_when_available, fusion)
+    return itertools.chain([next(lines)], lines)
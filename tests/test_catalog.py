@@ -0,0 +1,50 @@
+# tests/test_catalog.py
+"""CatalogWatcher: current() só lê o cache; start() e refresh() vão ao banco."""
+import pytest
+
+for mod in ("psycopg2", "dotenv"):
+    pytest.importorskip(mod)
+
+import catalog  # noqa: E402
+
+
+@pytest.fixture
+def watcher(monkeypatch):
+    w = catalog.CatalogWatcher(poll=3600)
+    w.versions, w.fetches = [], 0
+    monkeypatch.setattr(w, "_ensure_started", lambda: None)  # sem thread: leituras só quando o teste pede
+
+    def fetch():
+        w.fetches += 1
+        if not w.versions:
+            raise RuntimeError("banco fora")
+        return w.versions.pop(0)
+
+    monkeypatch.setattr(w, "_fetch", fetch)
+    return w
+
+
+def test_current_never_reaches_the_db(watcher):
+    assert watcher.current() == 0
+    assert watcher.current() == 0
+    assert watcher.fetches == 0
+
+
+def test_start_loads_the_version_and_tolerates_failures(watcher):
+    assert watcher.start() == 0  # banco fora: segue com 0
+    watcher.versions = [5]
+    assert watcher.start() == 5
+    assert watcher.current() == 5
+    assert watcher.start() == 5  # já carregada: não lê de novo
+    assert watcher.fetches == 2
+
+
+def test_listeners_run_only_on_change(watcher):
+    seen = []
+    watcher.on_change(lambda old, new: seen.append((old, new)))
+    watcher.versions = [1, 1, 2]
+    watcher.start()
+    watcher.refresh()
+    watcher.refresh()
+    assert seen == [(1, 2)]
+    assert watcher.current() == 2
@@ -0,0 +1,106 @@
+# tests/test_code_index.py
+"""Índice SKU/EAN: carga, consulta e recargas agrupadas por mudança de versão."""
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+for mod in ("psycopg2", "dotenv"):
+    pytest.importorskip(mod)
+
+import code_index  # noqa: E402
+from code_index import CodeIndex  # noqa: E402
+
+PRODUCTS = [("353.3", "Cimento CP II 50kg", "7899807213866"), ("10039", "Argamassa AC1", "7891234000011"),
+            ("20001", "Argamassa AC2", "7891234000011")]
+
+
+class FakePool:
+    def __init__(self, rows):
+        self.rows, self.loads = rows, 0
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        self.loads += 1
+        self._left = list(self.rows)
+
+    def fetchmany(self, n):
+        out, self._left = self._left[:n], self._left[n:]
+        return out
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    p = FakePool(PRODUCTS)
+    monkeypatch.setattr(code_index, "get_pool", lambda: p)
+    return p
+
+
+def test_lookup_by_normalized_sku_and_ean(pool):
+    index = CodeIndex()
+    index.refresh()
+    assert [h["sku"] for h in index.lookup("3533")] == ["353.3"]
+    assert [h["reason"] for h in index.lookup("353.3")] == ["sku"]
+    assert {h["sku"] for h in index.lookup("789-1234-000011")} == {"10039", "20001"}
+    assert index.lookup("999") == []
+
+
+@pytest.mark.parametrize("q, code", [("7899807213866", True), ("10.039", True), ("1", False),
+                                     ("cimento 50", False), ("", False)])
+def test_looks_like_code(q, code):
+    assert code_index.looks_like_code(q) is code
+
+
+@pytest.fixture
+def quick(monkeypatch, pool):
+    monkeypatch.setattr(code_index, "RELOAD_QUIET", 0.05)
+    monkeypatch.setattr(code_index, "RELOAD_MAX_DELAY", 0.2)
+    index = CodeIndex()
+    done = threading.Event()
+    refresh = index.refresh
+
+    def counted():
+        refresh()
+        done.set()
+
+    index.refresh = counted
+    index.done = done
+    return index
+
+
+def test_burst_of_version_changes_reloads_once(quick, pool):
+    for v in range(1, 6):  # commits periódicos de uma carga
+        quick._on_catalog_change(v, v + 1)
+    assert pool.loads == 0  # nada no thread do watcher
+    assert quick.done.wait(1)
+    time.sleep(0.1)
+    assert pool.loads == 1
+
+    quick.done.clear()
+    quick._on_catalog_change(6, 7)  # mudança depois da recarga agenda outra
+    assert quick.done.wait(1)
+    assert pool.loads == 2
+
+
+def test_changes_that_never_stop_still_reload_by_the_max_delay(quick, pool):
+    t0 = time.monotonic()
+    v = 0
+    while not quick.done.is_set() and time.monotonic() - t0 < 1:
+        quick._on_catalog_change(v, v + 1)  # mais rápido que RELOAD_QUIET
+        v += 1
+        time.sleep(0.01)
+    assert quick.done.is_set()
+    assert time.monotonic() - t0 < 0.5
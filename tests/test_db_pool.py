@@ -0,0 +1,154 @@
+# tests/test_db_pool.py
+"""Pool de conexões e statements preparados, com conexões falsas (sem banco)."""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+for mod in ("psycopg2", "dotenv"):
+    pytest.importorskip(mod)
+
+import psycopg2.extensions  # noqa: E402
+
+import db_pool  # noqa: E402
+
+STATEMENTS = {"sp_find": ("text, int", "SELECT * FROM rag.find(%s, %s);")}
+
+
+class FakeCursor:
+    def __init__(self, con):
+        self.connection = con
+
+    def execute(self, sql, params=None):
+        self.connection.sent.append((sql, params))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    def __init__(self, prepared=True):
+        self.sent = []
+        self.statements = STATEMENTS
+        self.prepared = {"sp_find"} if prepared else set()
+        self.prepare_failed = set() if prepared else {"sp_find"}
+        self.closed = 0
+        self.created_at = self.last_used = time.monotonic()
+        self.info = SimpleNamespace(transaction_status=psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = 1
+
+
+# ---------- execute_prepared ----------
+def test_prepared_statement_uses_execute():
+    con = FakeConnection()
+    db_pool.execute_prepared(con.cursor(), "sp_find", ("x", 5))
+    assert con.sent == [("EXECUTE sp_find(%s, %s);", ("x", 5))]
+
+
+def test_unprepared_statement_falls_back_to_sql():
+    con = FakeConnection(prepared=False)
+    db_pool.execute_prepared(con.cursor(), "sp_find", ("x", 5))
+    assert con.sent == [("SELECT * FROM rag.find(%s, %s);", ("x", 5))]
+
+
+def test_timeout_goes_in_the_same_round_trip():
+    con = FakeConnection()
+    db_pool.execute_prepared(con.cursor(), "sp_find", ("x", 5), timeout_ms=250)
+    assert con.sent == [("SET LOCAL statement_timeout = 250; EXECUTE sp_find(%s, %s);", ("x", 5))]
+
+
+def test_to_prepare_sql_placeholders():
+    assert db_pool.to_prepare_sql("SELECT %s, '%%' || %s;") == "SELECT $1, '%' || $2"
+
+
+# ---------- ConnectionPool ----------
+@pytest.fixture
+def pool(monkeypatch):
+    p = db_pool.ConnectionPool(0, 2, timeout=0.05, max_lifetime=60, healthcheck_idle=30)
+    opened = []
+
+    def fake_open():
+        con = FakeConnection()
+        opened.append(con)
+        p._stats["created"] += 1
+        return con
+
+    monkeypatch.setattr(p, "_open", fake_open)
+    p.opened = opened
+    return p
+
+
+def test_connections_are_reused(pool):
+    with pool.connection() as a:
+        pass
+    with pool.connection() as b:
+        pass
+    assert a is b
+    assert pool.stats()["created"] == 1
+
+
+def test_exhausted_pool_times_out(pool):
+    a, b = pool.getconn(), pool.getconn()
+    with pytest.raises(db_pool.PoolTimeout):
+        pool.getconn()
+    pool.putconn(a)
+    assert pool.getconn() is a
+    assert pool.stats()["timeouts"] == 1
+    pool.putconn(b)
+
+
+def test_old_connections_are_recycled(pool):
+    with pool.connection() as a:
+        pass
+    a.created_at -= 61
+    with pool.connection() as b:
+        pass
+    assert b is not a and a.closed
+    assert pool.stats()["recycled_lifetime"] == 1
+
+
+def test_broken_connections_are_discarded(pool):
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection():
+            raise psycopg2.OperationalError("conexão perdida")
+    stats = pool.stats()
+    assert (stats["discarded_broken"], stats["size"]) == (1, 0)
+    assert pool.opened[0].closed
+
+
+# ---------- pool_stats ----------
+def test_pool_stats_does_not_create_the_pool(monkeypatch, pool):
+    monkeypatch.setattr(db_pool, "_pool", None)
+    monkeypatch.setattr(db_pool, "ConnectionPool", lambda *a, **kw: pytest.fail("pool criado pelas métricas"))
+    assert db_pool.pool_stats() == {"started": False}
+    assert db_pool._pool is None
+
+    monkeypatch.setattr(db_pool, "_pool", pool)
+    stats = db_pool.pool_stats()
+    assert stats["started"] is True and stats["size"] == 0 and stats["max"] == 2
+
+
+def test_metrics_scrape_without_a_pool(monkeypatch):
+    for mod in ("fastapi", "httpx", "requests", "asyncpg", "numpy"):
+        pytest.importorskip(mod)
+    from fastapi.testclient import TestClient
+
+    import api
+
+    monkeypatch.setattr(db_pool, "_pool", None)
+    monkeypatch.setattr(db_pool, "get_pool", lambda *a: pytest.fail("pool criado pelo scrape"))
+    client = TestClient(api.app)  # sem `with`: não roda o startup (banco)
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert "search_pool_connections" not in resp.text
+    assert "embedding_cache_events" in resp.text
+    assert client.get("/search/stats").json()["pool"] == {"started": False}
+    assert db_pool._pool is None
@@ -0,0 +1,116 @@
+# tests/test_embedding_batcher.py
+"""Coalescer de embeddings: uma chamada por janela, resultado certo para cada chamador."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("dotenv")
+
+from embedding_batcher import EmbeddingBatcher, approx_tokens  # noqa: E402
+
+
+class FakeProvider:
+    """embed_many que registra cada chamada; o vetor identifica o texto."""
+
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+        self._lock = threading.Lock()
+
+    def __call__(self, texts):
+        with self._lock:
+            self.calls.append(list(texts))
+        if self.error is not None:
+            raise self.error
+        return [[float(len(t)), float(sum(map(ord, t)))] for t in texts]
+
+
+def vec(text):
+    return [float(len(text)), float(sum(map(ord, text)))]
+
+
+def batcher(provider, **kw):
+    # janela longa e um lote em voo: a divisão em lotes fica determinística
+    return EmbeddingBatcher(provider, **{"window_ms": 100, "max_inflight": 1, **kw})
+
+
+def test_concurrent_callers_share_one_call():
+    provider = FakeProvider()
+    b = batcher(provider)
+    texts = [f"consulta {i}" for i in range(20)]
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        results = list(pool.map(lambda t: b.submit(t).result(timeout=2), texts))
+    assert results == [vec(t) for t in texts]  # cada chamador recebe o próprio vetor
+    assert len(provider.calls) == 1 and sorted(provider.calls[0]) == sorted(texts)
+
+
+def test_repeated_text_is_embedded_once():
+    provider = FakeProvider()
+    b = batcher(provider)
+    futs = [b.submit(t) for t in ("cimento", "areia", "cimento")]
+    assert [f.result(timeout=2) for f in futs] == [vec("cimento"), vec("areia"), vec("cimento")]
+    assert provider.calls == [["cimento", "areia"]]
+
+
+def test_batch_size_limit():
+    provider = FakeProvider()
+    b = batcher(provider, max_items=2)
+    futs = [b.submit(f"q{i}") for i in range(5)]
+    assert [f.result(timeout=2) for f in futs] == [vec(f"q{i}") for i in range(5)]
+    assert [len(c) for c in provider.calls] == [2, 2, 1]
+
+
+def test_token_limit_moves_the_overflowing_text_to_the_next_batch():
+    provider = FakeProvider()
+    texts = ["a" * 30, "b" * 30, "c" * 30, "d"]  # 11 tokens estimados cada um (1 no último)
+    b = batcher(provider, max_tokens=2 * approx_tokens(texts[0]))
+    futs = [b.submit(t) for t in texts]
+    assert [f.result(timeout=2) for f in futs] == [vec(t) for t in texts]
+    assert provider.calls == [texts[:2], texts[2:]]
+    assert all(sum(map(approx_tokens, c)) <= b.max_tokens for c in provider.calls)
+
+
+def test_provider_error_reaches_every_waiter():
+    provider = FakeProvider(error=RuntimeError("API fora"))
+    b = batcher(provider)
+    futs = [b.submit(t) for t in ("x", "y", "x")]
+    for f in futs:
+        with pytest.raises(RuntimeError, match="API fora"):
+            f.result(timeout=2)
+    assert len(provider.calls) == 1
+    assert b.stats()["errors"] == 1
+
+
+def test_wrong_number_of_vectors_is_an_error():
+    b = batcher(lambda texts: [[0.0]])
+    futs = [b.submit("x"), b.submit("y")]
+    with pytest.raises(RuntimeError):
+        futs[1].result(timeout=2)
+
+
+def test_cancelled_request_is_not_embedded():
+    started, release = threading.Event(), threading.Event()
+    provider = FakeProvider()
+
+    def slow(texts):
+        started.set()
+        release.wait(2)
+        return provider(texts)
+
+    b = batcher(slow, window_ms=1)
+    first = b.submit("primeira")
+    assert started.wait(2)  # o único lote em voo está ocupado
+    gone, kept = b.submit("abandonada"), b.submit("mantida")
+    assert gone.cancel()
+    release.set()
+    assert kept.result(timeout=2) == vec("mantida") and first.result(timeout=2) == vec("primeira")
+    assert "abandonada" not in [t for c in provider.calls for t in c]
+
+
+def test_window_zero_calls_directly():
+    provider = FakeProvider()
+    b = EmbeddingBatcher(provider, window_ms=0)
+    assert not b.enabled
+    assert b.submit("cimento").result(timeout=0) == vec("cimento")
+    assert provider.calls == [["cimento"]]
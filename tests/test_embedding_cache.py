@@ -0,0 +1,63 @@
+# tests/test_embedding_cache.py
+"""Cache de embeddings de consulta: camadas em memória e em disco (SQLite)."""
+import pytest
+
+pytest.importorskip("dotenv")
+
+from embedding_cache import EmbeddingCache  # noqa: E402
+
+
+def test_normalized_queries_share_a_key():
+    assert EmbeddingCache.make_key("Cimento ", "m", 8) == EmbeddingCache.make_key("cimento", "m", 8)
+    assert EmbeddingCache.make_key("cimento", "m", 8) != EmbeddingCache.make_key("cimento", "m", 16)
+
+
+def test_memory_only():
+    cache = EmbeddingCache(maxsize=2, path=None)
+    assert not cache.persistent
+    assert cache.get_memory("a") is None
+    cache.put("a", [1.0, 2.0])
+    cache.put("b", [3.0])
+    cache.put("c", [4.0])  # LRU: "a" sai
+    assert cache.get("a") is None
+    assert cache.get("c") == [4.0]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 2, 1)
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    path = str(tmp_path / "emb.sqlite3")
+    EmbeddingCache(path=path).put("a", [0.5, 0.25])
+    cache = EmbeddingCache(path=path)
+    assert cache.get_memory("a") is None  # falta na memória não vira miss com disco
+    assert cache.get_disk("a") == [0.5, 0.25]
+    assert cache.get_memory("a") == [0.5, 0.25]  # promovido para a memória
+    stats = cache.stats()
+    assert (stats["hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 0)
+
+
+def test_put_memory_does_not_write_disk(tmp_path):
+    path = str(tmp_path / "emb.sqlite3")
+    cache = EmbeddingCache(path=path)
+    cache.put_memory("a", [1.0])
+    assert EmbeddingCache(path=path).get("a") is None
+    cache.put_disk("a", [1.0])
+    assert EmbeddingCache(path=path).get("a") == [1.0]
+
+
+def test_expired_disk_entry_is_dropped(tmp_path):
+    path = str(tmp_path / "emb.sqlite3")
+    EmbeddingCache(path=path).put("a", [1.0])
+    cache = EmbeddingCache(path=path, ttl=0.0)
+    assert cache.get("a") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_memory_only_clear_keeps_disk(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / "emb.sqlite3"))
+    cache.put("a", [1.0])
+    cache.clear(disk=False)
+    assert cache.get_memory("a") is None
+    assert cache.get_disk("a") == [1.0]
+    cache.clear()
+    assert cache.get("a") is None
@@ -0,0 +1,35 @@
+# tests/test_embeddings.py
+"""Provedores de embedding sem rede: configuração inválida e provedor `hash`."""
+import numpy as np
+import pytest
+
+pytest.importorskip("dotenv")
+
+import embeddings  # noqa: E402
+
+
+@pytest.fixture
+def no_provider(monkeypatch):
+    monkeypatch.setattr(embeddings, "_provider", None)
+
+
+def test_unknown_provider_is_a_regular_exception(monkeypatch, no_provider):
+    # roda dentro dos handlers da API: não pode ser SystemExit (BaseException)
+    monkeypatch.setattr(embeddings, "EMB_PROVIDER", "nope")
+    with pytest.raises(ValueError):
+        embeddings.get_provider()
+
+
+def test_local_without_fastembed_is_a_regular_exception(monkeypatch):
+    monkeypatch.setattr(embeddings, "TextEmbedding", None)
+    with pytest.raises(RuntimeError):
+        embeddings.LocalProvider("modelo", 384)
+
+
+def test_hash_provider_is_deterministic_and_normalized():
+    p = embeddings.HashProvider(dim=64)
+    a, b, c = p.embed(["Cimento CP-II 50kg", "cimento cp-ii 50KG", "tinta acrílica"])
+    assert a == b
+    assert np.isclose(np.linalg.norm(a), 1.0)
+    assert np.dot(a, b) > np.dot(a, c)
+
@@ -0,0 +1,100 @@
+# tests/test_fusion.py
+"""Fusão dos canais: estratégias maxnorm/rrf/zscore, pesos e filtro de palavra-chave."""
+import math
+
+import pytest
+
+for mod in ("numpy", "dotenv"):
+    pytest.importorskip(mod)
+
+import fusion  # noqa: E402
+
+WEIGHTS = dict(alpha=0.50, beta=0.30, gamma=0.10, delta=0.10)
+
+
+def row(sku, **scores):
+    return {"sku": sku, "name": f"produto {sku}", "codigo_barras": None, **scores}
+
+
+VEC = [row("A", dist=0.2), row("B", dist=0.6)]
+FT = [row("B", score_ft=0.5), row("C", score_ft=0.25)]
+
+
+def run(vec=VEC, ft=FT, trgm=(), kw=(), k=10, require_kw=False, strategy="maxnorm"):
+    return fusion.fuse(list(vec), list(ft), list(trgm), list(kw), k, **WEIGHTS,
+                       require_kw_when_available=require_kw, fusion=strategy)
+
+
+def skus(resp):
+    return [r["sku"] for r in resp["results"]]
+
+
+def test_empty_channels_drop_out_of_the_weights():
+    resp = run()
+    w = resp["weights"]
+    assert w["trgm"] == w["kw"] == 0.0
+    # 0.5 / 0.8 e 0.3 / 0.8, arredondados a 2 casas
+    assert w["vec"] == pytest.approx(0.625, abs=0.006) and w["ft"] == pytest.approx(0.375, abs=0.006)
+
+
+def test_maxnorm_divides_by_channel_max():
+    resp = run()
+    assert skus(resp) == ["B", "A", "C"]
+    b, a, c = resp["results"]
+    assert (a["vec"], b["vec"], b["ft"], c["ft"]) == (1.0, 0.5, 1.0, 0.5)
+    assert b["score"] == round(0.5 * 0.625 + 1.0 * 0.375, 4)
+    assert resp["confidence"] == b["score"]
+
+
+def test_rrf_uses_only_the_rank():
+    resp = run(strategy="rrf")
+    by_sku = {r["sku"]: r for r in resp["results"]}
+    second = round((fusion.FUSION_RRF_K + 1) / (fusion.FUSION_RRF_K + 2), 4)
+    assert by_sku["A"]["vec"] == 1.0 and by_sku["B"]["vec"] == second
+    assert by_sku["B"]["ft"] == 1.0 and by_sku["C"]["ft"] == second
+    # mesma posição, distâncias diferentes: mesma nota
+    far = run(vec=[row("A", dist=0.2), row("B", dist=0.95)], strategy="rrf")
+    assert far["results"] == resp["results"]
+
+
+def test_rrf_ties_keep_the_channel_order():
+    # kw só tem notas 0..3: empate é o caso comum; vale a posição da linha no canal
+    resp = run(kw=[row("B", score_kw=2.0), row("A", score_kw=2.0)], strategy="rrf")
+    by_sku = {r["sku"]: r for r in resp["results"]}
+    second = round((fusion.FUSION_RRF_K + 1) / (fusion.FUSION_RRF_K + 2), 4)
+    assert (by_sku["B"]["kw"], by_sku["A"]["kw"]) == (1.0, second)
+
+
+@pytest.mark.parametrize("strategy", ["maxnorm", "rrf"])
+def test_repeated_sku_in_a_channel_keeps_its_first_row(strategy):
+    ft = [row("B", score_ft=0.5), row("C", score_ft=0.25), row("B", score_ft=0.1), row("D", score_ft=0.05)]
+    by_sku = {r["sku"]: r for r in run(ft=ft, strategy=strategy)["results"]}
+    assert by_sku["B"]["ft"] == 1.0
+    if strategy == "rrf":  # a linha repetida ocupa a posição 3, como na fusão em streaming
+        assert by_sku["D"]["ft"] == round((fusion.FUSION_RRF_K + 1) / (fusion.FUSION_RRF_K + 4), 4)
+
+
+def test_zscore_squashes_deviation_and_single_values():
+    resp = run(strategy="zscore")
+    by_sku = {r["sku"]: r for r in resp["results"]}
+    assert by_sku["A"]["vec"] == round(1 / (1 + math.exp(-1)), 4)
+    assert by_sku["B"]["vec"] == round(1 / (1 + math.exp(1)), 4)
+    single = run(ft=[row("C", score_ft=0.3)], strategy="zscore")
+    assert {r["sku"]: r["ft"] for r in single["results"]}["C"] == 1.0
+
+
+def test_keyword_matches_take_the_top_when_required():
+    kw = [row("C", score_kw=2.0)]
+    assert skus(run(kw=kw, require_kw=True)) == ["C"]
+    assert set(skus(run(kw=kw, require_kw=False))) == {"A", "B", "C"}
+
+
+def test_k_cuts_results_and_empty_input():
+    assert skus(run(k=2)) == ["B", "A"]
+    empty = run(vec=(), ft=())
+    assert empty["results"] == [] and empty["confidence"] == 0.0
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        run(strategy="borda")
@@ -0,0 +1,112 @@
+# tests/test_ingest_bulk.py
+"""Modo bulk: tuplas do COPY binário e stage sem SKU repetido, com um cursor falso."""
+import csv
+import io
+import struct
+
+import pytest
+
+for mod in ("psycopg2", "dotenv", "tqdm", "tiktoken"):
+    pytest.importorskip(mod)
+
+import ingest_csv  # noqa: E402
+from ingest_csv import CopyWriter, PendingProduct  # noqa: E402
+
+
+def read_field(buf):
+    (n,) = struct.unpack("!i", buf.read(4))
+    return None if n == -1 else buf.read(n)
+
+
+def parse_chunks_copy(data: bytes):
+    """Lê um COPY binário de ingest_stage_chunks: [(sku, chunk_no, content, embedding)]."""
+    buf = io.BytesIO(data)
+    assert buf.read(11) == b"PGCOPY\n\xff\r\n\x00"
+    flags, ext = struct.unpack("!ii", buf.read(8))
+    assert (flags, ext) == (0, 0)
+    rows = []
+    while True:
+        (nfields,) = struct.unpack("!h", buf.read(2))
+        if nfields == -1:
+            break
+        assert nfields == 4
+        sku, chunk_no, content, vec = (read_field(buf) for _ in range(4))
+        dim, reserved = struct.unpack("!hh", vec[:4])
+        assert reserved == 0 and len(vec) == 4 + 4 * dim
+        rows.append((sku.decode("utf-8"), struct.unpack("!i", chunk_no)[0], content.decode("utf-8"),
+                     list(struct.unpack(f"!{dim}f", vec[4:]))))
+    assert buf.read() == b""
+    return rows
+
+
+class FakeCopyCursor:
+    def __init__(self):
+        self.flushes = []
+        self.sql = []
+
+    def execute(self, sql, params=None):
+        self.sql.append(sql.split()[0])
+
+    def copy_expert(self, sql, f):
+        data = f.read()
+        if "ingest_stage_products" in sql:
+            self.flushes.append({"products": list(csv.reader(io.StringIO(data)))})
+        else:
+            self.flushes[-1]["chunks"] = parse_chunks_copy(data)
+
+
+def product(sku, chunks, name="Cimento"):
+    row = {c: None for c in ingest_csv.STAGE_PRODUCT_COLS}
+    row.update(sku=sku, name=name, raw='{"a": "ç"}', content_hash=f"h-{sku}")
+    return PendingProduct(row, name, chunks=list(chunks))
+
+
+def test_binary_row_matches_the_column_types():
+    data = (ingest_csv._PGCOPY_HEADER
+            + ingest_csv.binary_chunk_row("353.3", 2, "Cimento CP-II ção", [0.5, -1.25, 3.0])
+            + ingest_csv._PGCOPY_TRAILER)
+    assert parse_chunks_copy(data) == [("353.3", 2, "Cimento CP-II ção", [0.5, -1.25, 3.0])]
+
+
+def test_float4_precision():
+    (_, _, _, vec), = parse_chunks_copy(ingest_csv._PGCOPY_HEADER
+                                        + ingest_csv.binary_chunk_row("1", 1, "x", [0.1, 1e-8])
+                                        + ingest_csv._PGCOPY_TRAILER)
+    assert vec == pytest.approx([0.1, 1e-8], rel=1e-6)
+
+
+def test_products_and_chunks_reach_the_stage():
+    cur = FakeCopyCursor()
+    w = CopyWriter(cur, max_rows=100)
+    w.write([product("A", ["a1", "a2"]), product("B", [])], [[1.0, 0.0], [0.0, 1.0]])
+    w.flush()
+    (flush,) = cur.flushes
+    cols = ingest_csv.STAGE_PRODUCT_COLS
+    assert [dict(zip(cols, r))["sku"] for r in flush["products"]] == ["A", "B"]
+    assert dict(zip(cols, flush["products"][0]))["estoque"] == "\\N"  # NULL '\N'
+    assert flush["chunks"] == [("A", 1, "a1", [1.0, 0.0]), ("A", 2, "a2", [0.0, 1.0])]
+    assert cur.sql[-3:] == ["INSERT", "DELETE", "TRUNCATE"]  # merge, troca de chunks, limpa o stage
+
+
+def test_repeated_sku_flushes_before_restaging():
+    cur = FakeCopyCursor()
+    w = CopyWriter(cur, max_rows=100)
+    w.write([product("A", ["velho"], name="antigo"), product("B", ["b"])], [[1.0], [2.0]])
+    w.write([product("A", ["novo"], name="novo")], [[3.0]])
+    w.flush()
+    # nenhum COPY leva o mesmo SKU duas vezes; a última linha é gravada por último
+    for flush in cur.flushes:
+        skus = [r[0] for r in flush["products"]]
+        assert len(skus) == len(set(skus))
+    assert [[r[0] for r in f["products"]] for f in cur.flushes] == [["A", "B"], ["A"]]
+    assert cur.flushes[-1]["chunks"] == [("A", 1, "novo", [3.0])]
+
+
+def test_flushes_every_max_rows_products():
+    cur = FakeCopyCursor()
+    w = CopyWriter(cur, max_rows=2)
+    for i in range(5):
+        w.write([product(str(i), ["c"])], [[float(i)]])
+    w.flush()
+    w.flush()  # nada pendente: não gera COPY vazio
+    assert [len(f["products"]) for f in cur.flushes] == [2, 2, 1]
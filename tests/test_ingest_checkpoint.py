@@ -0,0 +1,74 @@
+# tests/test_ingest_checkpoint.py
+"""Checkpoint da carga (rag.ingest_checkpoints) com um cursor em memória."""
+import pytest
+
+for mod in ("psycopg2", "dotenv", "tqdm", "tiktoken"):
+    pytest.importorskip(mod)
+
+import ingest_csv  # noqa: E402
+
+
+class FakeCheckpointCursor:
+    """Só o que Checkpoint.load/save usam: upsert por file_key e SELECT por file_key."""
+
+    def __init__(self):
+        self.rows = {}
+        self._result = None
+
+    def execute(self, sql, params=None):
+        if sql.lstrip().startswith("INSERT INTO rag.ingest_checkpoints"):
+            key, _name, _size, records, products, chunks, unchanged, done, _fresh = params
+            self.rows[key] = (records, products, chunks, unchanged, done)
+        elif "FROM rag.ingest_checkpoints" in sql:
+            self._result = self.rows.get(params[0])
+        else:
+            raise AssertionError(f"SQL inesperado: {sql}")
+
+    def fetchone(self):
+        return self._result
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    path = tmp_path / "produtos.csv"
+    path.write_text("codigo_produto;descricao\n1;a\n2;b\n", encoding="utf-8")
+    return str(path)
+
+
+def _save(cur, csv_path, shard, records, done=False):
+    cp = ingest_csv.Checkpoint.load(cur, csv_path, shard=shard)
+    cp.records, cp.products, cp.done = records, records, done
+    cp.save(cur)
+
+
+def test_resumes_from_saved_offset(csv_file):
+    cur = FakeCheckpointCursor()
+    _save(cur, csv_file, "", 120)
+    cp = ingest_csv.Checkpoint.load(cur, csv_file)
+    assert (cp.records, cp.products) == (120, 120)
+
+
+def test_shard_offsets_are_per_shard(csv_file):
+    cur = FakeCheckpointCursor()
+    _save(cur, csv_file, "", 500)  # carga sem shards, interrompida
+    _save(cur, csv_file, "1/2", 30)
+    _save(cur, csv_file, "2/2", 70)
+    assert ingest_csv.Checkpoint.load(cur, csv_file, shard="1/2").records == 30
+    assert ingest_csv.Checkpoint.load(cur, csv_file, shard="2/2").records == 70
+    assert ingest_csv.Checkpoint.load(cur, csv_file).records == 500
+    # shard sem checkpoint próprio não herda o da carga sem shards
+    assert ingest_csv.Checkpoint.load(cur, csv_file, shard="1/3").records == 0
+
+
+def test_finished_or_restarted_starts_over(csv_file):
+    cur = FakeCheckpointCursor()
+    _save(cur, csv_file, "", 200, done=True)
+    assert ingest_csv.Checkpoint.load(cur, csv_file).records == 0
+    _save(cur, csv_file, "", 50)
+    assert ingest_csv.Checkpoint.load(cur, csv_file, restart=True).records == 0
+
+
+def test_file_identity_changes_with_content(csv_file, tmp_path):
+    other = tmp_path / "outro.csv"
+    other.write_text("codigo_produto;descricao\n1;a\n2;c\n", encoding="utf-8")
+    assert ingest_csv.file_identity(csv_file) != ingest_csv.file_identity(str(other))
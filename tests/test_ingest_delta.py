@@ -0,0 +1,112 @@
+# tests/test_ingest_delta.py
+"""Modo delta: content_hash, mark_unchanged, lotes e contagem de SKUs repetidos."""
+from types import SimpleNamespace
+
+import pytest
+
+for mod in ("psycopg2", "dotenv", "tqdm", "tiktoken"):
+    pytest.importorskip(mod)
+
+import ingest_csv  # noqa: E402
+from ingest_csv import PendingProduct  # noqa: E402
+
+
+def product(sku, text="texto", chunks=(), tokens=0, content_hash=None):
+    row = {"sku": sku, "content_hash": content_hash or f"h-{sku}"}
+    return PendingProduct(row, text, chunks=list(chunks), tokens=tokens)
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    p = SimpleNamespace(model="modelo-a", dim=8)
+    monkeypatch.setattr(ingest_csv, "get_provider", lambda: p)
+    return p
+
+
+class FakeLookupConnection:
+    """Conexão só de leitura do mark_unchanged: SELECT sku, content_hash ... ANY(%s)."""
+
+    def __init__(self, stored):
+        self.stored = stored
+        self.queries = []
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        skus = params[0]
+        self.queries.append(list(skus))
+        self._rows = [(s, self.stored[s]) for s in skus if s in self.stored]
+
+    def fetchall(self):
+        return self._rows
+
+
+def test_content_hash_changes_with_text_and_model(provider):
+    h = ingest_csv.content_hash("parafuso 8mm")
+    assert h == ingest_csv.content_hash("parafuso 8mm")
+    assert h != ingest_csv.content_hash("parafuso 10mm")
+    provider.model = "modelo-b"
+    assert h != ingest_csv.content_hash("parafuso 8mm")
+    provider.model, provider.dim = "modelo-a", 16
+    assert h != ingest_csv.content_hash("parafuso 8mm")
+
+
+def test_mark_unchanged_compares_stored_hash_in_windows():
+    con = FakeLookupConnection({"A": "h-A", "B": "antigo", "D": "h-D"})
+    products = [product(s) for s in "ABCDE"]
+    out = list(ingest_csv.mark_unchanged(iter(products), con, window=2))
+    assert [p.row["sku"] for p in out] == list("ABCDE")  # ordem do CSV preservada
+    assert [p.unchanged for p in out] == [True, False, False, True, False]
+    assert con.queries == [["A", "B"], ["C", "D"], ["E"]]
+
+
+def test_chunk_products_skips_unchanged():
+    same, changed = product("A"), product("B", text="um texto novo")
+    same.unchanged = True
+    out = list(ingest_csv.chunk_products([same, changed]))
+    assert out[0].chunks == [] and out[0].tokens == 0
+    assert out[1].chunks and out[1].tokens > 0
+
+
+def test_batch_products_bounds_items_and_tokens():
+    items = [product(str(i), chunks=["c"] * 2, tokens=10) for i in range(5)]
+    assert [len(b) for b in ingest_csv.batch_products(items, max_items=4, max_tokens=1000)] == [2, 2, 1]
+    assert [len(b) for b in ingest_csv.batch_products(items, max_items=100, max_tokens=25)] == [2, 2, 1]
+    # inalterados (sem chunks) contam como um item cada
+    unchanged = [product(str(i)) for i in range(5)]
+    assert [len(b) for b in ingest_csv.batch_products(unchanged, max_items=2, max_tokens=0)] == [2, 2, 1]
+    # produto maior que o limite forma um lote próprio
+    big = [product("big", chunks=["c"] * 10, tokens=10), product("x", chunks=["c"], tokens=1)]
+    assert [len(b) for b in ingest_csv.batch_products(big, max_items=4, max_tokens=1000)] == [1, 1]
+
+
+class ListWriter:
+    def __init__(self):
+        self.batches = []
+
+    def write(self, batch, embeddings):
+        self.batches.append([p.row["sku"] for p in batch])
+
+    def flush(self):
+        pass
+
+
+def test_pipeline_reports_rows_and_deduped_upserts(monkeypatch):
+    monkeypatch.setattr(ingest_csv, "embed_cached", lambda texts, gate, cache=None: [[0.0]] * len(texts))
+    rows = [product("A", text="1", chunks=["a1"]), product("B", chunks=["b"]),
+            product("A", text="2", chunks=["a2"])]
+    writer, calls = ListWriter(), []
+    written, chunks = ingest_csv.run_pipeline(
+        writer, iter(rows), concurrency=1,
+        on_write=lambda batch, n_chunks, n: calls.append((len(batch), n_chunks, n)))
+    # SKU repetido no lote: um upsert só (a última linha), mas as 3 linhas foram consumidas
+    assert writer.batches == [["A", "B"]]
+    assert calls == [(2, 2, 3)]
+    assert (written, chunks) == (3, 2)
@@ -0,0 +1,110 @@
+# tests/test_ingest_embedding_cache.py
+"""Cache de embeddings de chunks (rag.embedding_cache) com uma conexão em memória."""
+from types import SimpleNamespace
+
+import pytest
+
+for mod in ("psycopg2", "dotenv", "tqdm", "tiktoken"):
+    pytest.importorskip(mod)
+
+import ingest_csv  # noqa: E402
+from ingest_csv import ChunkEmbeddingCache, embed_cached  # noqa: E402
+
+
+class FakeCacheDB:
+    """rag.embedding_cache em memória: SELECT por chave e INSERT ... ON CONFLICT DO NOTHING."""
+
+    def __init__(self):
+        self.rows = {}
+        self.inserts = []
+        self.closed = 0
+
+    # conexão
+    def cursor(self):
+        return self
+
+    def close(self):
+        self.closed += 1
+
+    # cursor
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        assert "FROM rag.embedding_cache" in sql
+        self._result = [(k, self.rows[k][1]) for k in params[0] if k in self.rows]
+
+    def fetchall(self):
+        return self._result
+
+    def insert(self, cur, sql, rows, template=None, page_size=100):
+        assert "ON CONFLICT (key) DO NOTHING" in sql
+        self.inserts.append([r[0] for r in rows])
+        for key, model, vec in rows:
+            self.rows.setdefault(key, (model, vec))
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeCacheDB()
+    monkeypatch.setattr(ingest_csv, "connect_db", lambda: fake)
+    monkeypatch.setattr(ingest_csv, "execute_values", fake.insert)
+    return fake
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    p = SimpleNamespace(model="modelo-a", dim=2, calls=[])
+    monkeypatch.setattr(ingest_csv, "get_provider", lambda: p)
+
+    def embed(texts, gate):
+        p.calls.append(list(texts))
+        return [[float(len(t)), 0.5] for t in texts]
+
+    monkeypatch.setattr(ingest_csv, "embed_with_retry", embed)
+    return p
+
+
+def vec(text):
+    return [float(len(text)), 0.5]
+
+
+def test_identical_texts_in_a_batch_are_embedded_once(provider):
+    out = embed_cached(["areia", "cimento", "areia"], gate=None)
+    assert out == [vec("areia"), vec("cimento"), vec("areia")]
+    assert provider.calls == [["areia", "cimento"]]
+
+
+def test_hits_skip_the_api_and_misses_are_stored(db, provider):
+    cache = ChunkEmbeddingCache()
+    assert embed_cached(["a", "bb"], None, cache) == [vec("a"), vec("bb")]
+    assert (cache.hits, cache.misses) == (0, 2)
+
+    out = embed_cached(["bb", "ccc", "a", "ccc"], None, cache)
+    assert out == [vec("bb"), vec("ccc"), vec("a"), vec("ccc")]
+    assert provider.calls == [["a", "bb"], ["ccc"]]  # só o texto novo vai à API
+    assert (cache.hits, cache.misses) == (2, 3)
+
+    assert embed_cached(["ccc", "a"], None, cache) == [vec("ccc"), vec("a")]
+    assert len(provider.calls) == 2
+    cache.close()
+    assert db.closed == 1
+
+
+def test_key_includes_the_model(db, provider):
+    cache = ChunkEmbeddingCache()
+    embed_cached(["cimento"], None, cache)
+    provider.model = "modelo-b"  # outro modelo: a mesma frase é outra chave
+    embed_cached(["cimento"], None, cache)
+    assert provider.calls == [["cimento"], ["cimento"]]
+    assert sorted(model for model, _ in db.rows.values()) == ["modelo-a", "modelo-b"]
+
+
+def test_inserts_are_sorted_by_key(db, provider):
+    cache = ChunkEmbeddingCache()
+    embed_cached([f"texto {i}" for i in range(10)], None, cache)
+    (keys,) = db.inserts
+    assert keys == sorted(keys)  # mesma ordem de travas entre workers/shards
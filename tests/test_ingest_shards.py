@@ -0,0 +1,81 @@
+# tests/test_ingest_shards.py
+"""Divisão do CSV em faixas de bytes (split_csv_ranges) e leitura por faixa."""
+import pytest
+
+for mod in ("psycopg2", "dotenv", "tqdm", "tiktoken"):
+    pytest.importorskip(mod)
+
+import ingest_csv  # noqa: E402
+
+DESCRIPTIONS = ['Tubo 1/2" pvc', '"duas\nlinhas; com ""aspas"""', "simples", "ação"]
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    lines = ["codigo_produto;descricao;estoque"]
+    for i in range(600):
+        lines.append(f"{i % 450}.{i % 3};{DESCRIPTIONS[i % 4]};{i}")
+        if i % 100 == 7:
+            lines.append("ruim;linha")
+    path = tmp_path / "produtos.csv"
+    path.write_bytes(("\r\n".join(lines) + "\r\n").encode("utf-8"))
+    return str(path)
+
+
+def _read(csv_path, byte_range=None, bad_path=None):
+    with ingest_csv.CsvRecords(csv_path, byte_range=byte_range, bad_lines_path=bad_path) as source:
+        return list(source), list(source.bad.sample)
+
+
+@pytest.mark.parametrize("shards", [1, 2, 5, 40])
+def test_ranges_cover_every_record_once(csv_file, tmp_path, shards):
+    full, full_bad = _read(csv_file, bad_path=str(tmp_path / "all.txt"))
+    ranges, _ = ingest_csv.split_csv_ranges(csv_file, shards, ";", "utf-8")
+    assert len(ranges) == shards
+    assert all(end == nxt for (_, end, _), (nxt, _, _) in zip(ranges, ranges[1:]))
+    got, bad = [], []
+    for i, r in enumerate(ranges):
+        rows, sample = _read(csv_file, r, str(tmp_path / f"part{i}.txt"))
+        got += rows
+        bad += sample
+    assert got == full
+    assert sorted(bad) == full_bad  # linhas físicas absolutas, não relativas à faixa
+
+
+def test_repeated_sku_belongs_to_last_shard(csv_file, tmp_path):
+    ranges, later = ingest_csv.split_csv_ranges(csv_file, 4, ";", "utf-8")
+    assert any(later[:-1]) and not later[-1]
+    written = {}  # SKU -> (shard, linha gravada), com "vale a última" dentro de cada shard
+    for i, r in enumerate(ranges):
+        for row in _read(csv_file, r, str(tmp_path / f"part{i}.txt"))[0]:
+            sku = ingest_csv.normalize_sku(row["codigo_produto"])
+            if sku in later[i]:
+                continue
+            assert written.get(sku, (i,))[0] == i, f"SKU {sku} gravado por dois shards"
+            written[sku] = (i, row)
+    full, _ = _read(csv_file, bad_path=str(tmp_path / "all.txt"))
+    expected = {ingest_csv.normalize_sku(r["codigo_produto"]): r for r in full}
+    assert {sku: row for sku, (_, row) in written.items()} == expected
+
+
+def test_single_shard_for_small_file(tmp_path):
+    path = tmp_path / "p.csv"
+    path.write_text("codigo_produto;descricao\n1;a\n", encoding="utf-8")
+    ranges, later = ingest_csv.split_csv_ranges(str(path), 8, ";", "utf-8")
+    assert ranges == [(len("codigo_produto;descricao\n"), path.stat().st_size, 2)]
+    assert later == [set()]
+
+
+def test_invalid_bytes_after_the_sniff_sample_are_reported(tmp_path):
+    # amostra utf-8 limpa; um byte cp1252 ("ç" = 0xE7) só depois dela
+    head = "codigo_produto;descricao\n" + "".join(f"{i};ação {i}\n" for i in range(8000))
+    path = tmp_path / "misto.csv"
+    path.write_bytes(head.encode("utf-8") + "999;cal\xe7ada\n1000;fim\n".encode("cp1252"))
+    assert len(head.encode("utf-8")) > ingest_csv.CSV_SNIFF_BYTES
+    with ingest_csv.CsvRecords(str(path), bad_lines_path=str(tmp_path / "bad.txt")) as source:
+        rows = list(source)
+        assert source.encoding == "utf-8" and source.bad.count == 1
+        assert source.bad.sample == [8002]
+    assert [r["codigo_produto"] for r in rows[-2:]] == ["7999", "1000"]
+    assert all("�" not in r["descricao"] for r in rows)
+    assert "[encoding utf-8] 999;cal�ada" in (tmp_path / "bad.txt").read_text(encoding="utf-8")
@@ -0,0 +1,76 @@
+# tests/test_metrics.py
+"""Formato de exposição (/metrics), escape de rótulos e header Server-Timing."""
+import contextvars
+
+import metrics
+from metrics import Histogram
+
+
+def test_histogram_exposition_is_cumulative():
+    h = Histogram("demo_seconds", "Demo", "stage", (0.1, 1.0))
+    for v in (0.05, 0.1, 0.5, 3.0):
+        h.observe("embed", v)
+    h.observe("ft", 0.2)
+    assert list(h.render()) == [
+        "# HELP demo_seconds Demo",
+        "# TYPE demo_seconds histogram",
+        'demo_seconds_bucket{stage="embed",le="0.1"} 2',  # le é inclusivo
+        'demo_seconds_bucket{stage="embed",le="1"} 3',
+        'demo_seconds_bucket{stage="embed",le="+Inf"} 4',
+        'demo_seconds_sum{stage="embed"} 3.650000',
+        'demo_seconds_count{stage="embed"} 4',
+        'demo_seconds_bucket{stage="ft",le="0.1"} 0',
+        'demo_seconds_bucket{stage="ft",le="1"} 1',
+        'demo_seconds_bucket{stage="ft",le="+Inf"} 1',
+        'demo_seconds_sum{stage="ft"} 0.200000',
+        'demo_seconds_count{stage="ft"} 1',
+    ]
+
+
+def test_label_values_are_escaped():
+    assert metrics.escape_label('a\\b"c\nd') == 'a\\\\b\\"c\\nd'
+    h = Histogram("demo_seconds", "linha 1\nlinha 2", "path", (1.0,))
+    h.observe('/x/"{id}"', 0.5)
+    lines = list(h.render())
+    assert lines[0] == "# HELP demo_seconds linha 1\\nlinha 2"
+    assert lines[2] == 'demo_seconds_bucket{path="/x/\\"{id}\\"",le="1"} 1'
+    assert all("\n" not in line for line in lines)
+
+
+def test_gauge_lines_skip_non_numbers():
+    lines = metrics.gauge_lines("cache_events", "Cache", {"hits": 3, "ratio": 0.25, "enabled": True,
+                                                         "path": "/tmp", 'a"b': 1}, label="event")
+    assert lines == [
+        "# HELP cache_events Cache",
+        "# TYPE cache_events gauge",
+        'cache_events{event="a\\"b"} 1',
+        'cache_events{event="hits"} 3',
+        'cache_events{event="ratio"} 0.25',
+    ]
+
+
+def test_render_ends_with_newline_and_includes_extra_lines():
+    out = metrics.render(["# TYPE extra gauge", "extra 1"])
+    assert out.endswith("extra 1\n")
+    assert "# TYPE stage_duration_seconds histogram" in out
+
+
+def test_server_timing_header():
+    header = metrics.server_timing_header([("find_by_code", 0.0012), ("embed", 0.085), ("embed", 0.015),
+                                           ("vtex simulate;x", 0.002), ("ação", 0.001)])
+    assert header == "find_by_code;dur=1.2, embed;dur=100.0, vtex_simulate_x;dur=2.0, a__o;dur=1.0"
+    assert metrics.server_timing_header([]) == ""
+
+
+def test_timed_feeds_the_current_request_only():
+    def request():
+        timings = metrics.begin_request()
+        with metrics.timed("demo_stage"):
+            pass
+        return timings
+
+    timings = contextvars.copy_context().run(request)
+    assert [stage for stage, _ in timings] == ["demo_stage"]
+    assert "demo_stage" in metrics.STAGE_SECONDS.snapshot()
+    with metrics.timed("outside"):  # fora de uma requisição: só o histograma
+        pass
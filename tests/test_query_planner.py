@@ -0,0 +1,73 @@
+# tests/test_query_planner.py
+"""Planner: formato da consulta, canais por plano, fallback vetorial e descrição."""
+import pytest
+
+for mod in ("psycopg2", "dotenv"):
+    pytest.importorskip(mod)
+
+import query_planner  # noqa: E402
+from query_planner import classify, plan_query  # noqa: E402
+
+DEPTHS = dict(k_vec=40, k_ft=30, k_trgm=20, k_kw=10)
+
+
+@pytest.mark.parametrize("q, shape", [
+    ("7899807213866", "code"),
+    ("10.039", "code"),
+    ("cimento", "single_token"),
+    ("  Cimento  ", "single_token"),
+    ("tinta acrílica branca", "short_phrase"),
+    ("tinta acrílica fosca branca para parede externa", "long"),
+])
+def test_classify(q, shape):
+    assert classify(q) == shape
+
+
+def test_long_threshold(monkeypatch):
+    monkeypatch.setattr(query_planner, "PLANNER_LONG_TOKENS", 3)
+    assert classify("tinta branca") == "short_phrase"
+    assert classify("tinta acrílica branca") == "long"
+
+
+@pytest.mark.parametrize("q, depths", [
+    ("7899807213866", {"ft": 15, "trgm": 20, "kw": 10}),
+    ("cimento", {"ft": 15, "trgm": 20, "kw": 5}),
+    ("tinta acrílica branca", {"vec": 40, "ft": 30, "trgm": 10, "kw": 10}),
+    ("tinta acrílica fosca branca para parede externa", {"vec": 40, "ft": 30, "kw": 5}),
+])
+def test_depths_depend_on_shape(q, depths):
+    plan = plan_query(q, **DEPTHS)
+    assert plan.depths == depths
+    assert plan.embeds is ("vec" in depths)
+
+
+def test_depths_round_up():
+    plan = plan_query("cimento", k_vec=7, k_ft=3, k_trgm=1, k_kw=1)
+    assert plan.depths == {"ft": 2, "trgm": 1, "kw": 1}
+    assert plan.fallback == {"vec": 7}
+
+
+def test_single_token_falls_back_to_vector_only_without_text_hits():
+    plan = plan_query("cimento", **DEPTHS)
+    assert plan.fallback == {"vec": 40}
+    assert plan.needs_fallback({"ft": [], "trgm": [{"sku": "1"}], "kw": []})  # trigram não conta
+    assert not plan.needs_fallback({"ft": [{"sku": "1"}], "kw": []})
+    assert not plan.needs_fallback({"kw": [{"sku": "1"}]})
+    assert not plan_query("tinta branca", **DEPTHS).needs_fallback({})  # sem fallback no plano
+
+
+def test_method_and_describe():
+    plan = plan_query("cimento", **DEPTHS)
+    assert plan.method("hybrid") == "hybrid:single_token"
+    assert plan.method("hybrid", fell_back=True) == "hybrid:single_token+vec_fallback"
+    assert plan.describe() == {"shape": "single_token", "channels": ["ft", "kw", "trgm"],
+                               "depths": {"ft": 15, "trgm": 20, "kw": 5}, "embedded": False}
+    after = plan.describe(fell_back=True)
+    assert after["channels"] == ["ft", "kw", "trgm", "vec"] and after["embedded"] is True
+
+
+def test_disabled_planner_runs_every_channel():
+    plan = plan_query("cimento", **DEPTHS, enabled=False)
+    assert plan.shape == "full"
+    assert plan.depths == {"vec": 40, "ft": 30, "trgm": 20, "kw": 10} and not plan.fallback
+    assert plan.method("hybrid") == "hybrid"
@@ -0,0 +1,107 @@
+# tests/test_response_cache.py
+"""ResponseCache.get_or_compute: acertos, coalescência e cancelamento do líder."""
+import asyncio
+
+import pytest
+
+pytest.importorskip("dotenv")
+
+from response_cache import ResponseCache  # noqa: E402
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_misses_compute_once():
+    cache = ResponseCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"results": [1]}
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+
+    assert run(main()) == [{"results": [1]}] * 5
+    assert len(calls) == 1
+    assert run(cache.get_or_compute("k", compute)) == {"results": [1]}
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"], stats["inflight"]) == (1, 4, 1, 0)
+
+
+def test_followers_recompute_when_leader_is_cancelled():
+    cache = ResponseCache()
+    started = []
+
+    async def compute():
+        started.append(1)
+        await asyncio.sleep(0.05)
+        return {"results": [len(started)]}
+
+    async def main():
+        leader = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(cache.get_or_compute("k", compute)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()  # cliente do líder desconectou
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    assert run(main()) == [{"results": [2]}] * 3
+    assert len(started) == 2  # um seguidor assumiu a computação
+
+
+def test_cancelled_follower_does_not_cancel_leader():
+    cache = ResponseCache()
+
+    async def compute():
+        await asyncio.sleep(0.02)
+        return {"results": []}
+
+    async def main():
+        leader = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    assert run(main()) == {"results": []}
+
+
+def test_errors_reach_followers_and_are_not_cached():
+    cache = ResponseCache()
+
+    async def boom():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("banco fora")
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute("k", boom) for _ in range(3)),
+                                    return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in run(main()))
+    assert cache.get("k") is None
+
+
+def test_degraded_response_is_not_cached():
+    cache = ResponseCache()
+
+    async def degraded():
+        return {"results": [], "dropped_channels": {"vec": "timeout"}}
+
+    run(cache.get_or_compute("k", degraded))
+    assert cache.get("k") is None
+
+
+def test_ttl_expiry():
+    cache = ResponseCache(ttl=0.0)
+    cache.put("k", {"results": []})
+    assert cache.get("k") is None
+    assert cache.stats()["expired"] == 1
@@ -0,0 +1,94 @@
+# tests/test_search_batch.py
+"""/search/batch: limites do corpo (4xx) e respostas na ordem das consultas, sem banco."""
+from types import SimpleNamespace
+
+import pytest
+
+for mod in ("psycopg2", "dotenv", "numpy"):
+    pytest.importorskip(mod)
+
+import search_products as sp  # noqa: E402
+
+QUERIES = ["tinta acrílica branca", "7899807213866", "cimento", "argamassa ac2 cinza para piso", "areia"]
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """Canais e find_by_code em memória: cada linha leva a consulta de origem no SKU."""
+    calls = []
+
+    def query_all(sql, params):
+        calls.append(sql)
+        if sql is sp.BATCH_FIND_BY_CODE_SQL:
+            return [{"i": j, "sku": f"det-{q}", "name": q, "codigo_barras": q, "reason": "codigo_barras"}
+                    for j, q in enumerate(params[0], start=1) if q.isdigit()]
+        positions, _, depth = params
+        score = {sp.BATCH_VEC_SQL: ("dist", 0.1), sp.BATCH_FT_SQL: ("score_ft", 0.5),
+                 sp.BATCH_TRGM_SQL: ("score_trgm", 0.4), sp.BATCH_KW_SQL: ("score_kw", 2.0)}[sql]
+        return [{"i": i, "product_id": i, "sku": f"{QUERIES[i - 1]}#{n}", "name": QUERIES[i - 1],
+                 "codigo_barras": None, score[0]: score[1] - n / 100}
+                for i in positions for n in range(min(depth, 3))]
+
+    monkeypatch.setattr(sp, "_query_all", query_all)
+    monkeypatch.setattr(sp, "answer_from_memory", lambda q: None)
+    monkeypatch.setattr(sp, "embed_queries", lambda qs: [[0.0, 1.0] for _ in qs])
+    monkeypatch.setattr(sp, "get_provider", lambda: SimpleNamespace(model="m", dim=2))
+    monkeypatch.setattr(sp.vector_index, "get", lambda: None)
+    return calls
+
+
+def test_results_follow_the_input_order(fake_db):
+    out = sp.search_products_batch(QUERIES, k=2)
+    assert len(out) == len(QUERIES)
+    assert out[1]["method"] == "deterministic" and out[1]["results"][0]["sku"] == "det-7899807213866"
+    for q, resp in zip(QUERIES, out):
+        if q.isdigit():
+            continue
+        assert resp["mode"] == "batch" and len(resp["results"]) == 2
+        assert all(r["sku"].startswith(q + "#") for r in resp["results"]), q
+    # uma query por canal para o lote inteiro (vetorial só para quem o plano inclui)
+    assert fake_db.count(sp.BATCH_FIND_BY_CODE_SQL) == 1
+    assert all(fake_db.count(sql) <= 1 for sql in (sp.BATCH_VEC_SQL, sp.BATCH_FT_SQL, sp.BATCH_KW_SQL))
+
+
+def test_empty_batch(fake_db):
+    assert sp.search_products_batch([]) == []
+    assert fake_db == []
+
+
+@pytest.fixture
+def client(monkeypatch):
+    for mod in ("fastapi", "httpx", "requests", "asyncpg"):
+        pytest.importorskip(mod)
+    from fastapi.testclient import TestClient
+
+    import api
+
+    seen = []
+    monkeypatch.setattr(api, "search_products_batch",
+                        lambda queries, k, fusion: seen.append((queries, k)) or [{"query": q} for q in queries])
+    c = TestClient(api.app)  # sem `with`: não roda o startup (banco)
+    c.seen = seen
+    return c
+
+
+def test_api_returns_results_in_order(client):
+    resp = client.post("/search/batch", json={"queries": ["b", "a", "c"], "k": 3})
+    assert resp.status_code == 200
+    assert resp.json() == {"results": [{"query": "b"}, {"query": "a"}, {"query": "c"}]}
+
+
+@pytest.mark.parametrize("body", [
+    {"queries": ["q"] * (sp.BATCH_MAX_QUERIES + 1)},
+    {"queries": ["q"], "k": sp.BATCH_MAX_K + 1},
+    {"queries": ["q"], "k": 0},
+])
+def test_api_rejects_oversized_batches(client, body):
+    resp = client.post("/search/batch", json=body)
+    assert resp.status_code == 422
+    assert client.seen == []  # rejeitado antes de qualquer busca
+
+
+def test_api_accepts_the_limits(client):
+    body = {"queries": ["q"] * sp.BATCH_MAX_QUERIES, "k": sp.BATCH_MAX_K}
+    assert client.post("/search/batch", json=body).status_code == 200
@@ -0,0 +1,131 @@
+# tests/test_search_stream.py
+"""Busca em streaming: IncrementalFusion contra fuse() e paginação por offset, sem banco."""
+import random
+
+import pytest
+
+for mod in ("numpy", "psycopg2", "dotenv"):
+    pytest.importorskip(mod)
+
+import fusion  # noqa: E402
+import search_stream  # noqa: E402
+from fusion import IncrementalFusion  # noqa: E402
+
+WEIGHTS = dict(alpha=0.50, beta=0.30, gamma=0.10, delta=0.10)
+SCORE_KEY = {"ft": "score_ft", "trgm": "score_trgm", "kw": "score_kw"}
+
+
+def catalog(seed=7, n=40):
+    """Canais ft/trgm/kw em ordem decrescente; kw com notas 1..3 (empates, como no banco)."""
+    rnd = random.Random(seed)
+    channels = {}
+    for ch, share in (("ft", 0.8), ("trgm", 0.9), ("kw", 0.4)):
+        skus = [f"{i:03d}" for i in range(n) if rnd.random() < share]
+        if ch == "kw":
+            scores = sorted((rnd.randint(1, 3) * 1000 for _ in skus), reverse=True)
+        else:
+            scores = sorted(rnd.sample(range(1, 100000), len(skus)), reverse=True)
+        rnd.shuffle(skus)
+        channels[ch] = [{"sku": s, "name": f"produto {s}", "codigo_barras": None, SCORE_KEY[ch]: v / 1000}
+                        for s, v in zip(skus, scores)]
+    return channels
+
+
+def fused(channels, strategy, require_kw):
+    resp = fusion.fuse([], channels["ft"], channels["trgm"], channels["kw"], 10 ** 6, **WEIGHTS,
+                       require_kw_when_available=require_kw, fusion=strategy)
+    return [r["sku"] for r in resp["results"]], resp["results"]
+
+
+def tied_order(r):
+    return -r["score"], r["sku"]
+
+
+@pytest.mark.parametrize("strategy", sorted(fusion.STREAMING_STRATEGIES))
+@pytest.mark.parametrize("require_kw", [False, True])
+@pytest.mark.parametrize("seed", range(20))
+def test_incremental_matches_fuse(strategy, require_kw, seed):
+    channels = catalog(seed)
+    step = 3
+    first = {ch: rows[:step] for ch, rows in channels.items()}
+    exhausted = {ch for ch, rows in channels.items() if len(rows) <= step}
+    merger = IncrementalFusion(first, exhausted, **WEIGHTS, require_kw_when_available=require_kw,
+                               fusion=strategy)
+    out = merger.ready()
+    pos = step
+    while merger.open:
+        for ch in sorted(merger.open):
+            rows = channels[ch][pos:pos + step]
+            merger.add(ch, rows, pos + step >= len(channels[ch]))
+        pos += step
+        out += merger.ready()
+    assert merger.done
+    _, expected = fused(channels, strategy, require_kw)
+    assert [r["score"] for r in out] == [r["score"] for r in expected]
+    # mesma lista; só a ordem entre notas finais empatadas pode variar (ver IncrementalFusion)
+    assert sorted(out, key=tied_order) == sorted(expected, key=tied_order)
+
+
+def test_incremental_emits_a_sure_winner_before_reading_everything():
+    def rows(key, *pairs):
+        return [{"sku": s, "name": s, "codigo_barras": None, key: v} for s, v in pairs]
+
+    first = {"ft": rows("score_ft", ("A", 1.0), ("B", 0.2)), "kw": rows("score_kw", ("A", 3.0), ("C", 0.5))}
+    merger = IncrementalFusion(first, set(), **WEIGHTS, require_kw_when_available=False)
+    assert [r["sku"] for r in merger.ready()] == ["A"]
+    assert merger.open == {"ft", "kw"}  # nada além do primeiro lote foi lido
+    assert merger.ready() == []  # cada resultado sai uma única vez
+
+
+def test_incremental_rejects_non_streaming_strategy():
+    with pytest.raises(ValueError):
+        IncrementalFusion({"ft": []}, {"ft"}, **WEIGHTS, require_kw_when_available=False, fusion="zscore")
+
+
+@pytest.fixture
+def streamed(monkeypatch):
+    """_stream com os canais em memória (plano "code": ft, trgm e kw, sem embeddings)."""
+    channels = catalog()
+    opened = []
+
+    def open_channel(channel, q, depth):
+        opened.append((channel, depth))
+        return search_stream._ListReader(channels[channel][:depth])
+
+    monkeypatch.setattr(search_stream, "answer_from_memory",
+                        lambda q: {"method": "code_not_found", "confidence": 0.0, "results": []})
+    monkeypatch.setattr(search_stream, "_open_channel", open_channel)
+    monkeypatch.setattr(search_stream, "STREAM_FETCH", 4)
+    monkeypatch.setattr(search_stream, "STREAM_DEPTH_FACTOR", 100)
+
+    def run(k, offset, require_kw=False):
+        return list(search_stream._stream("7899", k, offset, **WEIGHTS, require_kw_when_available=require_kw,
+                                          fusion="maxnorm"))
+
+    run.channels, run.opened = channels, opened
+    return run
+
+
+@pytest.mark.parametrize("require_kw", [False, True])
+def test_stream_pages_cover_the_fused_list(streamed, require_kw):
+    expected, _ = fused(streamed.channels, "maxnorm", require_kw)
+    got, ranks, offset, k = [], [], 0, 7
+    while offset is not None:
+        lines = streamed(k, offset, require_kw)
+        meta, results, end = lines[0], lines[1:-1], lines[-1]
+        assert meta["type"] == "meta" and meta["offset"] == offset and meta["plan"]["shape"] == "code"
+        assert end["type"] == "end" and end["returned"] == len(results) <= k
+        got += [r["sku"] for r in results]
+        ranks += [r["rank"] for r in results]
+        offset = end["next_offset"]
+    assert got == expected
+    assert ranks == list(range(1, len(expected) + 1))
+
+
+def test_stream_page_reads_only_what_it_needs(streamed, monkeypatch):
+    monkeypatch.setattr(search_stream, "STREAM_DEPTH_FACTOR", 2)
+    lines = streamed(3, 6)
+    assert [r["rank"] for r in lines[1:-1]] == [7, 8, 9]
+    assert lines[-1]["next_offset"] == 9
+    # plano "code" sobre 2 * (offset + k): full-text pela metade
+    assert dict(streamed.opened) == {"ft": 9, "trgm": 18, "kw": 18}
@@ -0,0 +1,87 @@
+# tests/test_vector_index.py
+"""Snapshot vetorial: busca, troca por export mais novo e descarte quando atrasado."""
+import json
+import os
+
+import numpy as np
+import pytest
+
+for mod in ("psycopg2", "dotenv"):
+    pytest.importorskip(mod)
+
+import catalog  # noqa: E402
+import vector_index  # noqa: E402
+
+
+class FakeWatcher:
+    def __init__(self, version):
+        self.version = version
+
+    def current(self):
+        return self.version
+
+    def on_change(self, fn):
+        pass
+
+
+def write_snapshot(path, version, vectors, ids):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.save(path / f"vectors-{version}.npy", vectors.astype(np.float16))
+    (path / f"ids-{version}.json").write_text(json.dumps(ids), encoding="utf-8")
+    meta = {"catalog_version": version, "count": len(ids), "dim": vectors.shape[1], "quant": "f16",
+            "vectors": f"vectors-{version}.npy", "scales": None, "ids": f"ids-{version}.json", "hnsw": None}
+    (path / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+    # mtime distinto mesmo em sistemas de arquivos com resolução grossa
+    os.utime(path / "meta.json", (version, version))
+
+
+IDS = [[1, "A", "a", ""], [1, "A", "a", ""], [2, "B", "b", ""], [3, "C", "c", ""]]
+VECS = [[1, 0, 0], [0.9, 0.1, 0], [0.7, 0.7, 0], [0, 0, 1]]
+
+
+def test_search_returns_best_chunk_per_product(tmp_path):
+    write_snapshot(tmp_path, 1, VECS, IDS)
+    rows = vector_index.VectorIndex(str(tmp_path)).search([1, 0, 0], 2)
+    assert [r["sku"] for r in rows] == ["A", "B"]
+    assert rows[0]["dist"] == pytest.approx(0.0, abs=1e-3)
+
+
+def test_manager_skips_stale_snapshot_and_reloads_new_export(tmp_path, monkeypatch):
+    watcher = FakeWatcher(1)
+    monkeypatch.setattr(catalog, "catalog_watcher", watcher)
+    write_snapshot(tmp_path, 1, VECS, IDS)
+    manager = vector_index.VectorIndexManager(str(tmp_path))
+    monkeypatch.setattr(manager, "_ensure_started", lambda: None)  # recargas só quando o teste pede
+    assert manager.start().catalog_version == 1
+    assert manager.get().catalog_version == 1
+
+    watcher.version = 3  # commits de uma carga em andamento
+    assert manager.get() is None
+
+    write_snapshot(tmp_path, 3, VECS, IDS)  # export ao final da carga
+    assert manager.get() is None  # get() não olha o disco
+    manager._maybe_reload()  # thread de verificação / listener da versão
+    assert manager.get().catalog_version == 3
+
+
+def test_get_does_not_load_on_the_request_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog, "catalog_watcher", FakeWatcher(1))
+    write_snapshot(tmp_path, 1, VECS, IDS)
+    manager = vector_index.VectorIndexManager(str(tmp_path))
+    started = []
+    monkeypatch.setattr(manager, "_ensure_started", lambda: started.append(True))
+    monkeypatch.setattr(vector_index, "VectorIndex", lambda path: pytest.fail("carga no caminho da requisição"))
+    assert manager.get() is None
+    assert started == [True]  # a carga fica com a thread
+
+
+def test_refresh_keeps_current_snapshot_options(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(vector_index, "export_snapshot",
+                        lambda out, quant, build_hnsw: calls.append((quant, build_hnsw)) or {})
+    assert vector_index.refresh_snapshot(None) is None
+    vector_index.refresh_snapshot(str(tmp_path))
+    (tmp_path / "meta.json").write_text(json.dumps({"quant": "int8", "hnsw": None}), encoding="utf-8")
+    vector_index.refresh_snapshot(str(tmp_path))
+    assert calls == [("f16", False), ("int8", False)]
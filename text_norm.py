@@ -0,0 +1,20 @@
+"""Normalização de texto compartilhada entre busca e ingestão."""
+from __future__ import annotations
+
+import re
+import unicodedata
+
+_WS_RE = re.compile(r"\s+")
+
+
+def strip_accents(s: str) -> str:
+    """Remove acentos/diacríticos (equivalente ao `unaccent` do Postgres para pt-BR)."""
+    decomposed = unicodedata.normalize("NFKD", s)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def normalize_query(s: str | None) -> str:
+    """casefold + sem acentos + espaços colapsados. Ex.: '  Tinta  BRANCA ' -> 'tinta branca'."""
+    if not s:
+        return ""
+    return _WS_RE.sub(" ", strip_accents(s).casefold()).strip()
@@ -0,0 +1,332 @@
+# vector_index.py
+"""Snapshot em disco dos embeddings de rag.product_chunks + busca top-k em processo.
+
+Evita a ida ao banco do canal vetorial: o catálogo (1536 dims, poucos chunks
+por produto) cabe em memória. O exportador grava, em VECTOR_INDEX_PATH:
+
+  meta.json                  versão do catálogo, dimensão, quantização, arquivos
+  vectors-<v>.npy            matriz [n, dim] normalizada (float16 ou int8)
+  scales-<v>.npy             escala por linha (apenas int8)
+  ids-<v>.json               [product_id, sku, name, codigo_barras] por linha
+  hnsw-<v>.bin               grafo HNSW opcional (requer `hnswlib`)
+
+As matrizes são abertas com mmap. A busca é exata (produto interno em blocos
+com NumPy); com o grafo HNSW presente e `hnswlib` instalado, usa-o para
+catálogos grandes. Se o snapshot estiver atrás da versão do catálogo
+(rag.catalog_version), `search_products` volta a usar rag.search_vec até um
+novo export.
+
+Cada commit do ingest_csv incrementa a versão, então o snapshot fica atrasado
+durante uma carga; ao final, o ingest_csv re-exporta (`refresh_snapshot`, com a
+mesma quantização/HNSW do snapshot atual) quando VECTOR_INDEX_PATH está
+definido, e os processos de busca trocam para ele ao notar o novo meta.json
+(verificado a cada VECTOR_INDEX_POLL segundos numa thread, fora da requisição).
+Sem isso (--no-export-index), rode o export abaixo após cada carga.
+
+Uso:
+  python vector_index.py export [--out DIR] [--quant f16|int8] [--hnsw]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH") or None  # ex.: .cache/vector_index
+VECTOR_INDEX_HNSW_MIN = int(os.getenv("VECTOR_INDEX_HNSW_MIN", "200000"))  # linhas p/ preferir HNSW
+EXACT_BLOCK_ROWS = 8192  # linhas convertidas para float32 por vez na busca exata
+OVERFETCH = 4  # linhas extras por k para deduplicar produtos com vários chunks
+VECTOR_INDEX_POLL = float(os.getenv("VECTOR_INDEX_POLL", "10"))  # s entre verificações do meta.json
+
+try:  # opcional
+    import hnswlib
+except ImportError:  # pragma: no cover
+    hnswlib = None
+
+EXPORT_SQL = """
+    SELECT c.product_id, p.sku, p.name, p.codigo_barras, c.embedding::text AS embedding
+    FROM rag.product_chunks c
+    JOIN rag.products p ON p.id = c.product_id
+    ORDER BY c.product_id, c.chunk_no;
+"""
+
+
+def _parse_vector(text: str) -> np.ndarray:
+    return np.array(text.strip("[]").split(","), dtype=np.float32)
+
+
+# ---------- exportação ----------
+def export_snapshot(out_dir: str, quant: str = "f16", build_hnsw: bool = False, fetch_size: int = 2000) -> dict:
+    """Exporta rag.product_chunks para `out_dir`; meta.json é trocado por último (atômico)."""
+    from db_pool import connect_db
+    from catalog import fetch_catalog_version
+
+    if quant not in ("f16", "int8"):
+        raise ValueError("quant deve ser 'f16' ou 'int8'")
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+
+    with connect_db() as con:
+        with con.cursor() as cur:
+            # versão lida antes dos dados: se mudar durante o export, o snapshot fica "atrasado"
+            version = fetch_catalog_version(cur)
+            cur.execute("SELECT count(*) FROM rag.product_chunks;")
+            n = int(cur.fetchone()[0])
+            cur.execute("SELECT vector_dims(embedding) FROM rag.product_chunks LIMIT 1;")
+            row = cur.fetchone()
+            dim = int(row[0]) if row else 0
+        if n == 0 or dim == 0:
+            raise RuntimeError("rag.product_chunks está vazia; nada a exportar")
+
+        tag = f"{version}-{os.getpid()}"
+        vec_file, scale_file, ids_file = f"vectors-{tag}.npy", f"scales-{tag}.npy", f"ids-{tag}.json"
+        dtype = np.float16 if quant == "f16" else np.int8
+        mat = np.lib.format.open_memmap(out / vec_file, mode="w+", dtype=dtype, shape=(n, dim))
+        scales = np.ones(n, dtype=np.float32)
+        ids: List[list] = []
+
+        # cursor nomeado (server-side): não traz a tabela inteira de uma vez
+        with con.cursor(name="vector_index_export") as cur:
+            cur.itersize = fetch_size
+            cur.execute(EXPORT_SQL)
+            i = 0
+            for product_id, sku, name, codigo_barras, emb in cur:
+                if i >= n:
+                    break  # linhas inseridas depois do count
+                v = _parse_vector(emb)
+                norm = float(np.linalg.norm(v)) or 1.0
+                v /= norm
+                if quant == "f16":
+                    mat[i] = v.astype(np.float16)
+                else:
+                    s = float(np.abs(v).max()) / 127.0 or 1.0
+                    mat[i] = np.round(v / s).astype(np.int8)
+                    scales[i] = s
+                ids.append([product_id, sku, name, codigo_barras])
+                i += 1
+        con.rollback()
+    n = len(ids)
+    mat.flush()
+    del mat
+
+    if quant == "int8":
+        np.save(out / scale_file, scales[:n])
+    (out / ids_file).write_text(json.dumps(ids, ensure_ascii=False), encoding="utf-8")
+
+    hnsw_file = None
+    if build_hnsw:
+        if hnswlib is None:
+            raise RuntimeError("--hnsw requer o pacote hnswlib")
+        data = np.load(out / vec_file, mmap_mode="r")[:n]
+        graph = hnswlib.Index(space="ip", dim=dim)
+        graph.init_index(max_elements=max(n, 1), ef_construction=200, M=16)
+        for start in range(0, n, EXACT_BLOCK_ROWS):
+            block = _dequantize(data[start:start + EXACT_BLOCK_ROWS], scales[start:start + EXACT_BLOCK_ROWS], quant)
+            graph.add_items(block, np.arange(start, start + len(block)))
+        hnsw_file = f"hnsw-{tag}.bin"
+        graph.save_index(str(out / hnsw_file))
+
+    meta = {
+        "catalog_version": version, "count": n, "dim": dim, "quant": quant,
+        "vectors": vec_file, "scales": scale_file if quant == "int8" else None,
+        "ids": ids_file, "hnsw": hnsw_file,
+    }
+    tmp = out / "meta.json.tmp"
+    tmp.write_text(json.dumps(meta), encoding="utf-8")
+    os.replace(tmp, out / "meta.json")
+    _remove_stale_files(out, meta)
+    return meta
+
+
+def refresh_snapshot(out_dir: Optional[str] = VECTOR_INDEX_PATH) -> Optional[dict]:
+    """Re-exporta com as opções do snapshot atual (f16 sem HNSW se ainda não houver um)."""
+    if not out_dir:
+        return None
+    try:
+        current = json.loads((Path(out_dir) / "meta.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        current = {}
+    return export_snapshot(out_dir, quant=current.get("quant", "f16"),
+                           build_hnsw=bool(current.get("hnsw")) and hnswlib is not None)
+
+
+def _remove_stale_files(out: Path, meta: dict):
+    keep = {meta["vectors"], meta["scales"], meta["ids"], meta["hnsw"], "meta.json"}
+    for p in out.iterdir():
+        if p.name not in keep and p.name.split("-")[0] in ("vectors", "scales", "ids", "hnsw"):
+            try:
+                p.unlink()
+            except OSError:
+                pass  # ainda mapeado por outro processo (Windows)
+
+
+def _dequantize(block: np.ndarray, scales: np.ndarray, quant: str) -> np.ndarray:
+    out = block.astype(np.float32)
+    if quant == "int8":
+        out *= scales[:, None]
+    return out
+
+
+# ---------- busca ----------
+class VectorIndex:
+    """Snapshot carregado (mmap) com busca top-k por similaridade de cosseno."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        self.catalog_version = int(self.meta["catalog_version"])
+        self.quant = self.meta["quant"]
+        self.vectors = np.load(self.path / self.meta["vectors"], mmap_mode="r")[: self.meta["count"]]
+        self.scales = (np.load(self.path / self.meta["scales"], mmap_mode="r")
+                       if self.meta.get("scales") else None)
+        self.ids = json.loads((self.path / self.meta["ids"]).read_text(encoding="utf-8"))
+        self.graph = None
+        if self.meta.get("hnsw") and hnswlib is not None and len(self.ids) >= VECTOR_INDEX_HNSW_MIN:
+            self.graph = hnswlib.Index(space="ip", dim=self.meta["dim"])
+            self.graph.load_index(str(self.path / self.meta["hnsw"]), max_elements=len(self.ids))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _exact(self, q: np.ndarray, n: int):
+        sims = np.empty(len(self.ids), dtype=np.float32)
+        for start in range(0, len(self.ids), EXACT_BLOCK_ROWS):
+            block = self.vectors[start:start + EXACT_BLOCK_ROWS].astype(np.float32)
+            s = block @ q
+            if self.scales is not None:
+                s *= self.scales[start:start + EXACT_BLOCK_ROWS]
+            sims[start:start + len(block)] = s
+        n = min(n, len(sims))
+        top = np.argpartition(-sims, n - 1)[:n]
+        top = top[np.argsort(-sims[top], kind="stable")]
+        return top, sims[top]
+
+    def _graph(self, q: np.ndarray, n: int):
+        self.graph.set_ef(max(2 * n, 64))
+        labels, dists = self.graph.knn_query(q, k=min(n, len(self.ids)))
+        return labels[0], 1.0 - dists[0]  # espaço 'ip' devolve 1 - <q, v>
+
+    def search(self, qvec, k: int) -> List[Dict[str, object]]:
+        """Top-k produtos (melhor chunk de cada) no formato de rag.search_vec."""
+        if not self.ids or k <= 0:
+            return []
+        q = np.asarray(qvec, dtype=np.float32)
+        q = q / (float(np.linalg.norm(q)) or 1.0)
+        idx, sims = (self._graph if self.graph is not None else self._exact)(q, k * OVERFETCH)
+        rows, seen = [], set()
+        for i, sim in zip(idx, sims):
+            product_id, sku, name, codigo_barras = self.ids[int(i)]
+            if product_id in seen:
+                continue
+            seen.add(product_id)
+            rows.append({"product_id": product_id, "sku": sku, "name": name,
+                         "codigo_barras": codigo_barras, "dist": 1.0 - float(sim)})
+            if len(rows) >= k:
+                break
+        return rows
+
+
+class VectorIndexManager:
+    """Mantém o snapshot atual e o troca quando um export mais novo aparece.
+
+    `get()` devolve None quando não há snapshot ou ele está atrás da versão do
+    catálogo; nesse caso o chamador usa rag.search_vec. `get()` só lê o que já
+    está em memória: a carga roda em `start()` (na API, via asyncio.to_thread
+    no startup), a cada mudança de versão do catálogo e numa thread que olha o
+    meta.json a cada `poll` segundos (o export termina depois do último commit
+    da carga, sem nova mudança de versão).
+    """
+
+    def __init__(self, path: Optional[str] = VECTOR_INDEX_PATH, poll: float = VECTOR_INDEX_POLL):
+        self.path = path
+        self.poll = poll
+        self._index: Optional[VectorIndex] = None
+        self._meta_mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _maybe_reload(self):
+        meta = Path(self.path) / "meta.json"
+        try:
+            mtime = meta.stat().st_mtime
+        except OSError:
+            return
+        if mtime == self._meta_mtime:
+            return
+        with self._lock:
+            if mtime == self._meta_mtime:
+                return
+            try:
+                self._index = VectorIndex(self.path)
+                self._meta_mtime = mtime
+            except (OSError, ValueError, KeyError):
+                pass  # export em andamento/corrompido: mantém o anterior
+
+    def _run(self):
+        while True:
+            self._maybe_reload()
+            time.sleep(self.poll)
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            from catalog import catalog_watcher
+
+            catalog_watcher.on_change(lambda old, new: self._maybe_reload())
+            self._thread = threading.Thread(target=self._run, name="vector-index-reload", daemon=True)
+            self._thread.start()
+
+    def start(self) -> Optional[VectorIndex]:
+        """Carrega o snapshot agora (bloqueante) e inicia a verificação periódica."""
+        if not self.path:
+            return None
+        self._maybe_reload()
+        self._ensure_started()
+        return self._index
+
+    def get(self) -> Optional[VectorIndex]:
+        if not self.path:
+            return None
+        from catalog import catalog_watcher
+
+        if self._thread is None:
+            self._ensure_started()  # sem start(): a thread faz a primeira carga
+        index = self._index
+        if index is None or index.catalog_version < catalog_watcher.current():
+            return None
+        return index
+
+    def stats(self) -> Dict[str, object]:
+        index = self._index
+        if index is None:
+            return {"enabled": bool(self.path), "loaded": False}
+        return {"enabled": True, "loaded": True, "count": len(index), "quant": index.quant,
+                "catalog_version": index.catalog_version, "hnsw": index.graph is not None}
+
+
+vector_index = VectorIndexManager()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ex = sub.add_parser("export", help="exporta rag.product_chunks para o snapshot")
+    ex.add_argument("--out", default=VECTOR_INDEX_PATH or ".cache/vector_index")
+    ex.add_argument("--quant", choices=["f16", "int8"], default="f16")
+    ex.add_argument("--hnsw", action="store_true", help="constrói também o grafo HNSW (hnswlib)")
+    args = ap.parse_args()
+    try:
+        meta = export_snapshot(args.out, quant=args.quant, build_hnsw=args.hnsw)
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    print(json.dumps(meta, indent=2))
@@ -6,6 +6,8 @@ from pydantic import BaseModel
 from dotenv import load_dotenv
 from pathlib import Path
 
+from metrics import timed
+
 # Carrega variáveis de ambiente (.env) do diretório deste arquivo (api/.env)
 _ENV_PATH = Path(__file__).parent / ".env"
 load_dotenv(dotenv_path=_ENV_PATH, override=False)
@@ -47,7 +49,8 @@ def get_product_id_by_sku(ref_id: str) -> Optional[int]:
     """Consulta a VTEX e retorna ProductId a partir do RefId (SKU)."""
     url = f"{VTEX_BASE_URL}/api/catalog/pvt/stockkeepingunit"
     try:
-        resp = requests.get(url, params={"RefId": ref_id}, headers=_vtex_headers(), timeout=15)
+        with timed("vtex_sku_lookup"):
+            resp = requests.get(url, params={"RefId": ref_id}, headers=_vtex_headers(), timeout=15)
         if resp.status_code == 404:
             return None
         resp.raise_for_status()
@@ -98,7 +101,8 @@ def simulate_shipping_for_skus(
     }
 
     try:
-        resp = requests.post(url, params=params, json=payload, headers=_vtex_headers(), timeout=20)
+        with timed("vtex_simulation"):
+            resp = requests.post(url, params=params, json=payload, headers=_vtex_headers(), timeout=20)
         resp.raise_for_status()
         data = resp.json()
 